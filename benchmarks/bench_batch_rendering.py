@@ -0,0 +1,42 @@
+"""Wall time of render_result_files on generated contrasts with one worker process and with several.
+
+Usage: python benchmarks/bench_batch_rendering.py [n_files] [n_genes] [max_workers]
+"""
+import sys
+import tempfile
+import time
+import pathlib as path
+
+import numpy as np
+import pandas as pd
+
+from group_4.visualizations import render_result_files
+
+
+def write_contrasts(directory: path.Path, n_files: int, n_genes: int, seed: int = 0) -> None:
+    """Writes n_files DESeq2-like result tables, about 3% of the genes with a padj below 0.1."""
+    rng = np.random.default_rng(seed)
+    for i in range(n_files):
+        pd.DataFrame({
+            'row': [f'Gene{j}' for j in range(n_genes)],
+            'log2FoldChange': rng.standard_normal(n_genes) * 2,
+            'padj': np.where(rng.random(n_genes) < 0.03, rng.random(n_genes) * 0.1, rng.random(n_genes) * 0.9 + 0.1),
+        }).to_parquet(directory / f'contrast_{i:02d}.parquet')
+
+
+def main(n_files: int = 8, n_genes: int = 20_000, max_workers: int = None) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = path.Path(tmp)
+        write_contrasts(directory, n_files, n_genes)
+        for workers in (1, max_workers):
+            start = time.perf_counter()
+            _, timings = render_result_files(directory, str(directory / 'figures' / '{stem}_{kind}.png'),
+                                             max_workers=workers)
+            seconds = time.perf_counter() - start
+            per_figure = np.mean([t for kinds in timings.values() for t in kinds.values()])
+            print(f'{n_files} files x {n_genes} genes  workers={workers or "all"}  {seconds:6.2f}s  '
+                  f'{per_figure:5.2f}s per figure')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""Load time of a DESeq2-like table as xlsx, csv, parquet and feather, full and projected to the cleaning columns.
+
+Usage: python benchmarks/bench_columnar_input.py [n_rows]
+"""
+import sys
+import tempfile
+import time
+import pathlib as path
+
+import numpy as np
+import pandas as pd
+
+from group_4.data_cleaning import DataCleaning, cache_xlsx_as_parquet
+
+
+def fixture_frame(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Unnamed: 0': np.arange(n_rows),
+        'row': [f'Gene{i}' for i in range(n_rows)],
+        'baseMean': rng.random(n_rows) * 1000,
+        'log2FoldChange': rng.standard_normal(n_rows),
+        'lfcSE': rng.random(n_rows),
+        'stat': rng.standard_normal(n_rows),
+        'pvalue': rng.random(n_rows),
+        'padj': rng.random(n_rows),
+    })
+
+
+def timed(label: str, function) -> None:
+    start = time.perf_counter()
+    function()
+    print(f'{label:<50} {time.perf_counter() - start:8.3f}s')
+
+
+def project(filename: path.Path) -> pd.DataFrame:
+    """Cleans the file lazily, so only row, log2FoldChange and padj are read."""
+    cleaner = DataCleaning(filename, lazy=True, memory_map=True)
+    for column in ('Unnamed: 0', 'baseMean', 'lfcSE', 'stat', 'pvalue'):
+        cleaner.remove_columns(column)
+    return cleaner.remove_na().filter_columns('padj', 0.1, 'smaller').collect()
+
+
+def main(n_rows: int = 50_000) -> None:
+    df = fixture_frame(n_rows)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = path.Path(directory)
+        df.to_excel(directory / 'results.xlsx', index=False)
+        df.to_csv(directory / 'results.csv', index=False)
+        df.to_feather(directory / 'results.feather')
+        timed('xlsx -> parquet conversion (first run)', lambda: cache_xlsx_as_parquet(directory / 'results.xlsx'))
+        timed('xlsx -> parquet conversion (cached)', lambda: cache_xlsx_as_parquet(directory / 'results.xlsx'))
+        for name in ('results.xlsx', 'results.csv', 'results.parquet', 'results.feather'):
+            timed(f'{name} eager', lambda: DataCleaning(directory / name))
+        for name in ('results.parquet', 'results.feather'):
+            timed(f'{name} lazy, projected, memory-mapped', lambda: project(directory / name))
+    print(f'{n_rows} rows')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,46 @@
+"""Benchmark of the local GMT enrichment engine over generated fixture libraries.
+
+Usage: python benchmarks/bench_gmt_enrichment.py [n_sets] [n_query_genes]
+"""
+import sys
+import tempfile
+import time
+import pathlib as path
+
+import numpy as np
+
+from group_4.data_processing import LocalGeneSetLibrary
+
+
+def write_fixture_gmt(directory: path.Path, n_sets: int, n_genes: int = 20_000, seed: int = 0) -> None:
+    """Writes two GMT libraries of random gene sets (15 to 500 genes each)."""
+    rng = np.random.default_rng(seed)
+    for library in ('Fixture_A_Mouse', 'Fixture_B_Mouse'):
+        with open(directory / f'{library}.gmt', 'w') as f:
+            for i in range(n_sets // 2):
+                genes = rng.choice(n_genes, size=rng.integers(15, 500), replace=False)
+                f.write(f'Term {i}\t\t' + '\t'.join(f'Gene{g}' for g in genes) + '\n')
+
+
+def main(n_sets: int = 10_000, n_query: int = 1_000) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        directory = path.Path(directory)
+        write_fixture_gmt(directory, n_sets)
+
+        start = time.perf_counter()
+        library = LocalGeneSetLibrary.from_directory(directory)
+        print(f'load + index {len(library)} sets: {time.perf_counter() - start:.3f}s')
+
+        query = [f'Gene{g}' for g in range(n_query)]
+        start = time.perf_counter()
+        library.pathways_for_genes(query)
+        print(f'lookup {n_query} genes: {time.perf_counter() - start:.3f}s')
+
+        start = time.perf_counter()
+        results = library.enrich(query)
+        print(f'enrich {n_query} genes against {len(library)} sets: {time.perf_counter() - start:.3f}s '
+              f'({len(results)} overlapping sets)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""Time and peak memory (RSS) of the eager, lazy, compact and streaming DataCleaning modes on a generated DESeq2-like csv.
+
+Every mode runs in a fresh interpreter, so the peak RSS of one does not hide the other.
+
+Usage: python benchmarks/bench_streaming_cleaning.py [n_rows] [chunksize]
+"""
+import subprocess
+import sys
+import tempfile
+import time
+import pathlib as path
+
+import numpy as np
+import pandas as pd
+
+from group_4.data_cleaning import DataCleaning
+
+
+def write_fixture_csv(csv_file: path.Path, n_rows: int, seed: int = 0) -> None:
+    """Writes a DESeq2-like result table with 10% NaN padj values, in blocks to bound memory."""
+    rng = np.random.default_rng(seed)
+    block = 1_000_000
+    for start in range(0, n_rows, block):
+        size = min(block, n_rows - start)
+        padj = rng.random(size)
+        padj[rng.random(size) < 0.1] = np.nan
+        pd.DataFrame({
+            'Unnamed: 0': np.arange(start, start + size),
+            'row': [f'Gene{i}' for i in range(start, start + size)],
+            'baseMean': rng.random(size) * 1000,
+            'log2FoldChange': rng.standard_normal(size),
+            'lfcSE': rng.random(size),
+            'stat': rng.standard_normal(size),
+            'pvalue': rng.random(size),
+            'padj': padj,
+        }).to_csv(csv_file, mode='a', header=start == 0, index=False)
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process in MB. VmHWM is used rather than ru_maxrss, which survives exec on Linux."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError('VmHWM is not available, the benchmark needs Linux')
+
+
+def run(csv_file: str, mode: str, chunksize: int) -> None:
+    """Cleans the file once and prints the time, the surviving rows and the peak RSS of this process."""
+    start = time.perf_counter()
+    if mode == 'streaming':
+        cleaner = DataCleaning(csv_file, chunksize=chunksize)
+        mode = f'streaming (chunksize={chunksize})'
+    else:
+        cleaner = DataCleaning(csv_file, lazy=mode == 'lazy', compact=mode == 'compact')
+    cleaned = cleaner.clean_data('padj', 0.05, 'smaller', 'Unnamed: 0')
+    elapsed = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+    print(f'{mode:<30} {elapsed:7.2f}s  {len(cleaned):>9} rows kept  peak RSS {peak_mb:8.1f} MB')
+    if cleaner.memory_report is not None:
+        print(f'{"":<30} data {cleaner.memory_report["before"] / 2 ** 20:.1f} MB -> '
+              f'{cleaner.memory_report["after"] / 2 ** 20:.1f} MB')
+
+
+def main(n_rows: int = 2_000_000, chunksize: int = 100_000) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file = path.Path(directory) / 'results.csv'
+        write_fixture_csv(csv_file, n_rows)
+        print(f'{n_rows} rows, {csv_file.stat().st_size / 2 ** 20:.0f} MB csv')
+        for mode in ('eager', 'lazy', 'compact', 'streaming'):
+            subprocess.run([sys.executable, __file__, 'run', str(csv_file), mode, str(chunksize)], check=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['run']:
+        run(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main(*map(int, sys.argv[1:]))
@@ -0,0 +1,64 @@
+"""Time of process_data_for_volcanoplot against the previous sort based implementation.
+
+Usage: python benchmarks/bench_volcano_preprocessing.py [n_rows ...]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from group_4.data_processing import process_data_for_volcanoplot
+
+THRESHOLDS = [0.01, 0.05, 0.1]
+LABELS = ['very significant', 'significant', 'trend', 'non-significant']
+
+
+def legacy_process(df: pd.DataFrame, n: int) -> tuple:
+    """The previous implementation: pd.cut, a Categorical rebuild and a full sort for the top N."""
+    df['-log10(p-value)'] = -np.log10(df['padj'])
+    df['significance'] = pd.cut(df['padj'], bins=[-float('inf')] + THRESHOLDS + [float('inf')],
+                                labels=LABELS, right=True)
+    df['significance'] = pd.Categorical(df['significance'], categories=LABELS, ordered=True)
+    ordered = df.sort_values('padj', ascending=True).reset_index(drop=True)
+    threshold = ordered.loc[n - 1, 'padj']
+    return df, ordered[ordered['padj'] <= threshold]
+
+
+def fixture_frame(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'row': [f'Gene{i}' for i in range(n_rows)],
+        'log2FoldChange': rng.standard_normal(n_rows),
+        # rounded, so the top N has ties
+        'padj': np.round(rng.random(n_rows) * 0.99, 7) + 1e-9,
+    })
+
+
+def best_of(function, repeats: int = 3) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(*sizes: int) -> None:
+    for n_rows in sizes or (1_000_000, 10_000_000):
+        df = fixture_frame(n_rows)
+        _, legacy_top = legacy_process(df.copy(), 10)
+        _, top = process_data_for_volcanoplot(df, 'padj', '-log10(p-value)', 'padj', 'significance',
+                                              THRESHOLDS, LABELS, 10, False)
+        assert sorted(top['row']) == sorted(legacy_top['row'])  # the legacy sort is not stable for ties
+        legacy = best_of(lambda: legacy_process(df.copy(deep=False), 10))
+        fused = best_of(lambda: process_data_for_volcanoplot(df, 'padj', '-log10(p-value)', 'padj', 'significance',
+                                                             THRESHOLDS, LABELS, 10, False))
+        in_place = best_of(lambda: process_data_for_volcanoplot(df, 'padj', '-log10(p-value)', 'padj', 'significance',
+                                                                THRESHOLDS, LABELS, 10, False, copy=False))
+        print(f'{n_rows:>10} rows  legacy {legacy:7.3f}s  fused {fused:7.3f}s  fused, copy=False {in_place:7.3f}s  '
+              f'({legacy / fused:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
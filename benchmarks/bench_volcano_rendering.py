@@ -0,0 +1,58 @@
+"""Render time and SVG size of a volcano plot with plot + color_by and with plot_density.
+
+Usage: python benchmarks/bench_volcano_rendering.py [n_genes ...]
+"""
+import io
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from group_4.data_processing import process_data_for_volcanoplot  # noqa: E402
+from group_4.visualizations import ScatterPlotToolkit  # noqa: E402
+
+LABELS = ['very significant', 'significant', 'trend', 'non-significant']
+
+
+def fixture_frame(n_genes: int, seed: int = 0) -> pd.DataFrame:
+    """About 3% of the genes have a padj below 0.1, as in a typical DESeq2 result."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'row': [f'Gene{i}' for i in range(n_genes)],
+        'log2FoldChange': rng.standard_normal(n_genes) * 2,
+        'padj': np.where(rng.random(n_genes) < 0.03, rng.random(n_genes) * 0.1, rng.random(n_genes) * 0.9 + 0.1),
+    })
+
+
+def render(df: pd.DataFrame, top_genes: pd.DataFrame, density: bool) -> tuple:
+    """Draws and saves the plot as SVG, returning the seconds and the size of the file."""
+    start = time.perf_counter()
+    q = ScatterPlotToolkit()
+    if density:
+        q.plot_density(df, 'log2FoldChange', '-log10(p-value)', df['significance'] != 'non-significant',
+                       color_by='significance', highlight=top_genes)
+    else:
+        q.plot(df, 'log2FoldChange', '-log10(p-value)')
+        q.color_by(df, 'log2FoldChange', '-log10(p-value)', color_by='significance')
+    svg = io.BytesIO()
+    q.fig.savefig(svg, format='svg')
+    plt.close(q.fig)
+    return time.perf_counter() - start, len(svg.getvalue())
+
+
+def main(*sizes: int) -> None:
+    for n_genes in sizes or (30_000, 60_000, 300_000):
+        df, top_genes = process_data_for_volcanoplot(fixture_frame(n_genes), 'padj', '-log10(p-value)', 'padj',
+                                                     'significance', [0.01, 0.05, 0.1], LABELS, 10, False)
+        for density in (False, True):
+            seconds, size = render(df, top_genes, density)
+            mode = 'plot_density' if density else 'plot + color_by'
+            print(f'{n_genes:>8} genes  {mode:<16} {seconds:7.2f}s  {size / 2 ** 20:7.1f} MB svg')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,3 +1,7 @@
-from .cleaning import DataCleaning
+from .cleaning import DataCleaning, compact_dtypes
+from .batch_cleaning import clean_files
+from .columnar import cache_xlsx_as_parquet, read_columnar
 from .create_test_dataframe import create_test_df
-from .filter_protein_coding_genes import filter_protein_coding_genes
\ No newline at end of file
+from .filter_protein_coding_genes import filter_protein_coding_genes
+from .gene_aliases import GeneAliasIndex
+from .gene_reference import GeneReferenceStore, ProteinCodingGenes
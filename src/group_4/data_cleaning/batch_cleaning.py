@@ -0,0 +1,128 @@
+import glob
+import time
+import pathlib as path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Union
+
+from .cleaning import DataCleaning
+from .columnar import COLUMNAR_SUFFIXES, parquet_cache_is_fresh
+
+RESULT_SUFFIXES = ('.csv', '.xlsx') + COLUMNAR_SUFFIXES
+OUTPUT_FORMATS = ('csv', 'parquet')
+
+
+def find_result_files(source) -> list:
+    """
+    Resolves the DESeq2 result files of a batch.
+
+    Args:
+        source: A directory (all the csv, xlsx, parquet, feather and arrow files in it),
+            a glob pattern such as 'results/*_deseq2.xlsx', or a list of files.
+
+    An xlsx file and its Parquet cache (see cache_xlsx_as_parquet) count as one file: the cache
+    is used while it is up to date, the xlsx file once it was modified.
+
+    Returns:
+        list: The files as pathlib paths, sorted by name for a directory or a pattern.
+
+    Raises:
+        ValueError: If no file is found, or two files have the same name without the suffix.
+    """
+    if isinstance(source, (str, path.Path)):
+        directory = path.Path(source)
+        if directory.is_dir():
+            files = sorted(f for f in directory.iterdir() if f.suffix in RESULT_SUFFIXES)
+        else:
+            files = sorted(path.Path(f) for f in glob.glob(str(source)))
+    else:
+        files = [path.Path(f) for f in source]
+    if not files:
+        raise ValueError(f'no result files found in {source}')
+    files = _pick_xlsx_or_cache(files)
+    stems = [f.stem for f in files]
+    duplicates = sorted({stem for stem in stems if stems.count(stem) > 1})
+    if duplicates:
+        raise ValueError(f'result files must have different names, found several {duplicates}')
+    return files
+
+
+def _pick_xlsx_or_cache(files: list) -> list:
+    """Keeps either an xlsx file or its Parquet cache, when both are in the list."""
+    listed = set(files)
+    dropped = set()
+    for f in files:
+        cache = f.with_suffix('.parquet')
+        if f.suffix == '.xlsx' and cache in listed:
+            fresh = parquet_cache_is_fresh(cache, f)
+            if fresh is not None:
+                dropped.add(f if fresh else cache)
+    return [f for f in files if f not in dropped]
+
+
+def clean_file(filename: path.Path, column_name_to_filter: str, threshold: float, condition: str,
+               column_name_to_remove: str, output_dir: Optional[path.Path] = None,
+               output_format: str = 'csv', **cleaner_kwargs) -> tuple:
+    """
+    Cleans one result file, in a worker process of clean_files.
+
+    Returns:
+        tuple: The file stem, the cleaned DataFrame (or the written file if output_dir is given)
+        and the seconds spent loading, cleaning and writing.
+    """
+    start = time.perf_counter()
+    cleaned = DataCleaning(filename, **cleaner_kwargs).clean_data(column_name_to_filter, threshold, condition,
+                                                                  column_name_to_remove)
+    if output_dir is not None:
+        output_file = output_dir / f'{filename.stem}.{output_format}'
+        if output_format == 'parquet':
+            cleaned.to_parquet(output_file)
+        else:
+            cleaned.to_csv(output_file)
+        cleaned = output_file
+    return filename.stem, cleaned, time.perf_counter() - start
+
+
+def clean_files(source, column_name_to_filter: str = 'padj', threshold: float = 0.1, condition: str = 'smaller',
+                column_name_to_remove: str = 'Unnamed: 0', output_dir: Optional[Union[path.Path, str]] = None,
+                output_format: str = 'csv', max_workers: Optional[int] = None, **cleaner_kwargs) -> tuple:
+    """
+    Cleans many DESeq2 result files (e.g. one per contrast) in parallel with the same settings.
+
+    Every file is loaded and cleaned by DataCleaning.clean_data in a process of a
+    ProcessPoolExecutor, so the CPU-bound parsing (xlsx in particular) scales with the cores.
+    With an output directory the workers write the cleaned tables themselves and only the
+    paths are sent back, instead of the frames.
+
+    Args:
+        source: A directory, a glob pattern or a list of result files (see find_result_files).
+        column_name_to_filter (str): Passed to clean_data. Defaults to 'padj'.
+        threshold (float): Passed to clean_data. Defaults to 0.1.
+        condition (str): Passed to clean_data. Defaults to 'smaller'.
+        column_name_to_remove (str): Passed to clean_data. Defaults to 'Unnamed: 0'.
+        output_dir (Union[pathlib.Path, str], optional): Where the cleaned tables are written,
+            as <file stem>.<output_format>. Defaults to None, the frames are returned.
+        output_format (str): 'csv' or 'parquet'. Defaults to 'csv'.
+        max_workers (int, optional): Number of processes. Defaults to the number of CPUs.
+        **cleaner_kwargs: Passed to DataCleaning (e.g. lazy=True or compact=True).
+
+    Returns:
+        tuple: A dict file stem -> cleaned DataFrame (or written file), and a dict
+        file stem -> seconds spent on the file, both in the order of the files.
+
+    Raises:
+        ValueError: If no file is found or the output format is not supported.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'output format must be one of {OUTPUT_FORMATS}')
+    files = find_result_files(source)
+    if output_dir is not None:
+        output_dir = path.Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(clean_file, filename, column_name_to_filter, threshold, condition,
+                                   column_name_to_remove, output_dir, output_format, **cleaner_kwargs)
+                   for filename in files]
+        results = [future.result() for future in futures]
+    cleaned = {stem: frame for stem, frame, _ in results}
+    timings = {stem: seconds for stem, _, seconds in results}
+    return cleaned, timings
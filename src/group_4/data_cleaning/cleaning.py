@@ -1,21 +1,194 @@
+import re
+import numpy as np
 import pandas as pd
 import pathlib as path
-from typing import Union
+from typing import Union, Optional
+
+from .columnar import COLUMNAR_SUFFIXES, read_columnar
+
+
+# Columns of a DESeq2 table that keep enough precision as float32. pvalue and padj stay float64,
+# their smallest values are far below the float32 range and -log10 needs them.
+COMPACT_FLOAT32_COLUMNS = ('baseMean', 'lfcSE', 'stat')
+COMPACT_STRING_COLUMNS = ('row',)
+
+
+def memory_usage(df: pd.DataFrame) -> int:
+    """The memory used by a DataFrame in bytes, including the contents of the string columns"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _fits_float32(values: pd.Series, rtol: float) -> bool:
+    """True if the values survive a float32 round trip within rtol (no overflow, no underflow to 0)"""
+    original = values.to_numpy(dtype=np.float64)
+    with np.errstate(over='ignore'):
+        converted = original.astype(np.float32).astype(np.float64)
+    return bool(np.allclose(converted, original, rtol=rtol, atol=0, equal_nan=True))
+
+
+def compact_dtypes(df: pd.DataFrame, float32_columns=COMPACT_FLOAT32_COLUMNS,
+                   string_columns=COMPACT_STRING_COLUMNS, rtol: float = 1e-6) -> pd.DataFrame:
+    """
+    Converts the columns of a DESeq2 table to more compact dtypes.
+
+    Parameters:
+    ----------
+    df : pd.DataFrame
+        The table, it is not modified.
+    float32_columns : iterable of str
+        Float columns downcast to float32, each only if all its values keep a relative precision of rtol.
+    string_columns : iterable of str
+        Columns of Python object strings converted to Arrow-backed strings (category without pyarrow).
+    rtol : float
+        The largest relative error the float32 conversion may introduce.
+
+    Returns:
+    -------
+    pd.DataFrame
+        A frame with the same values, the columns missing from df are ignored.
+    """
+    converted = {}
+    for column in float32_columns:
+        if column in df.columns and df[column].dtype == np.float64 and _fits_float32(df[column], rtol):
+            converted[column] = df[column].astype(np.float32)
+    for column in string_columns:
+        if column in df.columns and df[column].dtype == object:
+            try:  # missing values stay NaN, as in the object column
+                converted[column] = df[column].astype(pd.StringDtype('pyarrow', na_value=np.nan))
+            except (ImportError, TypeError):
+                converted[column] = df[column].astype('category')
+    if not converted:
+        return df
+    return df.assign(**converted)
+
+
+def referenced_columns(expression: str, columns: list) -> list:
+    """The columns of the given ones an eval expression refers to, by name or in backticks"""
+    names = set(re.findall(r'[A-Za-z_]\w*', expression)) | set(re.findall(r'`([^`]*)`', expression))
+    return [column for column in columns if column in names]
+
+
+def evaluate_filter(df: pd.DataFrame, expression: str, variables: Optional[dict] = None) -> np.ndarray:
+    """
+    Evaluates a filter expression on df in one vectorized pass with DataFrame.eval.
+    numexpr is used when it is installed, comparisons with NaN are False.
+
+    Returns:
+    -------
+    np.ndarray
+        The boolean mask of the rows the expression keeps.
+    """
+    mask = df.eval(expression, local_dict=variables or {})
+    return np.asarray(mask, dtype=bool)
+
+
+class CleaningPlan:
+    """
+    The cleaning steps recorded by a lazy or streaming DataCleaning, executed as one fused pass.
+
+    Instead of rebuilding the frame at every step, the plan combines all the row conditions
+    (NaN checks and filters) into one boolean mask, computed only on the columns they refer
+    to, and then selects the surviving rows and the remaining columns with a single copy.
+    The result is identical to running the steps one after the other.
+
+    Attributes:
+        steps (list): The recorded steps, as tuples whose first item is 'drop', 'dropna', 'filter' or 'query'.
+    """
+    def __init__(self):
+        self.steps = []
+
+    def __len__(self):
+        return len(self.steps)
+
+    def drop(self, column: str) -> None:
+        self.steps.append(('drop', column))
+
+    def dropna(self, columns: list) -> None:
+        self.steps.append(('dropna', list(columns)))
+
+    def filter(self, column: str, threshold: float, condition: str) -> None:
+        self.steps.append(('filter', column, threshold, condition))
+
+    def query(self, expression: str, variables: Optional[dict] = None) -> None:
+        self.steps.append(('query', expression, variables))
+
+    def output_columns(self, columns: list) -> list:
+        """The columns left of the given ones once the plan is executed"""
+        dropped = {step[1] for step in self.steps if step[0] == 'drop'}
+        return [column for column in columns if column not in dropped]
+
+    def needed_columns(self, columns: list) -> list:
+        """The columns of the given ones that have to be read to execute the plan"""
+        needed = set(self.output_columns(columns))
+        for step in self.steps:
+            if step[0] == 'dropna':
+                needed.update(step[1])
+            elif step[0] == 'filter':
+                needed.add(step[1])
+            elif step[0] == 'query':
+                needed.update(referenced_columns(step[1], columns))
+        return [column for column in columns if column in needed]
+
+    def mask(self, df: pd.DataFrame):
+        """The combined boolean mask of all the row conditions of the plan, None if there are none"""
+        mask = None
+        for step in self.steps:
+            if step[0] == 'dropna':
+                condition = df[step[1]].notna().all(axis=1).to_numpy()
+            elif step[0] == 'filter':
+                values = df[step[1]].to_numpy()
+                condition = values < step[2] if step[3] == 'smaller' else values > step[2]
+            elif step[0] == 'query':
+                condition = evaluate_filter(df, step[1], step[2])
+            else:
+                continue
+            mask = condition if mask is None else mask & condition
+        return mask
+
+    def execute(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Applies the whole plan to df in one pass, returning a new frame"""
+        columns = self.output_columns(list(df.columns))
+        mask = self.mask(df)
+        if mask is None:
+            return df[columns].copy()
+        return df.loc[mask, columns]
+
 
 class DataCleaning:
     """ 
     A class to perform various data cleaning operations on a pandas DataFrame.
     This class provides methods to load data from a file, remove rows with NaN values,
     filter rows based on conditions, remove specified columns, and apply all these 
-    cleaning steps in a sequence. The class is designed to handle files in both 
-    .csv and .xlsx formats.
+    cleaning steps in a sequence. The class is designed to handle files in the
+    .csv and .xlsx formats, and in the columnar .parquet, .feather and .arrow formats,
+    which load much faster (see cache_xlsx_as_parquet) and only decode the columns read.
+
+    In lazy mode nothing is loaded up front: the cleaning methods are recorded into a
+    CleaningPlan, and clean_data / collect read only the columns the plan needs and run it
+    as one fused pass (one combined mask and one final copy instead of a copy per step).
+    With a chunksize (csv files only) the class works in streaming mode, a lazy mode in which
+    the file is read chunk by chunk and the plan is applied to every chunk, keeping only the
+    surviving rows, so tables larger than memory can be cleaned.
+    The default eager mode applies every method immediately; all modes give the same result.
     
     Attributes:
     ----------
     filename : pathlib.Path or str
         The path to the file that contains the data.
     data : pd.DataFrame
-        The DataFrame containing the loaded data.
+        The DataFrame containing the loaded data (None in lazy mode until it is collected).
+    lazy : bool
+        True while the cleaning methods are recorded rather than applied.
+    chunksize : int or None
+        Number of rows read at a time in streaming mode, None otherwise.
+    plan : CleaningPlan
+        The steps recorded in lazy mode.
+    memory_map : bool
+        True if columnar files are memory-mapped rather than read into memory.
+    compact : bool
+        True if the loaded data is converted to compact dtypes (see compact_dtypes).
+    memory_report : dict or None
+        In compact mode, the memory of the data in bytes 'before' and 'after' the conversion.
 
      Methods:
     --------
@@ -26,6 +199,9 @@ class DataCleaning:
     filter_columns(self, column_name_to_filter: str, threshold: float, condition: str) -> 'DataCleaning':
         Filters the DataFrame rows based on whether the values in a specified column are 
         smaller or larger than a given threshold. The condition can be 'smaller' or 'larger'.
+
+    filter_query(self, expression: str, variables: dict = None) -> 'DataCleaning':
+        Filters the DataFrame rows with a boolean expression over several columns, evaluated in one pass.
         
     remove_columns(self, column_name_to_remove: str) -> 'DataCleaning':
         Removes the specified column from the DataFrame.
@@ -33,8 +209,12 @@ class DataCleaning:
     clean_data(self, column_name_to_filter: str, threshold: float, condition: str, column_name_to_remove: str) -> pd.DataFrame:
         Applies all the cleaning methods (removing columns, removing NaN values, filtering 
         based on a threshold) and returns the cleaned DataFrame with a reset index.
+
+    collect(self) -> pd.DataFrame:
+        In lazy mode, runs the recorded plan (chunk by chunk in streaming mode) and returns the surviving rows.
     """    
-    def __init__(self,filename : Union[path.Path,str]):
+    def __init__(self,filename : Union[path.Path,str], chunksize: Optional[int] = None, lazy: bool = False,
+                 memory_map: bool = False, compact: bool = False):
         """Check if the filename is path"""
         if isinstance(filename,path.Path):
             self.filename = filename
@@ -45,12 +225,58 @@ class DataCleaning:
         else:
           raise TypeError('file name must be either a string or a pathlib path')
         
-        self.data = self.load_data()    
+        self.chunksize = chunksize
+        self.memory_map = memory_map
+        self.compact = compact
+        self.memory_report = None
+        self.lazy = lazy or chunksize is not None
+        self.plan = CleaningPlan()
+        if chunksize is not None:
+            if not isinstance(chunksize, int) or chunksize <= 0:
+                raise ValueError('chunksize must be a positive integer')
+            if self.filename.suffix != '.csv':
+                raise ValueError('streaming is supported for csv files only')
+        if not self.lazy:
+            self.data = self._compact(self.load_data())
+        else:
+            """Lazy mode, only the header is read until the data is collected"""
+            self.data = None
+            self._header = self.load_data(nrows=0)
+            self._file_columns = list(self._header.columns)
+
+    def _compact(self, df: pd.DataFrame) -> pd.DataFrame:
+        """In compact mode, converts df to compact dtypes and records the memory before and after"""
+        if not self.compact:
+            return df
+        before = memory_usage(df)
+        df = compact_dtypes(df)
+        self.memory_report = {'before': before, 'after': memory_usage(df)}
+        return df
+
+    @property
+    def streaming(self) -> bool:
+        """True if the data is cleaned chunk by chunk"""
+        return self.chunksize is not None
+
+    @property
+    def columns(self) -> list:
+        """The columns of the data, in lazy mode the columns left after the recorded steps"""
+        if self.lazy:
+            return self.plan.output_columns(self._file_columns)
+        return list(self.data.columns)
     
-    def load_data(self) -> pd.DataFrame:
+    def load_data(self, columns: Optional[list] = None, nrows: Optional[int] = None) -> pd.DataFrame:
          """
          Load data from file to pandas data frame
-         This method checks if the file is either xslx or csv file.
+         This method checks if the file is either xslx, csv or a columnar (parquet, feather, arrow) file.
+
+         Parameters:
+        ----------
+        columns : list, optional
+            Only these columns are read. If None, all columns are read.
+        nrows : int, optional
+            Only the first nrows rows are read. If None, all rows are read.
+
          Returns:
         -------
         pd.DataFrame
@@ -58,14 +284,16 @@ class DataCleaning:
             
         Raises:
         -------
-        ValueError: If the file format is not supported (i.e., not .csv or .xlsx).
+        ValueError: If the file format is not supported (i.e., not .csv, .xlsx, .parquet, .feather or .arrow).
         """
          if self.filename.suffix=='.xlsx':
-            df = pd.read_excel(self.filename)
+            df = pd.read_excel(self.filename, usecols=columns, nrows=nrows)
          elif self.filename.suffix=='.csv':
-            df = pd.read_csv(self.filename)
+            df = pd.read_csv(self.filename, usecols=columns, nrows=nrows)
+         elif self.filename.suffix in COLUMNAR_SUFFIXES:
+            df = read_columnar(self.filename, columns=columns, nrows=nrows, memory_map=self.memory_map)
          else:
-            raise ValueError('file format not supported, xlsx or csv only')
+            raise ValueError('file format not supported, xlsx, csv, parquet, feather or arrow only')
          return df
     
     def remove_na(self, columns=None)-> 'DataCleaning':
@@ -83,8 +311,11 @@ class DataCleaning:
             Returns the DataCleaning object with the DataFrame updated to remove rows with NaN values.
         """ 
         if columns is None:
-            columns = self.data.columns
-        self.data = self.data.dropna(subset = columns)
+            columns = self.columns
+        if self.lazy:
+            self.plan.dropna(columns)
+        else:
+            self.data = self.data.dropna(subset = columns)
         return self
        
     def filter_columns(self,column_name_to_filter:str,threshold:float,condition:str)-> 'DataCleaning':
@@ -112,17 +343,59 @@ class DataCleaning:
         """
         condition = condition.lower()
         """First to check if column name exists"""
-        if column_name_to_filter not in self.data.columns:
+        if column_name_to_filter not in self.columns:
             raise ValueError('column name provided does not exist')
         """Filter based on condition input"""
-        if condition == 'smaller':
-         self.data = self.data[self.data[column_name_to_filter] < threshold]
-        elif condition == 'larger':
-            self.data = self.data[self.data[column_name_to_filter] > threshold]
-        else:
+        if condition not in ('smaller', 'larger'):
             raise ValueError('invalid condition, either larger of smaller')
+        if self.lazy:
+            self.plan.filter(column_name_to_filter, threshold, condition)
+        elif condition == 'smaller':
+            self.data = self.data[self.data[column_name_to_filter] < threshold]
+        else:
+            self.data = self.data[self.data[column_name_to_filter] > threshold]
         return self
     
+    def filter_query(self, expression: str, variables: Optional[dict] = None) -> 'DataCleaning':
+        """
+        Keeps the rows for which a boolean expression is true, evaluated in one vectorized pass
+        with DataFrame.eval (and numexpr when it is installed). Comparisons with NaN are false.
+        Examples of expressions:
+            'padj < 0.05 & abs(log2FoldChange) > 1 & baseMean > 10'
+            'padj <= 0.05'                       (inclusive bound)
+            '0.01 <= padj <= 0.05'               (between)
+            "row in ['Gene1', 'Gene2']"          (isin, 'not in' for the opposite)
+            '`Unnamed: 0` > 10'                  (backticks around names that are not identifiers)
+            'padj < @alpha'                      (with variables={'alpha': 0.05})
+
+        Parameters:
+        ----------
+        expression : str
+            The filter expression, over the names of the columns.
+        variables : dict, optional
+            Values of the @ variables of the expression.
+
+        Returns:
+        -------
+        self : DataCleaning
+            Returns the DataCleaning object with the DataFrame filtered by the expression.
+
+        Raises:
+        -------
+        ValueError: If the expression refers to a column that does not exist in the DataFrame.
+        """
+        """Check the expression on the (empty) header, so the lazy modes fail early as well"""
+        header = self.data.iloc[:0] if not self.lazy else self._header[self.columns]
+        try:
+            evaluate_filter(header, expression, variables)
+        except pd.errors.UndefinedVariableError as e:
+            raise ValueError(f'column name provided does not exist, {e}') from e
+        if self.lazy:
+            self.plan.query(expression, variables)
+        else:
+            self.data = self.data[evaluate_filter(self.data, expression, variables)]
+        return self
+
     def remove_columns(self,column_name_to_remove:str)-> 'DataCleaning':
         """
         Removes columns from dataframe
@@ -137,8 +410,10 @@ class DataCleaning:
         -------
         ValueError: If the column does not exist in the DataFrame.
         """
-        if column_name_to_remove not in self.data.columns:
+        if column_name_to_remove not in self.columns:
             raise ValueError('column name provided does not exist')
+        elif self.lazy:
+            self.plan.drop(column_name_to_remove)
         else:
             self.data = self.data.drop(columns=column_name_to_remove)
         return self
@@ -169,6 +444,41 @@ class DataCleaning:
         self.remove_columns(column_name_to_remove)
         self.remove_na()
         self.filter_columns(column_name_to_filter, threshold,condition)
+        if self.lazy:
+            self.collect()
         self.data = self.data.reset_index(drop=True)
         return self.data
-                
+
+    def iter_chunks(self, columns: Optional[list] = None):
+        """Reads the csv file chunksize rows at a time, yielding every chunk as a DataFrame"""
+        return pd.read_csv(self.filename, usecols=columns, chunksize=self.chunksize)
+
+    def collect(self) -> pd.DataFrame:
+        """
+        Runs the recorded plan as one fused pass and returns the surviving rows. Only the columns
+        the plan needs are read. In streaming mode the plan is applied to every chunk of the file,
+        so only one chunk and the rows kept so far are in memory at any time. The collected rows
+        become the data attribute, and the object continues in the eager mode.
+
+        Returns:
+        -------
+        pd.DataFrame
+            The cleaned data, with the row labels of the original file (as in the eager mode).
+
+        Raises:
+        -------
+        ValueError: If the object is not in lazy mode.
+        """
+        if not self.lazy:
+            raise ValueError('collect is only available in lazy mode, the data is already loaded')
+        needed = self.plan.needed_columns(self._file_columns)
+        if self.streaming:
+            kept = [self.plan.execute(chunk) for chunk in self.iter_chunks(needed)]
+            data = pd.concat(kept) if kept else pd.DataFrame(columns=self.columns)
+        else:
+            data = self.plan.execute(self.load_data(columns=needed))
+        self.data = self._compact(data)
+        self.plan = CleaningPlan()
+        self.lazy = False
+        self.chunksize = None
+        return self.data
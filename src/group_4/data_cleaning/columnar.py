@@ -0,0 +1,158 @@
+import os
+import pathlib as path
+from typing import Optional, Union
+
+import pandas as pd
+
+PARQUET_SUFFIXES = ('.parquet',)
+ARROW_SUFFIXES = ('.feather', '.arrow', '.ipc')  # Feather v2 is the Arrow IPC file format
+COLUMNAR_SUFFIXES = PARQUET_SUFFIXES + ARROW_SUFFIXES
+
+# Key of the Parquet metadata entry holding the mtime of the xlsx file a cache was converted from
+SOURCE_MTIME_KEY = b'group_4.source_mtime_ns'
+
+
+def _pyarrow():
+    """Imports pyarrow, which is only needed for the columnar formats."""
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('reading Parquet, Feather or Arrow IPC files requires pyarrow') from e
+    return pyarrow
+
+
+def read_columnar_schema(filename: Union[path.Path, str]):
+    """
+    Reads only the schema of a Parquet, Feather or Arrow IPC file.
+
+    Args:
+        filename (Union[pathlib.Path, str]): The file.
+
+    Returns:
+        pyarrow.Schema: The column names and types of the file.
+
+    Raises:
+        ValueError: If the file is not a Parquet, Feather or Arrow IPC file.
+    """
+    pa = _pyarrow()
+    filename = path.Path(filename)
+    if filename.suffix in PARQUET_SUFFIXES:
+        return pa.parquet.read_schema(filename)
+    if filename.suffix in ARROW_SUFFIXES:
+        with pa.memory_map(str(filename)) as source:
+            return pa.ipc.open_file(source).schema
+    raise ValueError('file format not supported, parquet, feather or arrow only')
+
+
+def read_columnar(filename: Union[path.Path, str], columns: Optional[list] = None,
+                  nrows: Optional[int] = None, memory_map: bool = False) -> pd.DataFrame:
+    """
+    Reads a Parquet, Feather or Arrow IPC file into a DataFrame.
+
+    Only the requested columns are decoded, so projecting a wide table costs little more than
+    the columns that are kept. With memory_map the file is mapped instead of read into a
+    buffer, so uncompressed Feather / Arrow IPC columns are used straight from the page cache.
+
+    Args:
+        filename (Union[pathlib.Path, str]): The file.
+        columns (list, optional): The columns to read. Defaults to all of them.
+        nrows (int, optional): Only the first nrows rows are returned. Defaults to all of them.
+        memory_map (bool): Memory-map the file. Defaults to False.
+
+    Returns:
+        pd.DataFrame: The data, with the columns in the requested order.
+
+    Raises:
+        ValueError: If the file is not a Parquet, Feather or Arrow IPC file.
+    """
+    pa = _pyarrow()
+    filename = path.Path(filename)
+    if nrows == 0:  # only the header is needed, e.g. to validate the column names
+        df = read_columnar_schema(filename).empty_table().to_pandas()
+        return df if columns is None else df[columns]
+    if filename.suffix in PARQUET_SUFFIXES:
+        table = pa.parquet.read_table(filename, columns=columns, memory_map=memory_map)
+    elif filename.suffix in ARROW_SUFFIXES:
+        table = pa.feather.read_table(filename, columns=columns, memory_map=memory_map)
+    else:
+        raise ValueError('file format not supported, parquet, feather or arrow only')
+    if nrows is not None:
+        table = table.slice(0, nrows)
+    return table.to_pandas()
+
+
+def parquet_cache_is_fresh(parquet_file: Union[path.Path, str], xlsx_file: Union[path.Path, str]) -> Optional[bool]:
+    """
+    Tells whether a Parquet file is the cache cache_xlsx_as_parquet wrote for the current content of an xlsx file.
+
+    Returns:
+        bool or None: True for an up to date cache, False for a stale one, None if the Parquet file
+        does not exist or is not a cache of cache_xlsx_as_parquet.
+    """
+    pa = _pyarrow()
+    parquet_file = path.Path(parquet_file)
+    if not parquet_file.exists():
+        return None
+    try:
+        metadata = read_columnar_schema(parquet_file).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if SOURCE_MTIME_KEY not in metadata:
+        return None
+    return metadata[SOURCE_MTIME_KEY] == str(path.Path(xlsx_file).stat().st_mtime_ns).encode()
+
+
+def _mixed_objects_as_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turns the values of the object columns that are not strings (e.g. gene names such as
+    March1 that Excel stored as dates) into strings, so Arrow can store every column with one type.
+    Missing values are kept.
+    """
+    for column in df.columns[df.dtypes == object]:
+        values = df[column]
+        mixed = values.notna() & ~values.map(lambda value: isinstance(value, str))
+        if mixed.any():
+            df[column] = values.where(~mixed, values[mixed].astype(str))
+    return df
+
+
+def cache_xlsx_as_parquet(xlsx_file: Union[path.Path, str],
+                          parquet_file: Optional[Union[path.Path, str]] = None) -> path.Path:
+    """
+    Converts an xlsx file to Parquet once and reuses the conversion while the xlsx file is unchanged.
+
+    Parsing xlsx with openpyxl is far slower than reading Parquet, so the first call writes the
+    sheet next to the source and later calls return the cached file straight away. The mtime of
+    the source is stored in the Parquet metadata; when the source is modified the cache is rebuilt.
+    Cells of a text column that Excel stored as another type (e.g. dates) are cached as strings.
+
+    Args:
+        xlsx_file (Union[pathlib.Path, str]): The xlsx file.
+        parquet_file (Union[pathlib.Path, str], optional): Where the cache is written.
+            Defaults to the xlsx file with a .parquet suffix.
+
+    Returns:
+        pathlib.Path: The Parquet file, to be given to DataCleaning.
+
+    Raises:
+        ValueError: If the source is not an xlsx file.
+        FileNotFoundError: If the source does not exist.
+    """
+    pa = _pyarrow()
+    xlsx_file = path.Path(xlsx_file)
+    if xlsx_file.suffix != '.xlsx':
+        raise ValueError('only xlsx files can be cached as parquet')
+    parquet_file = path.Path(parquet_file) if parquet_file is not None else xlsx_file.with_suffix('.parquet')
+    source_mtime = str(xlsx_file.stat().st_mtime_ns).encode()
+    if parquet_cache_is_fresh(parquet_file, xlsx_file):
+        return parquet_file
+    table = pa.Table.from_pandas(_mixed_objects_as_strings(pd.read_excel(xlsx_file)), preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), SOURCE_MTIME_KEY: source_mtime})
+    # Write to a temporary file first, so an interrupted conversion never leaves a truncated cache
+    tmp = parquet_file.with_suffix(parquet_file.suffix + f'.{os.getpid()}.tmp')
+    pa.parquet.write_table(table, tmp)
+    os.replace(tmp, parquet_file)
+    return parquet_file
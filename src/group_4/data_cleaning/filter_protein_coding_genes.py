@@ -1,52 +1,83 @@
-import pandas as pd
 import requests
-import os
 
+BIOMART_URL = "http://www.ensembl.org/biomart/martservice"
+# Seconds to wait for BioMart and the Ensembl REST API, a whole genome query takes a while
+REQUEST_TIMEOUT = 120
 
-def download_protein_coding_genes(output_file='protein_coding_genes.tsv'):
+
+def biomart_query(dataset='mmusculus_gene_ensembl'):
+    '''
+    The BioMart XML query of the names of the protein-coding genes of a dataset.
+    '''
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+    <!DOCTYPE Query>
+    <Query virtualSchemaName="default" formatter="TSV" header="0" uniqueRows="1" count="" datasetConfigVersion="0.6">
+        <Dataset name="{dataset}" interface="default">
+            <Filter name="biotype" value="protein_coding"/>
+            <Attribute name="external_gene_name"/>
+        </Dataset>
+    </Query>"""
+
+
+def parse_biomart_genes(text):
+    '''
+    Reads the gene names of a BioMart TSV answer (one name per line, without header).
+
+    output:
+        genes (list): The unique, non-empty gene names, in the order of the answer.
+    '''
+    return list(dict.fromkeys(line.strip() for line in text.splitlines() if line.strip()))
+
+
+def download_protein_coding_genes(output_file='protein_coding_genes.tsv', client=None, timeout=REQUEST_TIMEOUT):
     '''
     Downloads a list of protein-coding genes from Ensembl BioMart.
     
     input:
         output_file (str): The file path to save the downloaded gene list.
+        client (HttpClient, optional): retries, backoff and circuit breaking of the request, e.g.
+            data_processing.http_client.default_client. Without it the request is sent once with requests.
+        timeout (float): Timeout of the request in seconds. Defaults to REQUEST_TIMEOUT.
     
     output :
         protein_coding_genes (set): A set of protein-coding gene names.
-    '''
 
-    mart_url = "http://www.ensembl.org/biomart/martservice?query="
-    query = f"""<?xml version="1.0" encoding="UTF-8"?>
-    <!DOCTYPE Query>
-    <Query virtualSchemaName="default" formatter="TSV" header="0" uniqueRows="1" count="" datasetConfigVersion="0.6">
-        <Dataset name="mmusculus_gene_ensembl" interface="default">
-            <Filter name="biotype" value="protein_coding"/>
-            <Attribute name="external_gene_name"/>
-        </Dataset>
-    </Query>"""
+    Raises:
+        RequestFailed: If BioMart keeps failing after all the retries of the client.
+    '''
+    # the client is passed in, data_cleaning does not import data_processing, so it also works as a top-level package
+    client = client if client is not None else requests
 
-    response = requests.get(mart_url + query)
+    response = client.get(BIOMART_URL + "?query=" + biomart_query(), timeout=timeout)
     if response.status_code == 200:
         with open(output_file, 'w') as f:
             f.write(response.text)
-        protein_coding_genes_df = pd.read_csv(output_file, sep='\t', header=None)
-        protein_coding_genes = set(protein_coding_genes_df.iloc[:, 0].tolist())
+        # the answer is parsed directly, instead of reading the file back
+        protein_coding_genes = set(parse_biomart_genes(response.text))
         return protein_coding_genes
     else:
         response.raise_for_status()
 
-def filter_protein_coding_genes(df, protein_coding_genes):
+def filter_protein_coding_genes(df, protein_coding_genes, alias_index=None):
     '''
     Filter the DataFrame to include only genes that are known to translate into proteins.
     
     input:
         df (DataFrame): The input DataFrame containing genes.
-        protein_coding_genes (set): A set of protein-coding gene names.
+        protein_coding_genes (set or ProteinCodingGenes): The protein-coding gene names. A
+            ProteinCodingGenes (see GeneReferenceStore) tests the membership with its pre-built hash index.
+        alias_index (GeneAliasIndex, optional): Resolves synonyms, Ensembl IDs and case variants
+            of the genes to their official symbol before the test. The gene names are not changed.
     
     output:
         df_cleaned (DataFrame): Filtered DataFrame containing only protein-coding genes.
     '''
+    genes = df['row'] if alias_index is None else alias_index.normalize_genes(df['row'])
     # Filter DataFrame to include only genes found in the protein-coding gene set
-    df_cleaned = df[df['row'].isin(protein_coding_genes)]    
+    if hasattr(protein_coding_genes, 'contains'):
+        df_cleaned = df[protein_coding_genes.contains(genes)]
+    else:
+        df_cleaned = df[genes.isin(protein_coding_genes).to_numpy()]    
     
     return df_cleaned
 
@@ -0,0 +1,115 @@
+import pathlib as path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+# The version suffix of an Ensembl ID, e.g. ENSMUSG00000059552.7
+ENSEMBL_VERSION_PATTERN = r'^(ENS[A-Z]*G\d{11})\.\d+$'
+
+
+class GeneAliasIndex:
+    """
+    An in-memory index resolving gene symbols, their synonyms and Ensembl IDs to the official symbol.
+
+    The lookup is case-insensitive and ignores the version suffix of Ensembl IDs. Official symbols
+    take precedence over synonyms, and a synonym shared by several genes is left unresolved rather
+    than guessed. The keys are held in a pandas Index, so a whole column is resolved with one
+    vectorized hash lookup.
+
+    Attributes:
+        keys (pd.Index): The upper-cased symbols, synonyms and Ensembl IDs.
+        symbols (np.ndarray): The official symbol of every key.
+    """
+
+    def __init__(self, symbols, synonyms=None, ensembl_ids=None):
+        """
+        Args:
+            symbols (iterable of str): The official symbols.
+            synonyms (dict, optional): symbol -> iterable of synonyms. Defaults to None.
+            ensembl_ids (dict, optional): symbol -> Ensembl gene ID. Defaults to None.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        resolved = {symbol.upper(): symbol for symbol in symbols}
+        for symbol, gene_id in (ensembl_ids or {}).items():
+            resolved.setdefault(gene_id.upper(), symbol)
+        # synonyms never override a symbol or an ID, and ambiguous ones are dropped
+        candidates = {}
+        for symbol, aliases in (synonyms or {}).items():
+            for alias in aliases:
+                candidates.setdefault(alias.upper(), set()).add(symbol)
+        for alias, targets in candidates.items():
+            if alias not in resolved and len(targets) == 1:
+                resolved[alias] = targets.pop()
+        self.keys = pd.Index(list(resolved), dtype=object)
+        self.symbols = np.array(list(resolved.values()), dtype=object)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_file(cls, filename: Union[path.Path, str], symbol_col: str = 'symbol', synonym_col: str = 'synonyms',
+                  ensembl_col: str = 'ensembl_id', sep: str = '\t') -> 'GeneAliasIndex':
+        """
+        Builds the index from a local reference table, such as a BioMart export of the gene name,
+        synonym and gene stable ID attributes. A gene may span several rows (one per synonym),
+        and several synonyms in one cell are separated by '|' or ','.
+
+        Args:
+            filename (Union[pathlib.Path, str]): The reference table.
+            symbol_col (str): The column of the official symbols. Defaults to 'symbol'.
+            synonym_col (str): The column of the synonyms, optional in the file. Defaults to 'synonyms'.
+            ensembl_col (str): The column of the Ensembl IDs, optional in the file. Defaults to 'ensembl_id'.
+            sep (str): The field separator. Defaults to a tab.
+
+        Raises:
+            KeyError: If the symbol column does not exist in the file.
+        """
+        table = pd.read_csv(filename, sep=sep, dtype=str, keep_default_na=False)
+        if symbol_col not in table.columns:
+            raise KeyError(f"The column '{symbol_col}' does not exist in {filename}.")
+        table = table[table[symbol_col] != '']
+        synonyms, ensembl_ids = {}, {}
+        if synonym_col in table.columns:
+            split = table[synonym_col].str.split(r'[|,]', regex=True).explode().str.strip()
+            split = split[split != '']
+            for symbol, alias in zip(table.loc[split.index, symbol_col], split):
+                synonyms.setdefault(symbol, []).append(alias)
+        if ensembl_col in table.columns:
+            with_id = table[table[ensembl_col] != '']
+            ensembl_ids = dict(zip(with_id[symbol_col], with_id[ensembl_col]))
+        return cls(table[symbol_col], synonyms, ensembl_ids)
+
+    def resolve(self, genes) -> np.ndarray:
+        """
+        Returns the official symbol of every gene, None for the genes the index does not know.
+        """
+        if len(self.keys) == 0:
+            return np.full(len(genes), None, dtype=object)
+        keys = pd.Series(genes, dtype=object).str.upper().str.replace(ENSEMBL_VERSION_PATTERN, r'\1', regex=True)
+        positions = self.keys.get_indexer(keys.to_numpy(dtype=object))
+        return np.where(positions >= 0, self.symbols[positions], None)
+
+    def normalize_genes(self, series: pd.Series) -> pd.Series:
+        """
+        Replaces the synonyms, Ensembl IDs and case variants of a gene column with the official
+        symbols. Unknown genes and missing values are kept as they are.
+
+        Args:
+            series (pd.Series): The gene names, e.g. the 'row' column of a DESeq2 table.
+
+        Returns:
+            pd.Series: The normalized names, with the index and name of the input. A categorical
+                column (see compact_dtypes) stays categorical, with the official symbols as categories.
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # the categories are resolved once, the aliases of a symbol then share its category
+            categories = self.normalize_genes(pd.Series(series.cat.categories, dtype=object)).to_numpy(dtype=object)
+            codes = series.cat.codes.to_numpy()
+            values = np.where(codes >= 0, categories[codes], None)
+            return pd.Series(pd.Categorical(values), index=series.index, name=series.name)
+        resolved = self.resolve(series)
+        known = pd.notna(resolved)
+        values = series.to_numpy(dtype=object, copy=True)
+        values[known] = resolved[known]
+        return pd.Series(values, index=series.index, name=series.name, dtype=series.dtype)
@@ -0,0 +1,202 @@
+import re
+import os
+import threading
+import pathlib as path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import requests
+
+from .filter_protein_coding_genes import BIOMART_URL, REQUEST_TIMEOUT, biomart_query, parse_biomart_genes
+
+ENSEMBL_REST_URL = "https://rest.ensembl.org"
+BIOMART_DATASETS = {
+    'mouse': 'mmusculus_gene_ensembl',
+    'human': 'hsapiens_gene_ensembl',
+    'rat': 'rnorvegicus_gene_ensembl',
+    'zebrafish': 'drerio_gene_ensembl',
+}
+# Bumped whenever the layout of the cache files changes, older files are then ignored
+CACHE_FORMAT_VERSION = 1
+
+
+class ProteinCodingGenes:
+    """
+    The protein-coding genes of one organism and Ensembl release, with a pre-built hash index.
+
+    The names are held in a pandas Index whose hash table is built once, so testing the genes
+    of a whole DataFrame column is one vectorized lookup instead of building a set every time.
+
+    Attributes:
+        organism (str): The organism (a key of BIOMART_DATASETS).
+        release (int): The Ensembl release the names come from.
+        index (pd.Index): The unique gene names.
+    """
+
+    def __init__(self, genes, organism: str, release: int):
+        self.organism = organism
+        self.release = release
+        self.index = pd.Index(pd.unique(np.asarray(genes, dtype=object)), dtype=object)
+        self.index.get_indexer(self.index[:1])  # builds the hash table up front
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, gene):
+        return gene in self.index
+
+    def __repr__(self):
+        return f"ProteinCodingGenes(organism={self.organism!r}, release={self.release}, genes={len(self)})"
+
+    def contains(self, genes) -> np.ndarray:
+        """Returns a boolean array telling for every gene whether it is protein-coding."""
+        return self.index.get_indexer(np.asarray(genes, dtype=object)) >= 0
+
+    def filter(self, df: pd.DataFrame, gene_col: str = 'row') -> pd.DataFrame:
+        """Returns the rows of df whose gene is protein-coding (see filter_protein_coding_genes)."""
+        return df[self.contains(df[gene_col])]
+
+
+class GeneReferenceStore:
+    """
+    A local store of the protein-coding genes of Ensembl, keyed by organism and Ensembl release.
+
+    The BioMart answer is downloaded once per organism and release and kept as a NumPy array
+    file, which loads in milliseconds without any parsing. Loaded gene sets are also memoized,
+    so every later call returns the same ProteinCodingGenes object.
+
+    Attributes:
+        directory (pathlib.Path): The directory of the cache files.
+        client (HttpClient or the requests module): What BioMart and the Ensembl REST API are queried with.
+        timeout (float): Timeout of every request in seconds.
+    """
+
+    def __init__(self, directory: Union[path.Path, str] = 'gene_reference', client=None,
+                 mart_url: str = BIOMART_URL, rest_url: str = ENSEMBL_REST_URL, mart_release: Optional[int] = None,
+                 timeout: float = REQUEST_TIMEOUT):
+        """
+        Args:
+            directory (Union[pathlib.Path, str]): The cache directory. Defaults to 'gene_reference'.
+            client (HttpClient, optional): Retries, backoff and circuit breaking of the requests, e.g.
+                data_processing.http_client.default_client. Without it every request is sent once with requests.
+            mart_url (str): The BioMart service. Defaults to the current Ensembl BioMart.
+            rest_url (str): The Ensembl REST API, used to find the current release.
+            mart_release (int, optional): The release mart_url serves, e.g. 102 for the
+                'https://nov2020.archive.ensembl.org/biomart/martservice' archive. Defaults to the current release.
+            timeout (float): Timeout of every request in seconds. Defaults to REQUEST_TIMEOUT.
+        """
+        self.directory = path.Path(directory)
+        self.client = client if client is not None else requests
+        self.mart_url = mart_url
+        self.rest_url = rest_url
+        self.mart_release = mart_release
+        self.timeout = timeout
+        self._current_release = None
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def cache_path(self, organism: str, release: int) -> path.Path:
+        """The cache file of an organism and release."""
+        return self.directory / f'protein_coding_{organism}_e{release}.v{CACHE_FORMAT_VERSION}.npy'
+
+    def cached_releases(self, organism: str) -> list:
+        """The releases cached for an organism, oldest first."""
+        pattern = re.compile(rf'protein_coding_{re.escape(organism)}_e(\d+)\.v{CACHE_FORMAT_VERSION}\.npy')
+        if not self.directory.is_dir():
+            return []
+        matches = (pattern.fullmatch(f.name) for f in self.directory.iterdir())
+        return sorted(int(match.group(1)) for match in matches if match)
+
+    def current_release(self) -> int:
+        """
+        Asks the Ensembl REST API for the current release, once per store.
+
+        Raises:
+            RequestFailed: If the API keeps failing after all the retries.
+        """
+        if self._current_release is None:
+            response = self.client.get(f'{self.rest_url}/info/data/', headers={'Content-Type': 'application/json'},
+                                       timeout=self.timeout)
+            response.raise_for_status()
+            self._current_release = max(response.json()['releases'])
+        return self._current_release
+
+    def _store(self, genes, organism: str, release: int) -> ProteinCodingGenes:
+        """Writes the cache file of a gene list and returns it as a ProteinCodingGenes."""
+        protein_coding_genes = ProteinCodingGenes(genes, organism, release)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        target = self.cache_path(organism, release)
+        # Write to a temporary file first, so a concurrent reader never sees a half written cache
+        tmp = target.with_name(target.name + f'.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, protein_coding_genes.index.to_numpy(dtype=str), allow_pickle=False)
+        os.replace(tmp, target)
+        return protein_coding_genes
+
+    def import_tsv(self, tsv_file: Union[path.Path, str], organism: str, release: int) -> ProteinCodingGenes:
+        """
+        Adds a BioMart TSV answer saved earlier (e.g. by download_protein_coding_genes) to the store.
+
+        Returns:
+            ProteinCodingGenes: The imported genes.
+        """
+        genes = parse_biomart_genes(path.Path(tsv_file).read_text())
+        protein_coding_genes = self._store(genes, organism, release)
+        with self._lock:
+            self._loaded[(organism, release)] = protein_coding_genes
+        return protein_coding_genes
+
+    def fetch(self, organism: str, release: int) -> ProteinCodingGenes:
+        """
+        Downloads the protein-coding genes of an organism from BioMart and caches them under release.
+        The configured BioMart serves one release, so release must be the release it serves
+        (mart_release, or the current release for the default BioMart).
+
+        Raises:
+            ValueError: If there is no BioMart dataset for the organism, or the BioMart does not
+                serve the release.
+            RequestFailed: If BioMart keeps failing after all the retries.
+        """
+        if organism not in BIOMART_DATASETS:
+            raise ValueError(f"Unknown organism '{organism}', choose one of {sorted(BIOMART_DATASETS)}.")
+        served_release = self.mart_release if self.mart_release is not None else self.current_release()
+        if release != served_release:
+            raise ValueError(f"{self.mart_url} serves Ensembl release {served_release}, not {release}. "
+                             "Pass the archive BioMart of the release as mart_url with its mart_release.")
+        response = self.client.get(self.mart_url, params={'query': biomart_query(BIOMART_DATASETS[organism])},
+                                   timeout=self.timeout)
+        response.raise_for_status()
+        genes = parse_biomart_genes(response.text)
+        if not genes:
+            raise ValueError(f'BioMart returned no protein-coding genes for {organism}.')
+        return self._store(genes, organism, release)
+
+    def protein_coding_genes(self, organism: str = 'mouse', release: Optional[int] = None) -> ProteinCodingGenes:
+        """
+        Returns the protein-coding genes of an organism, from memory, the cache or BioMart.
+
+        Args:
+            organism (str): The organism. Defaults to 'mouse'.
+            release (int, optional): The Ensembl release. Defaults to the newest cached release,
+                or the current release when nothing is cached.
+
+        Returns:
+            ProteinCodingGenes: The genes with their hash index.
+
+        Raises:
+            ValueError: If the release is neither cached nor served by the BioMart (see fetch).
+        """
+        if release is None:
+            cached = self.cached_releases(organism)
+            release = cached[-1] if cached else self.current_release()
+        key = (organism, release)
+        with self._lock:
+            if key not in self._loaded:
+                cache_file = self.cache_path(organism, release)
+                if cache_file.exists():
+                    genes = np.load(cache_file, allow_pickle=False)
+                    self._loaded[key] = ProteinCodingGenes(genes, organism, release)
+                else:
+                    self._loaded[key] = self.fetch(organism, release)
+            return self._loaded[key]
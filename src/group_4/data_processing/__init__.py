@@ -1,3 +1,11 @@
-from .gseapy_processing import enrich_gene
-from .scraping import scrape_for_pathway
+from .http_client import HttpClient, CircuitBreaker, RequestFailed, AnnotationFailure
+from .gseapy_processing import enrich_gene, enrich_genes
+from .enrichment_cache import EnrichmentCache
+from .library_catalog import LibraryCatalog
+from .gmt_enrichment import LocalGeneSetLibrary, read_gmt
+from .scraping import scrape_for_pathway, scrape_for_pathways, scrape_for_pathways_async
+from .pathway_sources import (PathwaySource, ReactomeHTMLSource, ReactomeContentServiceSource,
+                              FallbackPathwaySource, ResponseCache, get_pathway_source)
+from .annotation_pipeline import (AnnotationPipeline, AnnotationCheckpoint, Annotator, FunctionAnnotator, EnrichrAnnotator,
+                                  PathwaySourceAnnotator)
 from .visualization_pre_processing import process_data_for_volcanoplot
@@ -0,0 +1,281 @@
+import json
+import threading
+import pathlib as path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Union
+
+import pandas as pd
+
+from .gseapy_processing import enrich_genes
+from .http_client import AnnotationFailure
+
+
+class Annotator:
+    """
+    Base class of the annotation backends of an AnnotationPipeline.
+
+    An annotator fills one column of the DataFrame. It receives the genes in batches of
+    `batch_size` and returns one value per gene.
+
+    Attributes:
+        column (str): The name of the column the annotations are written to.
+        batch_size (int): Number of genes given to annotate_batch at once.
+    """
+    column = 'annotation'
+    batch_size = 1
+
+    def annotate_batch(self, genes: list) -> list:
+        """Returns the annotation of each gene of the batch, in the same order."""
+        raise NotImplementedError
+
+    def fingerprint(self) -> dict:
+        """
+        Describes what the annotations depend on (the backend and its configuration), so a
+        checkpoint written with another configuration is not reused.
+        """
+        return {'annotator': type(self).__name__, 'column': self.column}
+
+
+class FunctionAnnotator(Annotator):
+    """Annotates every gene with a function of one gene (e.g. enrich_gene or scrape_for_pathway)."""
+
+    def __init__(self, column: str, function, batch_size: int = 1):
+        self.column = column
+        self.function = function
+        self.batch_size = batch_size
+
+    def annotate_batch(self, genes: list) -> list:
+        return [self.function(gene) for gene in genes]
+
+    def fingerprint(self) -> dict:
+        function = getattr(self.function, '__qualname__', repr(self.function))
+        return {**super().fingerprint(), 'function': f"{getattr(self.function, '__module__', '')}.{function}"}
+
+
+class EnrichrAnnotator(Annotator):
+    """Annotates genes with their Enrichr terms, one Enrichr submission per batch (see enrich_genes)."""
+
+    def __init__(self, column: str = 'complex related pathway', gene_sets=None, cache=None, batch_size: int = 500):
+        self.column = column
+        self.gene_sets = gene_sets
+        self.cache = cache
+        self.batch_size = batch_size
+
+    def annotate_batch(self, genes: list) -> list:
+        return enrich_genes(genes, batch_size=len(genes), gene_sets=self.gene_sets, cache=self.cache, max_workers=1)
+
+    def fingerprint(self) -> dict:
+        gene_sets = sorted(self.gene_sets) if self.gene_sets is not None else None
+        return {**super().fingerprint(), 'organism': 'Mouse', 'gene_sets': gene_sets}
+
+
+class PathwaySourceAnnotator(Annotator):
+    """Annotates genes with the pathways found by a PathwaySource backend."""
+
+    def __init__(self, source, column: str = 'related pathway'):
+        self.column = column
+        self.source = source
+
+    def annotate_batch(self, genes: list) -> list:
+        return [self.source.pathways(gene) for gene in genes]
+
+    def fingerprint(self) -> dict:
+        return {**super().fingerprint(), 'source': self.source.fingerprint()}
+
+
+class AnnotationCheckpoint:
+    """
+    An append-only JSONL file of completed annotation batches, so an interrupted run can be resumed.
+
+    The first line holds the fingerprint of the annotators that wrote the file (see open), every
+    other line the column, genes and annotations of one finished batch. A line cut short by a
+    crash is dropped when the file is loaded, so at most the batches in flight are lost.
+
+    Attributes:
+        path (pathlib.Path): The JSONL file.
+    """
+
+    def __init__(self, filename: Union[path.Path, str]):
+        self.path = path.Path(filename)
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        """
+        Reads the completed annotations. A partially written last line is cut off the file,
+        so the next batches are appended on a line of their own.
+
+        Returns:
+            dict: column name -> {gene -> annotation}, empty if there is no checkpoint yet.
+        """
+        done = {}
+        if not self.path.exists():
+            return done
+        with self._lock:
+            content = self.path.read_text()
+            if content and not content.endswith('\n'):
+                content = content[:content.rfind('\n') + 1]
+                self.path.write_text(content)
+        for line in content.splitlines():
+            record = json.loads(line)
+            if 'column' in record:
+                done.setdefault(record['column'], {}).update(zip(record['genes'], record['values']))
+        return done
+
+    def fingerprint(self):
+        """The fingerprint written on the first line, None if there is none."""
+        try:
+            with open(self.path) as f:
+                first_line = f.readline()
+            return json.loads(first_line).get('fingerprint')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def open(self, fingerprint) -> dict:
+        """
+        Starts or resumes the run of annotators with a fingerprint. A checkpoint written by
+        another configuration (e.g. other gene sets or another pathway source) is discarded.
+
+        Returns:
+            dict: The completed annotations of the resumed run (see load), empty for a new run.
+        """
+        if self.path.exists() and self.fingerprint() != fingerprint:
+            self.clear()
+        if not self.path.exists():
+            with self._lock, open(self.path, 'w') as f:
+                f.write(json.dumps({'fingerprint': fingerprint}) + '\n')
+            return {}
+        return self.load()
+
+    def append(self, column: str, genes: list, values: list) -> None:
+        """Appends a finished batch and flushes it to disk."""
+        line = json.dumps({'column': column, 'genes': list(genes), 'values': list(values)})
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+            f.flush()
+
+    def clear(self) -> None:
+        """Removes the checkpoint file, so the next run starts over."""
+        if self.path.exists():
+            self.path.unlink()
+
+
+class AnnotationPipeline:
+    """
+    Runs several annotation backends over the genes of a DataFrame in one pass.
+
+    The genes are deduplicated before dispatch, and the batches of all the backends are
+    submitted to one shared thread pool, so the backends run concurrently with a bounded
+    total number of in-flight requests instead of one stage after the other.
+    With a checkpoint, every finished batch is appended to it, and genes already in it are
+    not annotated again when the run is restarted with the same annotators. The checkpoint is
+    removed once a run finishes without failures, so it never outlives the caches of the backends.
+
+    With an alias index (see GeneAliasIndex), synonyms, Ensembl IDs and case variants are
+    resolved to the official symbol before the deduplication, so the variants of a gene share
+    one lookup and its cache and checkpoint entries.
+
+    A backend that fails for a gene (it raises, e.g. RequestFailed or a parsing error, or
+    returns an AnnotationFailure) leaves the annotation empty instead of writing an error
+    message as data. An exception fails only the batch it was raised for, so the other batches
+    still finish and are checkpointed. The failures are collected in `failures` and are not
+    checkpointed, so a later run retries only them.
+
+    Attributes:
+        annotators (list): The Annotator backends, one column each.
+        max_workers (int): Size of the shared thread pool.
+        checkpoint (AnnotationCheckpoint or None): Where finished batches are recorded.
+        alias_index (GeneAliasIndex or None): Normalizes the gene names before the lookups.
+        failures (list): The AnnotationFailure of every gene a backend failed on in the last run.
+    """
+
+    def __init__(self, annotators: list, max_workers: int = 8,
+                 checkpoint: Optional[Union[AnnotationCheckpoint, path.Path, str]] = None, alias_index=None):
+        """
+        Raises:
+            ValueError: If there are no annotators, or two of them write to the same column.
+        """
+        if not annotators:
+            raise ValueError("At least one annotator is required.")
+        columns = [annotator.column for annotator in annotators]
+        if len(set(columns)) != len(columns):
+            raise ValueError("Every annotator must write to a different column.")
+        self.annotators = annotators
+        self.max_workers = max_workers
+        if checkpoint is not None and not isinstance(checkpoint, AnnotationCheckpoint):
+            checkpoint = AnnotationCheckpoint(checkpoint)
+        self.checkpoint = checkpoint
+        self.alias_index = alias_index
+        self.failures = []
+
+    def annotate(self, genes) -> dict:
+        """
+        Annotates unique genes with every backend, skipping genes found in the checkpoint.
+
+        Args:
+            genes (iterable of strings): The genes, duplicates are annotated once.
+
+        Returns:
+            dict: column name -> {gene -> annotation}, None for the genes the backend failed on.
+        """
+        self.failures = []
+        unique_genes = list(dict.fromkeys(genes))
+        done = self.checkpoint.open(self.fingerprint()) if self.checkpoint is not None else {}
+        annotations = {annotator.column: {} for annotator in self.annotators}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for annotator in self.annotators:
+                column_done = done.get(annotator.column, {})
+                annotations[annotator.column].update(
+                    (gene, column_done[gene]) for gene in unique_genes if gene in column_done)
+                pending = [gene for gene in unique_genes if gene not in column_done]
+                for start in range(0, len(pending), annotator.batch_size):
+                    batch = pending[start:start + annotator.batch_size]
+                    futures[executor.submit(annotator.annotate_batch, batch)] = (annotator, batch)
+            for future in as_completed(futures):
+                annotator, batch = futures[future]
+                try:
+                    values = future.result()
+                except Exception as e:
+                    values = [AnnotationFailure(gene, annotator.column, str(e)) for gene in batch]
+                done_genes, done_values = [], []
+                for gene, value in zip(batch, values):
+                    if isinstance(value, AnnotationFailure):
+                        self.failures.append(value)
+                        annotations[annotator.column][gene] = None
+                    else:
+                        annotations[annotator.column][gene] = value
+                        done_genes.append(gene)
+                        done_values.append(value)
+                if self.checkpoint is not None and done_genes:
+                    self.checkpoint.append(annotator.column, done_genes, done_values)
+        if self.checkpoint is not None and not self.failures:
+            self.checkpoint.clear()
+        return annotations
+
+    def fingerprint(self) -> list:
+        """The fingerprints of the annotators, a checkpoint is only resumed by the same annotators."""
+        return [annotator.fingerprint() for annotator in self.annotators]
+
+    def run(self, df: pd.DataFrame, gene_col: str = 'row') -> pd.DataFrame:
+        """
+        Annotates the genes of a DataFrame and adds one column per backend. The gene column itself
+        is not changed, the normalized names are only used for the lookups.
+
+        Args:
+            df (pd.DataFrame): The DataFrame, the columns are added to it.
+            gene_col (str): The column with the gene names. Defaults to 'row'.
+
+        Returns:
+            pd.DataFrame: The DataFrame with the annotation columns.
+
+        Raises:
+            KeyError: If the gene column does not exist in the DataFrame.
+        """
+        if gene_col not in df.columns:
+            raise KeyError(f"The column '{gene_col}' does not exist in the DataFrame.")
+        genes = df[gene_col] if self.alias_index is None else self.alias_index.normalize_genes(df[gene_col])
+        genes = genes.tolist()
+        annotations = self.annotate(genes)
+        for column, gene_annotations in annotations.items():
+            df[column] = pd.Series([gene_annotations[gene] for gene in genes], index=df.index, dtype=object)
+        return df
@@ -0,0 +1,143 @@
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+import pathlib as path
+from typing import Optional, Union
+
+
+class EnrichmentCache:
+    """
+    A persistent, single-file (SQLite) cache for gene enrichment results.
+
+    Entries are keyed by (gene, gene-set libraries, organism), so the same gene queried
+    against a different set of libraries is treated as a different entry. Entries older
+    than `ttl` seconds are treated as misses, and once the cache holds more than
+    `max_entries` rows the least recently used ones are evicted.
+
+    Attributes:
+        path (pathlib.Path): The location of the SQLite file.
+        ttl (float or None): Time to live of an entry in seconds. None means entries never expire.
+        max_entries (int or None): Maximal number of stored entries. None means unbounded.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that were not in the cache (or were expired).
+    """
+
+    def __init__(self, filename: Union[path.Path, str] = 'enrichr_cache.sqlite',
+                 ttl: Optional[float] = 30 * 24 * 3600, max_entries: Optional[int] = 100_000):
+        """
+        Args:
+            filename (Union[pathlib.Path, str]): Path of the SQLite file, ':memory:' for an in-memory cache.
+            ttl (float, optional): Time to live of an entry in seconds. Defaults to 30 days.
+            max_entries (int, optional): Maximal number of entries before LRU eviction. Defaults to 100,000.
+
+        Raises:
+            ValueError: If ttl or max_entries are not positive.
+        """
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive or None.")
+        if max_entries is not None and max_entries <= 0:
+            raise ValueError("max_entries must be positive or None.")
+        self.path = path.Path(filename)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # The cache is shared between the worker threads of main(), so one connection is guarded by a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(filename), check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS enrichment ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS enrichment_accessed ON enrichment (accessed)")
+
+    @staticmethod
+    def make_key(gene: str, gene_sets: list, organism: str) -> str:
+        """Builds the cache key of a (gene, gene-set libraries, organism) query.
+        The order of the libraries does not matter.
+        """
+        raw = json.dumps([gene, sorted(gene_sets), organism])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, gene: str, gene_sets: list, organism: str):
+        """
+        Looks up a cached enrichment result.
+
+        Args:
+            gene (str): The gene name.
+            gene_sets (list): The gene-set libraries the gene was enriched against.
+            organism (str): The organism name.
+
+        Returns:
+            The cached result, or None if the entry is missing or expired.
+        """
+        key = self.make_key(gene, gene_sets, organism)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created FROM enrichment WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            with self._connection:
+                if self.ttl is not None and now - created > self.ttl:
+                    self._connection.execute("DELETE FROM enrichment WHERE key = ?", (key,))
+                    self.misses += 1
+                    return None
+                self._connection.execute(
+                    "UPDATE enrichment SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, gene: str, gene_sets: list, organism: str, value) -> None:
+        """
+        Stores an enrichment result, evicting the least recently used entries if the cache is full.
+
+        Args:
+            gene (str): The gene name.
+            gene_sets (list): The gene-set libraries the gene was enriched against.
+            organism (str): The organism name.
+            value: A JSON serializable result (list of pathways or a message).
+        """
+        key = self.make_key(gene, gene_sets, organism)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO enrichment (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now))
+            if self.max_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM enrichment WHERE key IN ("
+                    "SELECT key FROM enrichment ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,))
+
+    def clear(self) -> None:
+        """Removes all entries and resets the hit/miss counters."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM enrichment")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the current number of entries."""
+        with self._lock:
+            size = self._connection.execute("SELECT COUNT(*) FROM enrichment").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+    def close(self) -> None:
+        """Closes the underlying SQLite connection."""
+        self._connection.close()
+
+    def __len__(self):
+        return self.stats()['size']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
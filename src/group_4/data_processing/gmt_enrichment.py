@@ -0,0 +1,180 @@
+import pathlib as path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+from scipy.stats import hypergeom
+
+
+def read_gmt(gmt_file: Union[path.Path, str]) -> dict:
+    """
+    Reads a GMT file, every line is a term name, a description and the genes of the term,
+    separated by tabs.
+
+    Args:
+        gmt_file (Union[pathlib.Path, str]): The GMT file.
+
+    Returns:
+        dict: term name -> list of genes.
+    """
+    gene_sets = {}
+    with open(gmt_file) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 3:
+                continue
+            gene_sets[fields[0]] = [gene for gene in fields[2:] if gene]
+    return gene_sets
+
+
+class LocalGeneSetLibrary:
+    """
+    An in-memory enrichment engine over gene-set libraries downloaded as GMT files.
+
+    The gene sets are kept as an inverted index (gene -> ids of the sets containing it),
+    so a gene-to-pathway lookup is a dictionary access and an over-representation test of a
+    gene list is a handful of vectorized NumPy operations, without any network access.
+    Genes are matched case-insensitively.
+
+    Attributes:
+        libraries (np.ndarray): The library (GMT file stem) of each gene set.
+        terms (np.ndarray): The term of each gene set.
+        set_sizes (np.ndarray): The number of genes in each gene set.
+        genes (pd.Index): All the (upper case) genes found in the libraries.
+    """
+
+    def __init__(self, gene_sets: dict):
+        """
+        Args:
+            gene_sets (dict): library name -> {term -> list of genes}, as returned by read_gmt.
+        """
+        libraries, terms, set_genes = [], [], []
+        for library, library_sets in gene_sets.items():
+            for term, genes in library_sets.items():
+                libraries.append(library)
+                terms.append(term)
+                set_genes.append(pd.unique(pd.Series(genes, dtype=object).str.upper()))
+        self.libraries = np.array(libraries, dtype=object)
+        self.terms = np.array(terms, dtype=object)
+        self.set_sizes = np.array([len(genes) for genes in set_genes], dtype=np.int64)
+
+        # Build the inverted index as a CSR structure: the set ids of gene i are
+        # self._set_ids[self._offsets[i]:self._offsets[i + 1]]
+        all_genes = np.concatenate(set_genes) if set_genes else np.array([], dtype=object)
+        all_set_ids = np.repeat(np.arange(len(set_genes)), self.set_sizes)
+        gene_codes, uniques = pd.factorize(all_genes)
+        order = np.argsort(gene_codes, kind='stable')
+        self.genes = pd.Index(uniques)
+        self._set_ids = all_set_ids[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(gene_codes, minlength=len(uniques)))])
+
+    @classmethod
+    def from_directory(cls, directory: Union[path.Path, str], pattern: str = '*.gmt') -> 'LocalGeneSetLibrary':
+        """
+        Loads all the GMT files of a directory, each file is one library named after the file stem.
+
+        Args:
+            directory (Union[pathlib.Path, str]): The directory with the GMT files.
+            pattern (str, optional): Glob pattern of the files to load. Defaults to '*.gmt'.
+
+        Raises:
+            FileNotFoundError: If the directory does not contain any GMT file.
+        """
+        gmt_files = sorted(path.Path(directory).glob(pattern))
+        if not gmt_files:
+            raise FileNotFoundError(f"No GMT files matching '{pattern}' found in {directory}.")
+        return cls({gmt_file.stem: read_gmt(gmt_file) for gmt_file in gmt_files})
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _gene_codes(self, genes) -> np.ndarray:
+        """Returns the index position of each gene, -1 for genes not in any library."""
+        return self.genes.get_indexer(pd.Series(list(genes), dtype=object).str.upper())
+
+    def set_ids_for_gene(self, gene: str) -> np.ndarray:
+        """Returns the ids of the gene sets containing the gene."""
+        return self._set_ids_for_code(self._gene_codes([gene])[0])
+
+    def _set_ids_for_code(self, code: int) -> np.ndarray:
+        if code == -1:
+            return np.array([], dtype=np.int64)
+        return self._set_ids[self._offsets[code]:self._offsets[code + 1]]
+
+    def pathways_for_gene(self, gene: str):
+        """
+        Finds the terms a gene is part of, in the format of enrich_gene.
+
+        Returns:
+            list of terms, or 'No related pathways found'.
+        """
+        return self.pathways_for_genes([gene])[0]
+
+    def pathways_for_genes(self, genes) -> list:
+        """Finds the terms of each gene of a list, in the format of enrich_genes."""
+        pathways = []
+        for code in self._gene_codes(genes):  # all the genes are resolved in one vectorized lookup
+            set_ids = self._set_ids_for_code(code)
+            pathways.append(self.terms[set_ids].tolist() if len(set_ids) else 'No related pathways found')
+        return pathways
+
+    def enrich(self, gene_list, background: Optional[Union[int, list]] = None) -> pd.DataFrame:
+        """
+        Over-representation (hypergeometric) test of a gene list against every gene set.
+
+        Args:
+            gene_list (iterable of strings): The genes of interest.
+            background (Union[int, list], optional): The background genes, or their number.
+                Defaults to all the genes found in the libraries.
+
+        Returns:
+            pd.DataFrame: One row per gene set overlapping the list, with the columns of an
+            Enrichr result table ('Gene_set', 'Term', 'Overlap', 'P-value', 'Adjusted P-value',
+            'Genes'), sorted by p-value.
+        """
+        query = pd.unique(pd.Series(list(gene_list), dtype=object).str.upper())
+        codes = self._gene_codes(query)
+        known = codes != -1
+        query, codes = query[known], codes[known]
+
+        if background is None:
+            n_background = len(self.genes)
+        elif isinstance(background, int):
+            n_background = background
+        else:
+            n_background = len(set(pd.Series(list(background), dtype=object).str.upper()) | set(query))
+
+        # Gather the set ids of all the query genes at once, and count the overlap of each set
+        starts, ends = self._offsets[codes], self._offsets[codes + 1]
+        lengths = ends - starts
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        hit_set_ids = self._set_ids[positions]
+        hit_genes = np.repeat(query, lengths)
+        overlap = np.bincount(hit_set_ids, minlength=len(self))
+
+        hit = np.flatnonzero(overlap)
+        p_values = hypergeom.sf(overlap[hit] - 1, n_background, self.set_sizes[hit], len(query))
+        hits_by_set = pd.Series(hit_genes).groupby(hit_set_ids).agg(';'.join)
+        results = pd.DataFrame({
+            'Gene_set': self.libraries[hit],
+            'Term': self.terms[hit],
+            'Overlap': [f'{k}/{n}' for k, n in zip(overlap[hit], self.set_sizes[hit])],
+            'P-value': p_values,
+            'Adjusted P-value': benjamini_hochberg(p_values),
+            'Genes': hits_by_set.reindex(hit).to_numpy(),
+        })
+        return results.sort_values('P-value', kind='stable').reset_index(drop=True)
+
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjustment of an array of p-values."""
+    p_values = np.asarray(p_values, dtype=float)
+    n = len(p_values)
+    if n == 0:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order] * n / np.arange(1, n + 1)
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty(n)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
@@ -2,22 +2,27 @@ import pandas as pd
 import gseapy as gp
 import os
 from concurrent.futures import ThreadPoolExecutor 
-from requests.exceptions import RequestException 
-from json import JSONDecodeError 
+from .library_catalog import LibraryCatalog, ENRICHR_ERRORS
+from .http_client import AnnotationFailure, RequestFailed, default_client
+
+# The library list never changes during a run, so it is resolved once per process
+mouse_catalog = LibraryCatalog('Mouse')
+# Cache key of the default libraries (all the mouse libraries, whatever the catalog currently holds),
+# so a cached gene is answered without resolving the list. The TTL of the cache bounds how stale it gets.
+ALL_MOUSE_GENE_SETS = ['*']
 
 
 def get_mouse_gene_sets() -> list:
     '''
     Retrieve all gene sets related to mice from the available gene sets in GSEApy.
+    The list is fetched on the first call only and memoized for the rest of the process.
 
     output: 
         list of gene sets related to mice
     '''
-    available_gene_sets = gp.get_library_name()  # Checking for all the available databases
-    mouse_gene_sets = [gene_set for gene_set in available_gene_sets if 'Mouse' in gene_set]  # Include only databases for mice
-    return mouse_gene_sets
+    return mouse_catalog.libraries()
 
-def enrich_gene(gene) -> list:
+def enrich_gene(gene, cache=None, gene_sets=None, client=None) -> list:
     '''
 
     Find the pathway of the gene is part of using GSEApy library
@@ -25,25 +30,119 @@ def enrich_gene(gene) -> list:
     input: 
 
         gene_name (string)
+        cache (EnrichmentCache, optional): persistent cache of previous results, 
+        when given the network is only used for genes that are not in the cache
+        gene_sets (list, optional): gene-set libraries to enrich against, 
+        resolved once per run by the caller (see LibraryCatalog). Defaults to all mouse libraries.
+        client (HttpClient, optional): retries, backoff and circuit breaking of the Enrichr calls.
+        Defaults to the shared client of the package.
 
-    output: list of pathways
+    output: list of pathways, or an AnnotationFailure if Enrichr kept failing
 
     '''
+    client = client if client is not None else default_client
+    cache_gene_sets = gene_sets if gene_sets is not None else ALL_MOUSE_GENE_SETS
     try:
-        mouse_gene_sets = get_mouse_gene_sets()
-        enr = gp.enrichr(gene_list=[gene], gene_sets=mouse_gene_sets, organism='Mouse', outdir=None) #using GSEApy to find all the enrichment for given gene name in all the databases related to mice
+        if cache is not None:
+            cached = cache.get(gene, cache_gene_sets, 'Mouse')
+            if cached is not None:
+                return cached
+        mouse_gene_sets = gene_sets if gene_sets is not None else get_mouse_gene_sets()
+        enr = client.call(gp.enrichr, gene_list=[gene], gene_sets=mouse_gene_sets, organism='Mouse', outdir=None,
+                          retry_on=ENRICHR_ERRORS, name='enrichr') #using GSEApy to find all the enrichment for given gene name in all the databases related to mice
         
         if not enr.results.empty: #if there is pathway/s for the gene, make it a list
             pathways = enr.results['Term'].tolist()
-            return pathways
         else:
-            return 'No related pathways found' #dealing no results
-    #dealing with API and JSOND errors 
-    except (RequestException, JSONDecodeError) as e:
-        return f"Error processing gene {gene}: {e}"
-           
+            pathways = 'No related pathways found' #dealing no results
+        if cache is not None: #failures are not cached, so they will be retried on the next run
+            cache.set(gene, cache_gene_sets, 'Mouse', pathways)
+        return pathways
+    #dealing with API and JSON errors that persisted through the retries
+    except RequestFailed as e:
+        return AnnotationFailure(gene, 'enrichr', str(e))
+
+def map_terms_to_genes(results: pd.DataFrame, genes: list) -> dict:
+    '''
+
+    Map the terms of an Enrichr result table back to the genes of the submitted list,
+    using the ';' separated 'Genes' column of the results (matching is case-insensitive)
+
+    input:
+
+        results (DataFrame): the enr.results table of a gene list submission
+        genes (list): the submitted gene names
+
+    output: dictionary of gene name -> list of terms (genes without terms are left out)
+
+    '''
+    if results.empty:
+        return {}
+    overlaps = results[['Term', 'Genes']].assign(Genes=results['Genes'].str.upper().str.split(';')).explode('Genes')
+    terms_by_gene = overlaps.groupby('Genes', sort=False)['Term'].agg(list)
+    gene_terms = {}
+    for gene in genes:
+        terms = terms_by_gene.get(gene.upper())
+        if terms is not None:
+            gene_terms[gene] = terms
+    return gene_terms
 
+def enrich_genes(genes, batch_size: int = 500, gene_sets=None, cache=None, max_workers: int = 4, client=None) -> list:
+    '''
+
+    Find the pathways of many genes using one Enrichr submission per batch of genes
+    instead of one per gene. The terms of each batch are mapped back to the genes through 
+    the 'Genes' column of the results, so the output matches enrich_gene gene by gene.
+
+    input: 
+
+        genes (iterable of strings): gene names, duplicates are only submitted once
+        batch_size (int): number of genes in each Enrichr submission
+        gene_sets (list, optional): gene-set libraries to enrich against. Defaults to all mouse libraries.
+        cache (EnrichmentCache, optional): genes found in the cache are not submitted
+        max_workers (int): number of batches submitted concurrently
+        client (HttpClient, optional): retries, backoff and circuit breaking of the Enrichr calls
 
+    output: list with the pathways (or a message) of each gene, in the order of the input.
+    The genes of a batch Enrichr kept failing on get an AnnotationFailure.
 
+    Raises:
+        ValueError: If batch_size is not a positive integer.
+
+    '''
+    if not isinstance(batch_size, int) or batch_size <= 0:
+        raise ValueError("batch_size must be a positive integer.")
+    genes = list(genes)
+    client = client if client is not None else default_client
+    cache_gene_sets = gene_sets if gene_sets is not None else ALL_MOUSE_GENE_SETS
+
+    results = {}
+    pending = []
+    for gene in dict.fromkeys(genes):  # unique genes, in order of first appearance
+        cached = cache.get(gene, cache_gene_sets, 'Mouse') if cache is not None else None
+        if cached is not None:
+            results[gene] = cached
+        else:
+            pending.append(gene)
+    if not pending:
+        return [results[gene] for gene in genes]
+    mouse_gene_sets = gene_sets if gene_sets is not None else get_mouse_gene_sets()
 
+    def enrich_batch(batch):
+        try:
+            enr = client.call(gp.enrichr, gene_list=batch, gene_sets=mouse_gene_sets, organism='Mouse', outdir=None,
+                              retry_on=ENRICHR_ERRORS, name='enrichr')
+        except RequestFailed as e:
+            return {gene: AnnotationFailure(gene, 'enrichr', str(e)) for gene in batch}
+        gene_terms = map_terms_to_genes(enr.results, batch)
+        batch_results = {gene: gene_terms.get(gene, 'No related pathways found') for gene in batch}
+        if cache is not None:
+            for gene, pathways in batch_results.items():
+                cache.set(gene, cache_gene_sets, 'Mouse', pathways)
+        return batch_results
 
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_results in executor.map(enrich_batch, batches):
+            results.update(batch_results)
+    return [results[gene] for gene in genes]
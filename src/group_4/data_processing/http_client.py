@@ -0,0 +1,271 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException, ChunkedEncodingError, ConnectionError, Timeout
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RequestFailed(RequestException):
+    """
+    Raised when an outbound request still fails after all the retries.
+
+    Attributes:
+        url (str): The requested URL (or the name of the called function).
+        status_code (int or None): The last HTTP status, None if no response was received.
+        attempts (int): Number of attempts made.
+        reason (str): Description of the last failure.
+    """
+
+    def __init__(self, url: str, status_code: Optional[int], attempts: int, reason: str):
+        super().__init__(f"{url} failed after {attempts} attempt(s): {reason}")
+        self.url = url
+        self.status_code = status_code
+        self.attempts = attempts
+        self.reason = reason
+
+
+class AnnotationFailure:
+    """
+    A structured failure of an annotation backend for one gene, used in place of an annotation
+    so failed lookups are never mistaken for (or written out as) pathway data.
+
+    Attributes:
+        gene (str): The gene that could not be annotated.
+        source (str): The backend that failed.
+        reason (str): Description of the failure.
+    """
+
+    def __init__(self, gene: str, source: str, reason: str):
+        self.gene = gene
+        self.source = source
+        self.reason = reason
+
+    def __repr__(self):
+        return f"AnnotationFailure(gene={self.gene!r}, source={self.source!r}, reason={self.reason!r})"
+
+    def __eq__(self, other):
+        return (isinstance(other, AnnotationFailure)
+                and (self.gene, self.source, self.reason) == (other.gene, other.source, other.reason))
+
+    def to_dict(self) -> dict:
+        return {'gene': self.gene, 'source': self.source, 'reason': self.reason}
+
+
+class CircuitBreaker:
+    """
+    Pauses all the requests to an upstream that keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and every caller waits
+    `reset_timeout` seconds before sending anything. The circuit is then half-open: one caller
+    sends a trial request while the others keep waiting, a success closes the circuit and
+    releases them, a failure opens it again.
+
+    Attributes:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        if failure_threshold <= 0:
+            raise ValueError("failure_threshold must be a positive integer.")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until = 0.0  # 0 while the circuit is closed
+        self._trial = None  # the thread sending the trial request of the half-open circuit
+        self._condition = threading.Condition()
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    def wait(self) -> None:
+        """
+        Blocks while the circuit is open. Once it is half-open, the first caller returns to send
+        the trial request and the others block until the trial has succeeded or failed.
+        """
+        with self._condition:
+            while True:
+                remaining = self.open_until - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                elif self._trial is not None:
+                    self._condition.wait()
+                elif self.open_until:
+                    self._trial = threading.get_ident()
+                    return
+                else:
+                    return
+
+    def record_success(self) -> None:
+        with self._condition:
+            self.failures = 0
+            self.open_until = 0.0
+            self._trial = None
+            self._condition.notify_all()
+
+    def record_failure(self) -> None:
+        with self._condition:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + self.reset_timeout
+                # one more failure after the pause is enough to open the circuit again
+                self.failures = self.failure_threshold - 1
+            self._trial = None
+            self._condition.notify_all()
+
+    def abort_trial(self) -> None:
+        """Lets another caller send the trial, when the trial of this thread ended without an outcome."""
+        with self._condition:
+            if self._trial == threading.get_ident():
+                self._trial = None
+                self._condition.notify_all()
+
+
+def make_pooled_session(pool_size: int) -> requests.Session:
+    """Creates a session that keeps up to pool_size connections per host alive between requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Converts a Retry-After header (seconds or an HTTP date) to a number of seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """
+    The shared client for the outbound HTTP of the package.
+
+    Requests get a timeout, transient failures (connection errors, timeouts, truncated bodies and the
+    RETRY_STATUSES) are retried with exponential backoff and full jitter, a Retry-After header
+    overrides the backoff, and every host has a CircuitBreaker that pauses the callers while
+    the host keeps failing. When the retries run out a RequestFailed is raised.
+
+    Attributes:
+        timeout (float): Timeout of every request in seconds.
+        max_retries (int): Retries after the first attempt.
+        backoff_factor (float): The base of the exponential backoff in seconds.
+        max_backoff (float): The longest single wait in seconds.
+        session (requests.Session): The pooled session requests are sent with.
+    """
+
+    def __init__(self, timeout: float = 30, max_retries: int = 4, backoff_factor: float = 0.5,
+                 max_backoff: float = 60, retry_statuses=RETRY_STATUSES, failure_threshold: int = 5,
+                 reset_timeout: float = 30, pool_size: int = 8, session: Optional[requests.Session] = None):
+        if max_retries < 0:
+            raise ValueError("max_retries cannot be negative.")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = tuple(retry_statuses)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.session = session if session is not None else make_pooled_session(pool_size)
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        """Returns the circuit breaker of a host."""
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before the retry following `attempt` (0 based)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request with retries. Responses with a status that is not retried (e.g. 200, 304
+        or 404) are returned as they are.
+
+        Raises:
+            RequestFailed: If the request still fails after all the retries.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        breaker = self.breaker(urlsplit(url).netloc)
+        for attempt in range(self.max_retries + 1):
+            breaker.wait()
+            retry_after = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (ConnectionError, Timeout, ChunkedEncodingError) as e:
+                status_code, reason = None, str(e)
+            except BaseException:
+                breaker.abort_trial()
+                raise
+            else:
+                if response.status_code not in self.retry_statuses:
+                    breaker.record_success()
+                    return response
+                status_code, reason = response.status_code, f"HTTP {response.status_code}"
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            breaker.record_failure()
+            if attempt < self.max_retries:
+                time.sleep(self.backoff(attempt, retry_after))
+        raise RequestFailed(url, status_code, self.max_retries + 1, reason)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Sends a GET request with retries (see request)."""
+        return self.request('GET', url, **kwargs)
+
+    def call(self, function, *args, retry_on=(RequestException,), name: Optional[str] = None, **kwargs):
+        """
+        Calls a function doing its own HTTP (e.g. a GSEApy call) with the same retry policy.
+
+        Args:
+            function: The function to call with *args and **kwargs.
+            retry_on (tuple): The exceptions that are retried. Defaults to RequestException.
+            name (str, optional): Name of the upstream, for the circuit breaker and the failure.
+                Defaults to the function name.
+
+        Raises:
+            RequestFailed: If the call still fails after all the retries.
+        """
+        name = name or getattr(function, '__name__', repr(function))
+        breaker = self.breaker(name)
+        for attempt in range(self.max_retries + 1):
+            breaker.wait()
+            try:
+                result = function(*args, **kwargs)
+            except retry_on as e:
+                status_code = getattr(getattr(e, 'response', None), 'status_code', None)
+                reason = f"{type(e).__name__}: {e}"
+                breaker.record_failure()
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                breaker.abort_trial()
+                raise
+            breaker.record_success()
+            return result
+        raise RequestFailed(name, status_code, self.max_retries + 1, reason)
+
+
+# The client used by default, so all the callers share its connection pool and circuit breakers
+default_client = HttpClient()
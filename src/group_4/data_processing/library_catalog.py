@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+import pathlib as path
+from typing import Optional, Union
+
+import gseapy as gp
+from json import JSONDecodeError
+from requests.exceptions import RequestException
+
+from .http_client import HttpClient, default_client
+
+try:  # GSEApy >= 1.2 wraps the HTTP errors of Enrichr in its own exceptions
+    from gseapy.enrichr import EnrichrAPIError, EnrichrNetworkError
+    ENRICHR_ERRORS = (RequestException, JSONDecodeError, EnrichrAPIError, EnrichrNetworkError)
+except ImportError:
+    ENRICHR_ERRORS = (RequestException, JSONDecodeError)
+
+
+class LibraryCatalog:
+    """
+    Resolves the list of Enrichr gene-set libraries for an organism once and memoizes it.
+
+    The list is fetched with `gp.get_library_name()` the first time it is needed and kept for
+    the lifetime of the catalog. It can optionally be persisted to a JSON file, so later runs
+    do not need the network at all, or pinned to a fixed subset of libraries, which makes the
+    results reproducible and the enrichment faster.
+
+    Attributes:
+        organism (str): Only libraries whose name contains this string are kept (e.g. 'Mouse').
+        cache_file (pathlib.Path or None): JSON file the resolved list is persisted to.
+        max_age (float or None): Maximal age in seconds of the persisted list. None means it never expires.
+        pinned (list or None): A fixed list of libraries to use instead of the resolved one.
+        client (HttpClient): The client the list is fetched with (retries and circuit breaking).
+    """
+
+    def __init__(self, organism: str = 'Mouse', cache_file: Optional[Union[path.Path, str]] = None,
+                 max_age: Optional[float] = 7 * 24 * 3600, pinned: Optional[list] = None,
+                 client: Optional[HttpClient] = None):
+        """
+        Args:
+            organism (str, optional): Keyword the library names are filtered by. Defaults to 'Mouse'.
+            cache_file (Union[pathlib.Path, str], optional): JSON file to persist the list to. Defaults to None.
+            max_age (float, optional): Maximal age of the persisted list in seconds. Defaults to 7 days.
+            pinned (list, optional): Libraries to use without resolving anything. Defaults to None.
+            client (HttpClient, optional): Defaults to the shared client of the package.
+
+        Raises:
+            ValueError: If pinned is given but empty.
+        """
+        if pinned is not None and len(pinned) == 0:
+            raise ValueError("pinned must contain at least one library.")
+        self.organism = organism
+        self.cache_file = path.Path(cache_file) if cache_file is not None else None
+        self.max_age = max_age
+        self.pinned = list(pinned) if pinned is not None else None
+        self.client = client if client is not None else default_client
+        self._libraries = None
+        self._lock = threading.Lock()
+
+    def _read_cache_file(self) -> Optional[list]:
+        """Returns the persisted list, or None if there is no usable one."""
+        if self.cache_file is None or not self.cache_file.exists():
+            return None
+        try:
+            content = json.loads(self.cache_file.read_text())
+        except (OSError, ValueError):
+            return None
+        if content.get('organism') != self.organism:
+            return None
+        if self.max_age is not None and time.time() - content.get('fetched', 0) > self.max_age:
+            return None
+        return content.get('libraries')
+
+    def _write_cache_file(self, libraries: list) -> None:
+        """Persists the resolved list next to the time it was fetched."""
+        if self.cache_file is None:
+            return
+        content = {'organism': self.organism, 'fetched': time.time(), 'libraries': libraries}
+        self.cache_file.write_text(json.dumps(content))
+
+    def fetch(self) -> list:
+        """
+        Fetches the library names from Enrichr and keeps those of the catalog organism.
+
+        Raises:
+            RequestFailed: If Enrichr keeps failing after all the retries.
+        """
+        available_gene_sets = self.client.call(gp.get_library_name, retry_on=ENRICHR_ERRORS, name='enrichr')  # Checking for all the available databases
+        return [gene_set for gene_set in available_gene_sets if self.organism in gene_set]
+
+    def libraries(self) -> list:
+        """
+        Returns the gene-set libraries of the catalog, resolving them only on the first call.
+
+        Returns:
+            list: The pinned libraries if given, else the (memoized) libraries of the organism.
+        """
+        if self.pinned is not None:
+            return list(self.pinned)
+        # Worker threads may ask for the list concurrently, only one of them should fetch it
+        with self._lock:
+            if self._libraries is None:
+                libraries = self._read_cache_file()
+                if libraries is None:
+                    libraries = self.fetch()
+                    self._write_cache_file(libraries)
+                self._libraries = libraries
+        return list(self._libraries)
+
+    def invalidate(self) -> None:
+        """Forgets the memoized list and removes the persisted one, so the next call refetches it."""
+        with self._lock:
+            self._libraries = None
+            if self.cache_file is not None and self.cache_file.exists():
+                self.cache_file.unlink()
@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import pathlib as path
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+from urllib.parse import quote
+
+from requests.exceptions import RequestException
+
+from .http_client import AnnotationFailure, HttpClient
+from .scraping import REACTOME_URL, HostRateLimiter, scrape_for_pathway, scrape_for_pathways, status_failure
+
+try:  # orjson decodes the ContentService responses several times faster, but is optional
+    import orjson
+
+    def decode_json(body: bytes):
+        return orjson.loads(body)
+except ImportError:
+    def decode_json(body: bytes):
+        return json.loads(body)
+
+
+class CachedResponse:
+    """The parts of an HTTP response the pathway sources need, whether it came from the network or the cache."""
+
+    def __init__(self, status_code: int, content: bytes, from_cache: bool = False):
+        self.status_code = status_code
+        self.content = content
+        self.from_cache = from_cache
+
+
+class ResponseCache:
+    """
+    An on-disk cache of raw HTTP responses, keyed by URL.
+
+    Cached responses are revalidated with the ETag / Last-Modified headers the server sent,
+    so an unchanged resource costs one conditional request answered with an empty 304.
+    Only successful (200) responses are stored.
+
+    Attributes:
+        directory (pathlib.Path): The directory the responses are stored in.
+    """
+
+    def __init__(self, directory: Union[path.Path, str] = 'reactome_cache'):
+        self.directory = path.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, url: str):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return self.directory / f'{key}.json', self.directory / f'{key}.body'
+
+    def _load(self, url: str):
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def _store(self, url: str, headers, body: bytes) -> None:
+        meta_path, body_path = self._paths(url)
+        meta = {'url': url, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+        # Write to temporary files first, so a concurrent reader never sees a half written entry.
+        # Every write gets its own temporary file, the threads of one process store concurrently.
+        for target, content in ((body_path, body), (meta_path, json.dumps(meta).encode('utf-8'))):
+            with tempfile.NamedTemporaryFile(dir=target.parent, prefix=target.name, suffix='.tmp',
+                                             delete=False) as tmp:
+                tmp.write(content)
+            os.replace(tmp.name, target)
+
+    def get(self, client, url: str, timeout: float = 30) -> CachedResponse:
+        """
+        Fetches a URL through the cache.
+
+        Args:
+            client (HttpClient or requests.Session): The client used for network requests.
+            url (str): The URL to fetch.
+            timeout (float): Timeout of the request in seconds. Defaults to 30.
+
+        Returns:
+            CachedResponse: The status code and body of the (possibly cached) response.
+        """
+        meta, body = self._load(url)
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        response = client.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and body is not None:
+            return CachedResponse(200, body, from_cache=True)
+        if response.status_code == 200:
+            self._store(url, response.headers, response.content)
+        return CachedResponse(response.status_code, response.content)
+
+
+class PathwaySource:
+    """
+    Base class of the pathway annotation backends. A backend finds the pathways a gene is part of.
+    """
+    name = 'base'
+
+    def pathways(self, gene_name: str) -> list:
+        """
+        Returns the list of pathways of a gene, an empty list if there are none, or an
+        AnnotationFailure if the backend could not answer for the gene.
+        """
+        raise NotImplementedError
+
+    def fingerprint(self) -> dict:
+        """Describes what the backend answers with, so results of another configuration are not reused."""
+        return {'source': self.name}
+
+    def pathways_for_genes(self, genes, max_workers: int = 8) -> list:
+        """Returns the pathways of each gene, in the order of the input."""
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.pathways, genes))
+
+
+class ReactomeHTMLSource(PathwaySource):
+    """
+    Scrapes the reactome.org search and pathway HTML pages (see scrape_for_pathway).
+
+    Attributes:
+        base_url (str): The reactome.org address.
+        rate_limiter (HostRateLimiter): Limits the requests of pathways and pathways_for_genes
+            to `requests_per_second` per host together.
+        client (HttpClient or None): The client requests are sent with.
+    """
+    name = 'reactome_html'
+
+    def __init__(self, base_url: str = REACTOME_URL, requests_per_second=None, client: Optional[HttpClient] = None):
+        self.base_url = base_url
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.client = client
+
+    @property
+    def requests_per_second(self):
+        return self.rate_limiter.requests_per_second
+
+    def pathways(self, gene_name: str) -> list:
+        return scrape_for_pathway(gene_name, base_url=self.base_url, client=self.client,
+                                  rate_limiter=self.rate_limiter)
+
+    def fingerprint(self) -> dict:
+        return {'source': self.name, 'base_url': self.base_url}
+
+    def pathways_for_genes(self, genes, max_workers: int = 8) -> list:
+        return scrape_for_pathways(genes, concurrency=max_workers, base_url=self.base_url, client=self.client,
+                                   rate_limiter=self.rate_limiter)
+
+
+class ReactomeContentServiceSource(PathwaySource):
+    """
+    Queries the Reactome ContentService JSON API instead of scraping HTML.
+
+    The gene is searched among the Reactome proteins of the species, and the lowest level
+    pathways of the first match are returned by their display names. Raw responses can be
+    kept in a ResponseCache, so repeated runs only revalidate them.
+
+    Attributes:
+        base_url (str): The reactome.org address.
+        species (str): The species the search is restricted to.
+        cache (ResponseCache or None): The on-disk response cache.
+        timeout (float): Timeout of every request in seconds.
+        client (HttpClient): The client requests are sent with (retries and circuit breaking).
+    """
+    name = 'reactome_content_service'
+
+    def __init__(self, base_url: str = REACTOME_URL, species: str = 'Mus musculus',
+                 cache: Optional[ResponseCache] = None, timeout: float = 30, pool_size: int = 8,
+                 client: Optional[HttpClient] = None):
+        self.base_url = base_url
+        self.species = species
+        self.cache = cache
+        self.timeout = timeout
+        self.client = client if client is not None else HttpClient(timeout=timeout, pool_size=pool_size)
+
+    def fingerprint(self) -> dict:
+        return {'source': self.name, 'base_url': self.base_url, 'species': self.species}
+
+    def _get_json(self, url: str, gene_name: str):
+        """
+        Returns the decoded JSON body of a URL, None if the ContentService found nothing (404), or
+        an AnnotationFailure for any other status.
+        """
+        if self.cache is not None:
+            response = self.cache.get(self.client, url, timeout=self.timeout)
+        else:
+            response = self.client.get(url, timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            return status_failure(gene_name, url, response.status_code, self.name)
+        return decode_json(response.content)
+
+    def pathways(self, gene_name: str) -> list:
+        """
+        Find the pathways a gene is part of with the Reactome ContentService.
+
+        Raises:
+            TypeError: If input is not of type string.
+            RequestFailed: If the ContentService keeps failing after all the retries.
+        """
+        if not isinstance(gene_name, str):
+            raise TypeError("Input must be of type string")
+        species = quote(self.species)
+        search = self._get_json(f"{self.base_url}/ContentService/search/query?"
+                                f"query={quote(gene_name)}&species={species}&types=Protein&cluster=true", gene_name)
+        if isinstance(search, AnnotationFailure):
+            return search
+        if not search:  # The ContentService answers 404 when nothing is found
+            return []
+        entries = [entry for group in search.get('results', []) for entry in group.get('entries', [])]
+        if not entries:
+            return []
+        st_id = entries[0]['stId']
+        pathways = self._get_json(f"{self.base_url}/ContentService/data/pathways/low/entity/{st_id}?species={species}",
+                                  gene_name)
+        if isinstance(pathways, AnnotationFailure):
+            return pathways
+        if not pathways:
+            return []
+        return [pathway['displayName'] for pathway in pathways]
+
+
+class FallbackPathwaySource(PathwaySource):
+    """
+    Tries a list of backends in order and returns the answer of the first one that does not fail.
+    A backend that finds no pathways has answered, only network and decoding errors and
+    AnnotationFailures fall through.
+    """
+    name = 'fallback'
+
+    def __init__(self, sources: list):
+        if not sources:
+            raise ValueError("At least one pathway source is required.")
+        self.sources = sources
+
+    def fingerprint(self) -> dict:
+        return {'source': self.name, 'sources': [source.fingerprint() for source in self.sources]}
+
+    def pathways(self, gene_name: str) -> list:
+        for source in self.sources[:-1]:
+            try:
+                result = source.pathways(gene_name)
+            except (RequestException, ValueError):
+                continue
+            if not isinstance(result, AnnotationFailure):
+                return result
+        return self.sources[-1].pathways(gene_name)
+
+
+pathway_sources = {
+    ReactomeHTMLSource.name: ReactomeHTMLSource,
+    ReactomeContentServiceSource.name: ReactomeContentServiceSource,
+}
+
+
+def get_pathway_source(name: str, **kwargs) -> PathwaySource:
+    """
+    Creates a pathway backend by name ('reactome_html' or 'reactome_content_service').
+
+    Raises:
+        ValueError: If there is no backend with that name.
+    """
+    if name not in pathway_sources:
+        raise ValueError(f"Unknown pathway source '{name}', choose one of {sorted(pathway_sources)}.")
+    return pathway_sources[name](**kwargs)
@@ -1,95 +1,286 @@
-import requests
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
+from .http_client import AnnotationFailure, HttpClient, default_client
 
+REACTOME_URL = "https://reactome.org"
 
-def scrape_for_pathway(gene_name: str) -> list:
+
+def status_failure(gene_name: str, url: str, status_code: int, source: str = 'reactome_html') -> AnnotationFailure:
+    """
+    The failure of a gene whose request got an unexpected status that is not retried (e.g. 400 or 403),
+    so it is not mistaken for a gene without pathways.
+    """
+    return AnnotationFailure(gene_name, source, f"HTTP {status_code} from {url}")
+
+
+def find_pathway_link(search_html: str, gene_name: str, base_url: str = REACTOME_URL):
+    """
+    Find the link to the first result of a reactome.org search page.
+
+    Args:
+        search_html (string): The HTML of the search page.
+        gene_name (string): The name of the searched gene.
+        base_url (string): The reactome.org address relative links are resolved against.
+
+    Returns:
+        string: The absolute link of the first result, or None if there are no results.
+    """
+    # Step 2: Parse the HTML with BeautifulSoup
+    soup = BeautifulSoup(search_html, 'html.parser')
+
+    # Check if the page contains "No results found"
+    if f"No results found for {gene_name}" in soup.get_text():
+        return None  # Return immediately if no results found
+
+    # Step 3: Find the specific div with class 'result-title'
+    div = soup.find('div', class_='result-title')
+
+    # Step 4: Extract the link within the div if present
+    if div:
+        a_tag = div.find('a')  # Find the first <a> tag within the div
+        if a_tag:
+            relative_link = a_tag['href']  # Get the href attribute (URL) from the <a> tag
+            return urljoin(f"{base_url}/content/", relative_link)  # Combine base URL with relative URL
+    return None
+
+
+def parse_pathway_page(pathway_html: str) -> list:
+    """
+    Extract the pathways listed in the details of a reactome.org pathway page.
+
+    Args:
+        pathway_html (string): The HTML of the pathway page.
+
+    Returns:
+        list: List of pathways, empty if none are listed.
+    """
+    # Step 6: Parse the pathway page with BeautifulSoup
+    pathway_soup = BeautifulSoup(pathway_html, 'html.parser')
+
+    # Step 7: Find the fieldset with class 'fieldset-details'
+    fieldset = pathway_soup.find('fieldset', class_='fieldset-details')
+
+    if not fieldset:
+        return []
+    # Find all the outermost <div> elements inside the fieldset
+    outer_divs = fieldset.find_all('div', recursive=False)
+    span_values = []  # To store the span values
+    # Loop through each outermost div and find the first span inside it
+    # Initial layer is 1 for the outermost div
+    layer = 1
+
+    # Iterate through outer divs
+    for outer_div in outer_divs:
+        # Create a stack to hold divs and their layer number
+        stack = [(outer_div, layer)]
+        # Process each div in the stack
+        while stack:
+            current_div, current_layer = stack.pop()
+            # Find and print all direct span elements in the current div
+            spans = current_div.find_all('span', recursive=False)
+            for span in spans:
+                span_values.append(span.text.strip())
+
+            # Find all direct nested divs and add them to the stack with incremented layer number
+            nested_divs = current_div.find_all('div', recursive=False)
+            for nested_div in nested_divs:
+                stack.append((nested_div, current_layer + 1))
+
+    return span_values
+
+
+def scrape_for_pathway(gene_name: str, base_url: str = REACTOME_URL, client: HttpClient = None,
+                       rate_limiter: 'HostRateLimiter' = None) -> list:
     """
     Find the pathway a gene is part of in the reactome.org database using only requests and BeautifulSoup.
 
     Args:
         gene_name (string): The name of the gene.
+        base_url (string): The reactome.org address. Defaults to https://reactome.org.
+        client (HttpClient, optional): The client requests are sent with (timeouts, retries and
+            circuit breaking). Defaults to the shared client of the package.
+        rate_limiter (HostRateLimiter, optional): Limits the rate of the requests. Defaults to no limit.
 
     Returns:
-        list: List of pathways that the gene is part of.
+        list: List of pathways that the gene is part of, or an AnnotationFailure if reactome.org
+        answered with an unexpected status (a search answered with 404 found nothing).
 
     Raises:
         TypeError: If input is not of type string.
+        RequestFailed: If reactome.org keeps failing after all the retries.
     """
-    
+
     # Raise TypeError if the input is not a string
     if not isinstance(gene_name, str):
         raise TypeError("Input must be of type string")
 
+    client = client if client is not None else default_client
+
+    def get(url):
+        if rate_limiter is not None:
+            rate_limiter.wait_blocking(url)
+        return client.get(url)
+
     # Step 1: Search for the gene using requests
-    search_url = f"https://reactome.org/content/query?q={gene_name}"
-    search_response = requests.get(search_url)
+    search_url = f"{base_url}/content/query?q={gene_name}"
+    search_response = get(search_url)
 
     # Check if the request was successful
+    if search_response.status_code == 404:
+        return []
     if search_response.status_code != 200:
+        return status_failure(gene_name, search_url, search_response.status_code)
+
+    absolute_link = find_pathway_link(search_response.text, gene_name, base_url)
+    if absolute_link is None:
         return []
 
-    # Step 2: Parse the HTML with BeautifulSoup
-    soup = BeautifulSoup(search_response.text, 'html.parser')
+    # Step 5: Use requests to load the pathway page
+    pathway_response = get(absolute_link)
 
-    # Check if the page contains "No results found"
-    if f"No results found for {gene_name}" in soup.get_text():
-        return []  # Return an empty string immediately if no results found
+    if pathway_response.status_code != 200:
+        return status_failure(gene_name, absolute_link, pathway_response.status_code)
 
-    # Step 3: Find the specific div with class 'result-title'
-    div = soup.find('div', class_='result-title')
+    return parse_pathway_page(pathway_response.text)
 
-    # Step 4: Extract the link within the div if present
-    if div:
-        a_tag = div.find('a')  # Find the first <a> tag within the div
-        if a_tag:
-            relative_link = a_tag['href']  # Get the href attribute (URL) from the <a> tag
-            absolute_link = urljoin("https://reactome.org/content/", relative_link)  # Combine base URL with relative URL
 
-            # Step 5: Use requests to load the pathway page
-            pathway_response = requests.get(absolute_link)
+class HostRateLimiter:
+    """
+    Limits the rate of requests sent to each host. One limiter can be shared by the tasks of
+    an event loop (wait) and by threads (wait_blocking).
 
-            if pathway_response.status_code != 200:
-                return []
+    Attributes:
+        requests_per_second (float or None): Maximal request rate per host, None for no limit.
+    """
+
+    def __init__(self, requests_per_second=None):
+        if requests_per_second is not None and requests_per_second <= 0:
+            raise ValueError("requests_per_second must be positive or None.")
+        self.requests_per_second = requests_per_second
+        self._next_slot = {}
+        self._lock = threading.Lock()
 
-            # Step 6: Parse the pathway page with BeautifulSoup
-            pathway_soup = BeautifulSoup(pathway_response.text, 'html.parser')
-
-
-            # Step 7: Find the fieldset with class 'fieldset-details'
-            fieldset = pathway_soup.find('fieldset', class_='fieldset-details')
-
-            if fieldset:
-                # Find all the outermost <div> elements inside the fieldset
-                outer_divs = fieldset.find_all('div', recursive=False)
-                span_values = []  # To store the span values
-                # Loop through each outermost div and find the first span inside it
-                # Assuming you have already found the fieldset as fieldset
-                # Initial layer is 1 for the outermost div
-                layer = 1
-
-                # Iterate through outer divs
-                for outer_div in outer_divs:
-                    # Create a stack to hold divs and their layer number
-                    stack = [(outer_div, layer)]
-                    # Process each div in the stack
-                    while stack:
-                        current_div, current_layer = stack.pop()
-                        # Find and print all direct span elements in the current div
-                        spans = current_div.find_all('span', recursive=False)
-                        for span in spans:
-                            span_values.append(span.text.strip())
-                        
-                        # Find all direct nested divs and add them to the stack with incremented layer number
-                        nested_divs = current_div.find_all('div', recursive=False)
-                        for nested_div in nested_divs:
-                            stack.append((nested_div, current_layer + 1))
-
-                if span_values:
-                    return span_values # Return the span values separated by newlines
-                else:
-                    return []
-            else:
+    def _delay(self, url: str) -> float:
+        """Reserves the next free slot of the host of the url, and returns the time until it."""
+        if self.requests_per_second is None:
+            return 0
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / self.requests_per_second
+        return slot - now
+
+    async def wait(self, url: str) -> None:
+        """Waits until a request may be sent to the host of the url."""
+        delay = self._delay(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def wait_blocking(self, url: str) -> None:
+        """Blocks the calling thread until a request may be sent to the host of the url."""
+        delay = self._delay(url)
+        if delay > 0:
+            time.sleep(delay)
+
+
+async def scrape_for_pathways_async(genes, concurrency: int = 8, requests_per_second=None,
+                                    timeout: float = 30, base_url: str = REACTOME_URL,
+                                    client: HttpClient = None, rate_limiter: HostRateLimiter = None) -> list:
+    """
+    Find the reactome.org pathways of many genes concurrently.
+
+    All the requests go through one pooled keep-alive session, at most `concurrency` genes are
+    processed at the same time and the requests to each host are rate limited. The blocking
+    requests and the HTML parsing run in worker threads, so the event loop stays responsive.
+    Transient failures are retried by the HttpClient, a gene that still fails gets an
+    AnnotationFailure and does not stop the other genes.
+
+    Args:
+        genes (iterable of strings): The names of the genes.
+        concurrency (int): Maximal number of genes processed at the same time. Defaults to 8.
+        requests_per_second (float, optional): Maximal request rate per host. Defaults to no limit.
+        timeout (float): Timeout of every request in seconds. Defaults to 30.
+        base_url (string): The reactome.org address. Defaults to https://reactome.org.
+        client (HttpClient, optional): The client requests are sent with. Defaults to a new client
+            with a connection pool of `concurrency` connections.
+        rate_limiter (HostRateLimiter, optional): A limiter shared with other callers, used instead
+            of a new one limited to `requests_per_second`.
+
+    Returns:
+        list: The list of pathways of each gene (as scrape_for_pathway), or an AnnotationFailure for
+        the genes whose requests failed, in the order of the input.
+
+    Raises:
+        TypeError: If a gene is not of type string.
+        ValueError: If concurrency is not a positive integer.
+    """
+    genes = list(genes)
+    if not all(isinstance(gene_name, str) for gene_name in genes):
+        raise TypeError("Input must be of type string")
+    if not isinstance(concurrency, int) or concurrency <= 0:
+        raise ValueError("concurrency must be a positive integer.")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    if rate_limiter is None:
+        rate_limiter = HostRateLimiter(requests_per_second)
+    own_client = client is None
+    if own_client:
+        client = HttpClient(timeout=timeout, pool_size=concurrency)
+
+    loop = asyncio.get_event_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def in_thread(function, *args, **kwargs):
+        # loop.run_in_executor instead of asyncio.to_thread, which needs Python 3.9
+        return loop.run_in_executor(executor, functools.partial(function, *args, **kwargs))
+
+    async def get(url):
+        await rate_limiter.wait(url)
+        return await in_thread(client.get, url, timeout=timeout)
+
+    async def scrape(gene_name):
+        async with semaphore:
+            search_url = f"{base_url}/content/query?q={gene_name}"
+            search_response = await get(search_url)
+            if search_response.status_code == 404:
                 return []
-    
-    return []
+            if search_response.status_code != 200:
+                return status_failure(gene_name, search_url, search_response.status_code)
+            absolute_link = await in_thread(find_pathway_link, search_response.text, gene_name, base_url)
+            if absolute_link is None:
+                return []
+            pathway_response = await get(absolute_link)
+            if pathway_response.status_code != 200:
+                return status_failure(gene_name, absolute_link, pathway_response.status_code)
+            return await in_thread(parse_pathway_page, pathway_response.text)
+
+    try:
+        results = await asyncio.gather(*(scrape(gene_name) for gene_name in genes), return_exceptions=True)
+        return [AnnotationFailure(gene_name, 'reactome_html', str(result)) if isinstance(result, Exception) else result
+                for gene_name, result in zip(genes, results)]
+    finally:
+        executor.shutdown(wait=False)
+        if own_client:
+            client.session.close()
+
+
+def scrape_for_pathways(genes, concurrency: int = 8, requests_per_second=None, timeout: float = 30,
+                        base_url: str = REACTOME_URL, client: HttpClient = None,
+                        rate_limiter: HostRateLimiter = None) -> list:
+    """
+    Blocking wrapper of scrape_for_pathways_async, for callers outside of an event loop.
+    Takes the same arguments and returns the same list.
+    """
+    # a new event loop instead of asyncio.run, which needs Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(scrape_for_pathways_async(genes, concurrency, requests_per_second, timeout,
+                                                                 base_url, client, rate_limiter))
+    finally:
+        loop.close()
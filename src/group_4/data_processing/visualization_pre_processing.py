@@ -1,10 +1,18 @@
 import pandas as pd
 import numpy as np
-from typing import Union
+from typing import Optional, Union
+
+# The smallest positive float64. p-values below the floor (exact zeros by default) are clamped to
+# it before the -log10, so they map to a large finite value (about 323.3) instead of inf.
+P_VALUE_FLOOR = np.finfo(np.float64).smallest_subnormal
+# Key of DataFrame.attrs holding the number of p-values clamped by minus_log10_col
+CLAMPED_ATTR = 'clamped_p_values'
 
 def validate_p_vals(p_val_col: Union[pd.Series, np.ndarray]) -> bool:
     """Validates that a given column supposedly containing p-values (0 < p-values < 1) 
     actually contains valid p-values.
+    The type is checked on the dtype and the range with one min and one max reduction, a NaN
+    value fails the range check as it propagates through both.
 
     Args:
         p_val_col (Union[pd.Series, np.ndarray]): A column or array containing p-values to be validated.
@@ -17,33 +25,101 @@ def validate_p_vals(p_val_col: Union[pd.Series, np.ndarray]) -> bool:
         bool: Returns True if the p-values are valid.
     """
 
-    # Validation 1: Check if the given column contains float type (ignoring NA values)
-    if not pd.api.types.is_float_dtype(p_val_col.dropna()):
+    # Validation 1: Check if the given column contains float type
+    if not pd.api.types.is_float_dtype(p_val_col):
         raise ValueError("The p-values column must contain float values.")
 
-    # Validation 2: Check if the given column contains values between 0 and 1 (ignoring NA values)
-    if not p_val_col.between(0.0, 1.0).all():
+    # Validation 2: Check if the given column contains values between 0 and 1
+    values = p_val_col.to_numpy(dtype=np.float64, na_value=np.nan) if isinstance(p_val_col, pd.Series) else np.asarray(p_val_col)
+    if len(values) and not (values.min() >= 0.0 and values.max() <= 1.0):
         raise ValueError("The p-values column contains values outside the range [0, 1].")
     return True
 
     
+def minus_log10(p_vals: Union[pd.Series, np.ndarray], floor: Optional[float] = None, dtype=np.float64) -> tuple:
+    """
+    Validates the p-values and returns their -log10, with the p-values below floor clamped to it,
+    so the result has no inf. The clamp, the log and the cast run as NumPy ufuncs writing into
+    the output array, without intermediate pandas objects.
+
+    Args:
+        p_vals (Union[pd.Series, np.ndarray]): The p-values.
+        floor (float, optional): The smallest p-value, in (0, 1]. Defaults to the smallest
+            float64 subnormal (P_VALUE_FLOOR).
+        dtype: The dtype of the result, np.float64 or np.float32 (half the memory, the -log10
+            of every float64 fits). Defaults to np.float64.
+
+    Returns:
+        values (np.ndarray): The -log10 of the clamped p-values.
+        n_clamped (int): The number of p-values that were below the floor.
+
+    Raises:
+        ValueError: If the p-values are invalid (see validate_p_vals) or the floor is not in (0, 1].
+    """
+    floor = P_VALUE_FLOOR if floor is None else floor
+    if not 0 < floor <= 1:
+        raise ValueError("The floor must be in the range (0, 1].")
+    validate_p_vals(p_vals)
+    p_vals = p_vals.to_numpy(dtype=np.float64, na_value=np.nan) if isinstance(p_vals, pd.Series) else np.asarray(p_vals, dtype=np.float64)
+    clamped = np.maximum(p_vals, floor)
+    n_clamped = int(np.count_nonzero(clamped != p_vals))
+    values = np.log10(clamped, out=np.empty(len(clamped), dtype=dtype), casting='same_kind')
+    return np.negative(values, out=values), n_clamped
+
+
 def minus_log10_col(df: pd.DataFrame, p_val_col: str,
-                    output_col_name :str = '-log10(p-value)') -> pd.DataFrame:
+                    output_col_name :str = '-log10(p-value)', copy: bool = False,
+                    floor: Optional[float] = None, dtype=np.float64) -> pd.DataFrame:
     """Calulates the -log10 col for volcano plot creation
+    p-values below floor (by default only exact zeros) are clamped to it, so the column has no inf.
+    The number of clamped values is stored in df.attrs['clamped_p_values'].
 
     Args:
         df (pd.DataFrame): df
         p_val_col (str): the column name were the p_values are stored.
+        copy (bool): if True the column is added to a copy of df, else to df itself.
+        floor (float, optional): the smallest p-value, defaults to the smallest float64 subnormal.
+        dtype: np.float64 (the default) or np.float32 for the new column.
     
     Raises: 
         KeyError: there is no p value column in the df
     """
     if p_val_col not in df.columns:
         raise KeyError(f"The column '{p_val_col}' does not exist in the DataFrame.")
-    if validate_p_vals(df[p_val_col]):
-        df[output_col_name] = -np.log10(df[p_val_col])
-        return df
+    values, n_clamped = minus_log10(df[p_val_col], floor, dtype)
+    if copy:
+        df = df.copy()
+    df[output_col_name] = values
+    df.attrs[CLAMPED_ATTR] = n_clamped
+    return df
     
+def label_codes(values: np.ndarray, thresholds: list, labels: list) -> pd.Categorical:
+    """
+    Labels values by the ranges between sorted thresholds, as pd.cut with right closed bins
+    (-inf, t1], (t1, t2], ..., (tn, inf] would, with one binary search per value on the raw array.
+    NaN and -inf values get no label.
+
+    Raises:
+    - ValueError: If the thresholds or labels are invalid (see label_by_order).
+    """
+    # Validation 1: Check if all thresholds are numeric
+    if not all(isinstance(th, (int, float)) for th in thresholds):
+        raise ValueError("All thresholds must be numeric values.")
+
+    # Validation 2: Check if the number of labels is one more than the number of thresholds
+    if len(labels) != len(thresholds) + 1:
+        raise ValueError("The number of labels must be exactly one more than the number of thresholds.")
+
+    # Validation 3: Check if thresholds are sorted in ascending order
+    if thresholds != sorted(thresholds):
+        raise ValueError("Thresholds must be sorted in ascending order.")
+
+    # side='left' puts a value equal to a threshold in the bin the threshold closes
+    codes = np.searchsorted(np.asarray(thresholds, dtype=np.float64), values, side='left')
+    codes[np.isnan(values) | (values == -np.inf)] = -1
+    return pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+
+
 def label_by_order(df: pd.DataFrame, ref_col: str, labels_col: str, thresholds: list, 
                    labels: list) -> pd.DataFrame:
     """
@@ -67,24 +143,31 @@ def label_by_order(df: pd.DataFrame, ref_col: str, labels_col: str, thresholds:
     - ValueError: If thresholds are not sorted in ascending order.
     """
 
-    # Validation 1: Check if all thresholds are numeric
-    if not all(isinstance(th, (int, float)) for th in thresholds):
-        raise ValueError("All thresholds must be numeric values.")
+    # Apply labels based on thresholds
+    df[labels_col] = label_codes(df[ref_col].to_numpy(dtype=np.float64, na_value=np.nan), thresholds, labels)
 
-    # Validation 2: Check if the number of labels is one more than the number of thresholds
-    if len(labels) != len(thresholds) + 1:
-        raise ValueError("The number of labels must be exactly one more than the number of thresholds.")
+    return df
 
-    # Validation 3: Check if thresholds are sorted in ascending order
-    if thresholds != sorted(thresholds):
-        raise ValueError("Thresholds must be sorted in ascending order.")
+def top_n_positions(values: pd.Series, n_top: int, highest: bool = True) -> tuple:
+    """
+    Finds the positions of the top N values (ties with the Nth value included) in O(n) with
+    np.argpartition, instead of sorting the whole column. Only the selected positions are sorted.
 
-    # Apply labels based on thresholds
-    df[labels_col] = pd.cut(df[ref_col], bins=[-float('inf')] + thresholds + [float('inf')],
-        labels=labels, right=True)
-    df[labels_col] = pd.Categorical(df[labels_col], categories=labels, ordered=True)
+    Returns:
+        positions (np.ndarray): The positions of the top values, best first, ties in their original order.
+        top_n_threshold: The Nth value, NaN if there are less than N values that are not NaN.
+    """
+    array = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = np.flatnonzero(~np.isnan(array))
+    if n_top > len(valid):  # as after a sort, where the NaN values come last
+        return np.empty(0, dtype=np.intp), np.nan
+    key = -array[valid] if highest else array[valid]
+    nth = np.argpartition(key, n_top - 1)[n_top - 1]
+    top_n_threshold = values.iloc[valid[nth]]
+    selected = valid[key <= key[nth]]
+    order = np.argsort(-array[selected] if highest else array[selected], kind='stable')
+    return selected[order], top_n_threshold
 
-    return df
 
 def identify_top_n_values(df: pd.DataFrame, name_of_ref_col: str, n_top: int, 
                           highest: bool = True) -> pd.DataFrame:
@@ -121,23 +204,16 @@ def identify_top_n_values(df: pd.DataFrame, name_of_ref_col: str, n_top: int,
     if n_top > len(df):
         raise ValueError("n_top cannot be greater than the number of rows in the DataFrame.")
 
-    # Sort the DataFrame based on the reference column
-    df = df.sort_values(name_of_ref_col, ascending=not highest).reset_index(drop=True)
-
-    # Identify the Nth threshold value
-    top_n_threshold = df.loc[n_top-1, name_of_ref_col]
-
-    # Get the top N values based on the threshold
-    if highest:
-        top_values_df = df[df[name_of_ref_col] >= top_n_threshold]
-    else:
-        top_values_df = df[df[name_of_ref_col] <= top_n_threshold]
+    # Get the top N values, and the values tied with the Nth, sorted as sort_values would
+    positions, top_n_threshold = top_n_positions(df[name_of_ref_col], n_top, highest)
+    top_values_df = df.take(positions).reset_index(drop=True)
 
     return top_values_df, top_n_threshold
 
 def process_data_for_volcanoplot(input_data: pd.DataFrame,p_ref_colname: str,log10colname: str, 
                                  ref_colname: str, label_colname: str, thresholds: list, labels: list, 
-                                 n: int, highest: bool):
+                                 n: int, highest: bool, copy: bool = True, floor: Optional[float] = None,
+                                 dtype=np.float64):
     """
     Processes data frames in order to visualize it as a volcano plot, a scatter plot of the fold change (FC) of
     gene vs. the -log10 of the p value of the FC. There are three stages of processing:
@@ -147,6 +223,9 @@ def process_data_for_volcanoplot(input_data: pd.DataFrame,p_ref_colname: str,log
     3. Identifying the top genes (top significant or most changed) so they can also be distinguished in the plot.
     To specify whether you want the top highest genes (most changed) or top lowest genes (most significant), specify
     whether higher is true or false (lower).
+    The stages run as one pass over the NumPy arrays of the columns: the -log10 values are computed
+    once, labelled with a binary search, the top genes are found without sorting the whole frame, and
+    both new columns are added to the frame at the end.
 
     Args:
         input_data (pd.DataFrame): data frame of genes, so for each gene there is a FC and p value listed.
@@ -158,13 +237,38 @@ def process_data_for_volcanoplot(input_data: pd.DataFrame,p_ref_colname: str,log
         labels (list): the labels that will be given to the ranges of p-values/FC.
         n (int): number of top genes to be isolated
         highest (bool): determine whether we want the highest gene or the lowest gene values.
+        copy (bool): if True (the default) the new columns are added to a copy of input_data,
+            which is left unchanged. If False they are added to input_data itself, without any copy.
+        floor (float, optional): p-values below it are clamped to it before the -log10 (see minus_log10),
+            the number of clamped values is stored in the attrs of the processed dataframe.
+        dtype: np.float64 (the default) or np.float32 for the -log10 column.
 
     Returns:
         processed dataframe with -log10(p-value) column and label column, a dataframe containing only the top genes, and the threshold
         that differentiates between the top selected genes and the rest of the genes.
     """
-    with_log_col = minus_log10_col(input_data,p_ref_colname,log10colname)
-    processed_df = label_by_order(with_log_col, ref_colname, label_colname, thresholds, labels)
-    top_genes, threshold = identify_top_n_values(processed_df,ref_colname,n,highest)
+    if p_ref_colname not in input_data.columns:
+        raise KeyError(f"The column '{p_ref_colname}' does not exist in the DataFrame.")
+    log_values, n_clamped = minus_log10(input_data[p_ref_colname], floor, dtype)
+    if ref_colname == log10colname:
+        ref_values = pd.Series(log_values, index=input_data.index)
+    else:
+        ref_values = input_data[ref_colname]
+    labels_values = label_codes(ref_values.to_numpy(dtype=np.float64, na_value=np.nan), thresholds, labels)
+
+    # Same validations as identify_top_n_values
+    if not isinstance(n, int) or n <= 0:
+        raise ValueError("n_top must be a positive integer.")
+    if not pd.api.types.is_numeric_dtype(ref_values):
+        raise ValueError("The reference column must contain numeric data.")
+    if n > len(input_data):
+        raise ValueError("n_top cannot be greater than the number of rows in the DataFrame.")
+    positions, threshold = top_n_positions(ref_values, n, highest)
+
+    processed_df = input_data.copy() if copy else input_data
+    processed_df[log10colname] = log_values
+    processed_df[label_colname] = labels_values
+    processed_df.attrs[CLAMPED_ATTR] = n_clamped
+    top_genes = processed_df.take(positions).reset_index(drop=True)
     return processed_df, top_genes
 
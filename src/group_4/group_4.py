@@ -1,43 +1,59 @@
 """Main module."""
-from data_cleaning import DataCleaning, create_test_df
-from data_processing import enrich_gene, scrape_for_pathway, process_data_for_volcanoplot
-from visualizations import RNABarPlotter, ScatterPlotToolkit
+from data_cleaning import DataCleaning, create_test_df, cache_xlsx_as_parquet, GeneAliasIndex
+from data_processing import process_data_for_volcanoplot, EnrichmentCache, LibraryCatalog
+from data_processing import AnnotationPipeline, EnrichrAnnotator, PathwaySourceAnnotator
+from data_processing import FallbackPathwaySource, ReactomeContentServiceSource, ReactomeHTMLSource, ResponseCache
+from visualizations import RNABarPlotter, ScatterPlotToolkit, export_volcano_html
 
-from concurrent.futures import ThreadPoolExecutor 
 import matplotlib.pyplot as plt
+import pandas as pd
 
 import os
 
 
 
 def main():
+    #the same steps are the stages of pipeline.toml, run with `group_4-pipeline pipeline.toml` to skip the unchanged ones
     create_test_df()
     base_dir = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(base_dir, 'results_deseq2.xlsx')
 
-    cleaner = DataCleaning(file_path)
+    #the xlsx sheet is converted to parquet once and reused while it is unchanged,
+    #and the lazy cleaner only reads the columns the cleaning steps keep or use, in compact dtypes
+    cleaner = DataCleaning(cache_xlsx_as_parquet(file_path), lazy=True, memory_map=True, compact=True)
     cleaned_data = cleaner.clean_data(column_name_to_filter='padj',threshold=0.1,condition = 'smaller', column_name_to_remove='Unnamed: 0')
     b_plot = RNABarPlotter(cleaned_data)
-    b_plot.plot(0.05)
-
-    complex_related_pathway = []
-    with ThreadPoolExecutor(max_workers=8) as executor:  #up to 8 threads will run concurrently
-        complex_related_pathway = list(executor.map(enrich_gene, cleaned_data['row'])) 
-    cleaned_data['complex related pathway'] = complex_related_pathway
-    simple_related_pathway = []
-    for gene_name in cleaned_data['row']:
-      pathway_name = scrape_for_pathway(gene_name)
-      simple_related_pathway.append(pathway_name)
-    cleaned_data['related pathway'] = simple_related_pathway
-    processed_data_for_plotting = cleaner.remove_na().data
+    b_plot.plot(0.05, top_k=25, n_summary_bins=10)  #the 25 most up and down regulated genes, the others binned
+
+    #synonyms, Ensembl IDs and case variants share one lookup when a local alias table is available
+    alias_file = os.path.join(base_dir, 'mouse_gene_aliases.tsv')
+    alias_index = GeneAliasIndex.from_file(alias_file) if os.path.exists(alias_file) else None
+    mouse_gene_sets = LibraryCatalog('Mouse', cache_file='mouse_gene_sets.json').libraries()  #resolved once for all the genes
+    #the Reactome JSON API is used first, the HTML pages are only scraped if it fails
+    pathway_source = FallbackPathwaySource([ReactomeContentServiceSource(cache=ResponseCache('reactome_cache')),
+                                            ReactomeHTMLSource(requests_per_second=10)])
+    with EnrichmentCache('enrichr_cache.sqlite') as cache:
+        #both annotations run in one pass over the unique genes, sharing up to 8 threads.
+        #finished genes are checkpointed, so an interrupted run continues where it stopped
+        pipeline = AnnotationPipeline([EnrichrAnnotator('complex related pathway', gene_sets=mouse_gene_sets, cache=cache, batch_size=500),
+                                       PathwaySourceAnnotator(pathway_source, 'related pathway')], max_workers=8,
+                                      checkpoint='annotation_checkpoint.jsonl', alias_index=alias_index)
+        pipeline.run(cleaned_data, gene_col='row')
+    if pipeline.failures:  #failed lookups are left empty in the output and reported separately
+        pd.DataFrame([failure.to_dict() for failure in pipeline.failures]).to_csv('annotation_failures.csv', index=False)
+    #only the plotted columns are checked, so a gene whose lookup failed (an empty annotation) is still plotted
+    processed_data_for_plotting = cleaner.remove_na(['row', 'log2FoldChange', 'padj']).data
     final_processed_df, top_genes = process_data_for_volcanoplot(processed_data_for_plotting,'padj','-log10(p-value)','padj','significance',[0.01, 0.05, 0.1],['very significant', 'significant','trend','non-sognificant'],10,False)
     cleaned_data.to_csv('output_data.csv')
     q = ScatterPlotToolkit()
-    q.plot(final_processed_df,'log2FoldChange','-log10(p-value)')
+    #the non-significant genes are drawn as one density image, only the others as points
+    significant = final_processed_df['significance'] != 'non-sognificant'
+    q.plot_density(final_processed_df,'log2FoldChange','-log10(p-value)',significant,color_by='significance',highlight=top_genes)
     q.set_significance_lines(threshold_p=0.05,threshold_FC=(-2,2))
-    q.color_by(final_processed_df,'log2FoldChange','-log10(p-value)',color_by='significance')
     q.label_genes(top_genes,'log2FoldChange','-log10(p-value)','row')
     plt.savefig("volcano_plot.png", format='png', dpi=300)
+    #the same plot as an offline html page, with the gene, padj and pathways shown on hover
+    export_volcano_html(final_processed_df,'volcano_plot.html',label_col='significance',pathway_col='related pathway')
     plt.show()
     
 
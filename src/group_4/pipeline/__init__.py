@@ -0,0 +1,3 @@
+from .runner import Pipeline, Stage, FileHashes, load_config
+from .stages import stage_kinds, read_table, write_table
+from .cli import main
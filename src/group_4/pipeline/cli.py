@@ -0,0 +1,33 @@
+import argparse
+import sys
+from typing import Optional
+
+from .runner import Pipeline
+
+
+def main(argv: Optional[list] = None) -> int:
+    """
+    The command line entry point: group_4-pipeline CONFIG [STAGE ...] [--force] [--status].
+
+    Returns:
+        int: The exit status, 0 on success.
+    """
+    parser = argparse.ArgumentParser(prog='group_4-pipeline',
+                                     description='Runs the stages of a TOML or YAML pipeline config, '
+                                                 'skipping the stages whose inputs and params did not change.')
+    parser.add_argument('config', help='the pipeline config, a .toml, .yaml or .yml file')
+    parser.add_argument('stages', nargs='*', help='only bring these stages (and what they depend on) up to date')
+    parser.add_argument('--force', action='store_true', help='run the selected stages even if they are up to date')
+    parser.add_argument('--status', action='store_true', help='only show which stages would run')
+    args = parser.parse_args(argv)
+    try:
+        pipeline = Pipeline.from_config(args.config)
+        if args.status:
+            for name, status in pipeline.status(args.stages).items():
+                print(f'{name}: {status}')
+        else:
+            pipeline.run(args.stages, force=args.force)
+    except (ValueError, FileNotFoundError, ImportError) as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import hashlib
+import pathlib as path
+from typing import Optional, Union
+
+from .stages import stage_kinds
+
+# Bumped whenever the stage records or the stage functions change in a way that invalidates the outputs
+CACHE_FORMAT_VERSION = 2
+CONFIG_SUFFIXES = ('.toml', '.yaml', '.yml')
+
+
+def load_config(filename: Union[path.Path, str]) -> dict:
+    """
+    Reads a pipeline config written in TOML or YAML.
+
+    Raises:
+        ValueError: If the file is neither TOML nor YAML.
+        ImportError: For a TOML file before Python 3.11 when tomli is not installed, or for a
+            YAML file when PyYAML is not installed.
+    """
+    filename = path.Path(filename)
+    if filename.suffix == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            # tomllib is only in the standard library from Python 3.11, tomli is the same parser
+            try:
+                import tomli as tomllib
+            except ImportError as e:
+                raise ImportError('reading TOML pipeline configs before Python 3.11 requires tomli') from e
+        with open(filename, 'rb') as f:
+            return tomllib.load(f)
+    if filename.suffix in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError('reading YAML pipeline configs requires PyYAML, or use a TOML config') from e
+        with open(filename) as f:
+            return yaml.safe_load(f) or {}
+    raise ValueError(f'config format not supported, choose one of {CONFIG_SUFFIXES}')
+
+
+class FileHashes:
+    """
+    The SHA-256 digests of files, remembered with their size and mtime in a JSON file, so a file that
+    did not change since it was last hashed is not read again.
+
+    Attributes:
+        path (pathlib.Path): The JSON file.
+    """
+
+    def __init__(self, filename: Union[path.Path, str]):
+        self.path = path.Path(filename)
+        try:
+            self._digests = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self._digests = {}
+
+    def digest(self, filename: path.Path) -> Optional[str]:
+        """The digest of the content of a file, None if it does not exist."""
+        try:
+            stat = filename.stat()
+        except FileNotFoundError:
+            return None
+        key = str(filename.resolve())
+        signature = [stat.st_size, stat.st_mtime_ns]
+        known = self._digests.get(key)
+        if known is not None and known[:2] == signature:
+            return known[2]
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        self._digests[key] = signature + [sha.hexdigest()]
+        return sha.hexdigest()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + f'.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps(self._digests))
+        os.replace(tmp, self.path)
+
+
+class Stage:
+    """
+    One step of a pipeline: a stage kind (see stage_kinds) applied to named input files, writing
+    named output files, with keyword params.
+
+    Attributes:
+        name (str): The name of the stage in the config.
+        kind (str): The function the stage runs, a key of stage_kinds.
+        inputs (dict): input name -> pathlib.Path.
+        outputs (dict): output name -> pathlib.Path.
+        params (dict): The keyword arguments of the stage function.
+    """
+
+    def __init__(self, name: str, kind: str, inputs: dict, outputs: dict, params: Optional[dict] = None):
+        """
+        Raises:
+            ValueError: If there is no stage kind with that name, or the stage has no output.
+        """
+        if kind not in stage_kinds:
+            raise ValueError(f"Unknown kind '{kind}' of stage '{name}', choose one of {sorted(stage_kinds)}.")
+        if not outputs:
+            raise ValueError(f"The stage '{name}' must declare at least one output.")
+        self.name = name
+        self.kind = kind
+        self.inputs = {key: path.Path(value) for key, value in inputs.items()}
+        self.outputs = {key: path.Path(value) for key, value in outputs.items()}
+        self.params = dict(params or {})
+
+    def __repr__(self):
+        return f"Stage(name={self.name!r}, kind={self.kind!r})"
+
+    def run(self) -> None:
+        stage_kinds[self.kind](self.inputs, self.outputs, **self.params)
+
+
+class Pipeline:
+    """
+    Runs the stages of a config in the order of their dependencies, skipping the stages that are up to date.
+
+    A stage depends on the stages that write its inputs. Before a stage runs, a key is computed from
+    its kind, params, output paths (relative to the root, so the key does not depend on the working
+    directory) and the SHA-256 of the content of every input. The key and the digests of the outputs
+    are recorded once the stage succeeds; on the next run the stage is skipped when its key is
+    unchanged and its outputs still have the recorded content, as make or DVC do.
+    A changed input or param therefore re-runs its stage and, when the new outputs differ, the
+    stages downstream, while everything else (e.g. hours of annotation requests) is reused.
+
+    Attributes:
+        stages (list): The stages, in an order where every stage comes after its dependencies.
+        cache_dir (pathlib.Path): Where the stage records and the file digests are kept.
+        root (pathlib.Path): The directory the output paths of the stage keys are relative to.
+    """
+
+    def __init__(self, stages: list, cache_dir: Union[path.Path, str] = '.pipeline',
+                 root: Union[path.Path, str] = '.'):
+        """
+        Raises:
+            ValueError: If two stages have the same name or write the same file, or the dependencies have a cycle.
+        """
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError('Every stage must have a different name.')
+        self.producers = {}
+        for stage in stages:
+            for output in stage.outputs.values():
+                if output in self.producers:
+                    raise ValueError(f"The stages '{self.producers[output].name}' and '{stage.name}' "
+                                     f"both write {output}.")
+                self.producers[output] = stage
+        self.stages = self._sorted(stages)
+        self.cache_dir = path.Path(cache_dir)
+        self.root = path.Path(root)
+        self.hashes = FileHashes(self.cache_dir / 'file_hashes.json')
+
+    @classmethod
+    def from_config(cls, filename: Union[path.Path, str]) -> 'Pipeline':
+        """
+        Creates the pipeline of a TOML or YAML config. Every table of 'stages' is a stage with a 'kind',
+        'inputs' and 'outputs' tables of names to files, and an optional 'params' table. The paths,
+        including the optional 'cache_dir' of the 'pipeline' table, are relative to the config file.
+
+        Raises:
+            ValueError: If the config has no stages or is invalid (see Stage and Pipeline).
+        """
+        filename = path.Path(filename)
+        config = load_config(filename)
+        directory = filename.parent
+        stages = config.get('stages') or {}
+        if not stages:
+            raise ValueError(f'{filename} declares no stages.')
+        resolved = []
+        for name, stage in stages.items():
+            inputs = {key: directory / value for key, value in (stage.get('inputs') or {}).items()}
+            outputs = {key: directory / value for key, value in (stage.get('outputs') or {}).items()}
+            resolved.append(Stage(name, stage.get('kind', name), inputs, outputs, stage.get('params')))
+        cache_dir = directory / (config.get('pipeline') or {}).get('cache_dir', '.pipeline')
+        return cls(resolved, cache_dir, root=directory)
+
+    def _sorted(self, stages: list) -> list:
+        """The stages after their dependencies (keeping the order of the config otherwise)."""
+        ordered, state = [], {}
+
+        def visit(stage, chain):
+            if state.get(stage.name) == 'done':
+                return
+            if state.get(stage.name) == 'visiting':
+                raise ValueError(f"The stages have a cycle: {' -> '.join(chain + [stage.name])}.")
+            state[stage.name] = 'visiting'
+            for dependency in self.dependencies(stage):
+                visit(dependency, chain + [stage.name])
+            state[stage.name] = 'done'
+            ordered.append(stage)
+
+        for stage in stages:
+            visit(stage, [])
+        return ordered
+
+    def dependencies(self, stage: Stage) -> list:
+        """The stages writing the inputs of a stage."""
+        return [self.producers[source] for source in stage.inputs.values() if source in self.producers]
+
+    def _record_path(self, stage: Stage) -> path.Path:
+        return self.cache_dir / 'stages' / f'{stage.name}.json'
+
+    def stage_key(self, stage: Stage) -> Optional[str]:
+        """
+        The content hash a stage is cached under, None if one of its inputs does not exist yet.
+        """
+        digests = {name: self.hashes.digest(source) for name, source in stage.inputs.items()}
+        if None in digests.values():
+            return None
+        root = self.root.resolve()
+        outputs = {name: path.Path(os.path.relpath(output.resolve(), root)).as_posix()
+                   for name, output in stage.outputs.items()}
+        description = {'version': CACHE_FORMAT_VERSION, 'kind': stage.kind, 'params': stage.params,
+                       'inputs': digests, 'outputs': outputs}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_up_to_date(self, stage: Stage) -> bool:
+        """True if the stage was run with the same key and its outputs were not changed since."""
+        key = self.stage_key(stage)
+        try:
+            record = json.loads(self._record_path(stage).read_text())
+        except (OSError, ValueError):
+            return False
+        if key is None or record.get('key') != key:
+            return False
+        return all(self.hashes.digest(output) == record['outputs'].get(name)
+                   for name, output in stage.outputs.items())
+
+    def select(self, targets: Optional[list] = None) -> list:
+        """
+        The stages needed for the target stages (the targets and everything upstream of them),
+        in running order. Defaults to all the stages.
+
+        Raises:
+            ValueError: If a target is not a stage of the pipeline.
+        """
+        if not targets:
+            return list(self.stages)
+        by_name = {stage.name: stage for stage in self.stages}
+        unknown = [target for target in targets if target not in by_name]
+        if unknown:
+            raise ValueError(f'Unknown stages {unknown}, choose from {list(by_name)}.')
+        needed, pending = set(), [by_name[target] for target in targets]
+        while pending:
+            stage = pending.pop()
+            if stage.name not in needed:
+                needed.add(stage.name)
+                pending.extend(self.dependencies(stage))
+        return [stage for stage in self.stages if stage.name in needed]
+
+    def status(self, targets: Optional[list] = None) -> dict:
+        """
+        Tells for every selected stage whether it would be 'up to date' or would 'run', without running anything.
+        A stage downstream of a stage that runs is reported as 'run' too.
+        """
+        status, will_run = {}, set()
+        for stage in self.select(targets):
+            upstream_runs = any(dependency.name in will_run for dependency in self.dependencies(stage))
+            if upstream_runs or not self.is_up_to_date(stage):
+                will_run.add(stage.name)
+            status[stage.name] = 'run' if stage.name in will_run else 'up to date'
+        self.hashes.save()
+        return status
+
+    def run(self, targets: Optional[list] = None, force: bool = False, log=print) -> dict:
+        """
+        Runs the selected stages that are not up to date, in the order of their dependencies.
+
+        Args:
+            targets (list, optional): Names of the stages to bring up to date, with what they depend on.
+                Defaults to all the stages.
+            force (bool): Run the selected stages even if they are up to date. Defaults to False.
+            log (callable): Called with a line for every stage. Defaults to print.
+
+        Returns:
+            dict: stage name -> seconds spent running it, None for the stages that were skipped.
+
+        Raises:
+            FileNotFoundError: If an input of a stage does not exist and no stage writes it.
+        """
+        timings = {}
+        try:
+            for stage in self.select(targets):
+                if not force and self.is_up_to_date(stage):
+                    timings[stage.name] = None
+                    log(f'{stage.name}: up to date')
+                    continue
+                missing = [str(source) for source in stage.inputs.values() if not source.exists()]
+                if missing:
+                    raise FileNotFoundError(f"The inputs {missing} of the stage '{stage.name}' do not exist.")
+                key = self.stage_key(stage)
+                start = time.perf_counter()
+                stage.run()
+                timings[stage.name] = time.perf_counter() - start
+                record = {'key': key, 'outputs': {name: self.hashes.digest(output)
+                                                  for name, output in stage.outputs.items()}}
+                record_path = self._record_path(stage)
+                record_path.parent.mkdir(parents=True, exist_ok=True)
+                record_path.write_text(json.dumps(record, indent=1))
+                log(f'{stage.name}: ran in {timings[stage.name]:.2f}s')
+        finally:
+            self.hashes.save()
+        return timings
@@ -0,0 +1,147 @@
+import pathlib as path
+
+import pandas as pd
+
+from ..data_cleaning import DataCleaning, GeneAliasIndex, read_columnar
+from ..data_cleaning.columnar import COLUMNAR_SUFFIXES
+from ..data_processing import (AnnotationPipeline, EnrichmentCache, EnrichrAnnotator, FallbackPathwaySource,
+                               LibraryCatalog, PathwaySourceAnnotator, ReactomeContentServiceSource,
+                               ReactomeHTMLSource, ResponseCache, process_data_for_volcanoplot)
+
+TABLE_SUFFIXES = ('.csv', '.pkl') + COLUMNAR_SUFFIXES
+
+
+def read_table(filename: path.Path) -> pd.DataFrame:
+    """
+    Reads a table written by write_table, a csv, pickle, Parquet, Feather or Arrow IPC file.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if filename.suffix == '.csv':
+        return pd.read_csv(filename)
+    if filename.suffix == '.pkl':
+        return pd.read_pickle(filename)
+    if filename.suffix in COLUMNAR_SUFFIXES:
+        return read_columnar(filename)
+    raise ValueError(f'table format not supported, choose one of {TABLE_SUFFIXES}')
+
+
+def write_table(df: pd.DataFrame, filename: path.Path, index: bool = False) -> None:
+    """
+    Writes a table in the format of its suffix. Pickle keeps every dtype and object column
+    (e.g. the lists of an annotation column), Parquet and Feather only the columnar types.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    if filename.suffix == '.csv':
+        df.to_csv(filename, index=index)
+    elif filename.suffix == '.pkl':
+        df.to_pickle(filename)
+    elif filename.suffix == '.parquet':
+        df.to_parquet(filename, index=index)
+    elif filename.suffix in COLUMNAR_SUFFIXES:
+        df.reset_index(drop=not index).to_feather(filename)
+    else:
+        raise ValueError(f'table format not supported, choose one of {TABLE_SUFFIXES}')
+
+
+def clean_stage(inputs: dict, outputs: dict, column_name_to_filter: str = 'padj', threshold: float = 0.1,
+                condition: str = 'smaller', column_name_to_remove: str = 'Unnamed: 0', compact: bool = False) -> None:
+    """Cleans the 'data' result file with DataCleaning.clean_data and writes the 'data' table."""
+    cleaner = DataCleaning(inputs['data'], lazy=True, memory_map=True, compact=compact)
+    cleaned = cleaner.clean_data(column_name_to_filter, threshold, condition, column_name_to_remove)
+    write_table(cleaned, outputs['data'])
+
+
+def bar_plot_stage(inputs: dict, outputs: dict, padj_value: float = None, top_k: int = None,
+                   n_summary_bins: int = 0, dpi: int = 100) -> None:
+    """Draws the 'figure' bar plot of the 'data' table (see RNABarPlotter.plot)."""
+    from matplotlib.figure import Figure
+    from ..visualizations import RNABarPlotter
+    fig = Figure(figsize=(12, 10))
+    RNABarPlotter(read_table(inputs['data'])).plot(padj_value, top_k, n_summary_bins, figure=fig, filename=None)
+    outputs['figure'].parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(outputs['figure'], dpi=dpi)
+
+
+def annotate_stage(inputs: dict, outputs: dict, organism: str = 'Mouse', gene_col: str = 'row',
+                   enrichr_cache: str = 'enrichr_cache.sqlite', gene_sets_cache: str = 'gene_sets.json',
+                   reactome_cache: str = 'reactome_cache', checkpoint: str = 'annotation_checkpoint.jsonl',
+                   batch_size: int = 500, max_workers: int = 8, requests_per_second: float = 10) -> None:
+    """
+    Annotates the genes of the 'data' table with their Enrichr terms and Reactome pathways, as in
+    group_4.main, and writes the 'data' table with the annotation columns. With an 'aliases' input
+    the gene names are normalized for the lookups (see GeneAliasIndex). The failed lookups are
+    written to the optional 'failures' csv output. The caches and the checkpoint are relative to
+    the directory of the 'data' output, they survive a re-run so an interrupted stage resumes.
+    """
+    df = read_table(inputs['data'])
+    directory = outputs['data'].parent
+    alias_index = GeneAliasIndex.from_file(inputs['aliases']) if 'aliases' in inputs else None
+    gene_sets = LibraryCatalog(organism, cache_file=directory / gene_sets_cache).libraries()
+    pathway_source = FallbackPathwaySource([ReactomeContentServiceSource(cache=ResponseCache(directory / reactome_cache)),
+                                            ReactomeHTMLSource(requests_per_second=requests_per_second)])
+    with EnrichmentCache(directory / enrichr_cache) as cache:
+        pipeline = AnnotationPipeline([EnrichrAnnotator('complex related pathway', gene_sets=gene_sets, cache=cache,
+                                                        batch_size=batch_size),
+                                       PathwaySourceAnnotator(pathway_source, 'related pathway')],
+                                      max_workers=max_workers, checkpoint=directory / checkpoint,
+                                      alias_index=alias_index)
+        pipeline.run(df, gene_col=gene_col)
+    write_table(df, outputs['data'])
+    if 'failures' in outputs:
+        failures = pd.DataFrame([failure.to_dict() for failure in pipeline.failures],
+                                columns=['gene', 'source', 'reason'])
+        write_table(failures, outputs['failures'])
+
+
+def volcano_stage(inputs: dict, outputs: dict, p_col: str = 'padj', thresholds: list = (0.01, 0.05, 0.1),
+                  labels: list = ('very significant', 'significant', 'trend', 'non-significant'), n_top: int = 10,
+                  highest: bool = False) -> None:
+    """
+    Processes the genes of the 'data' table without missing values with process_data_for_volcanoplot,
+    and writes the processed 'data' table and the 'top_genes' table.
+    """
+    df = read_table(inputs['data']).dropna(subset=['row', 'log2FoldChange', p_col])
+    processed, top_genes = process_data_for_volcanoplot(df, p_col, '-log10(p-value)', p_col, 'significance',
+                                                        list(thresholds), list(labels), n_top, highest)
+    write_table(processed, outputs['data'])
+    write_table(top_genes, outputs['top_genes'])
+
+
+def volcano_plot_stage(inputs: dict, outputs: dict, threshold_p: float = 0.05, threshold_FC: list = (-2, 2),
+                       non_significant: str = 'non-significant', dpi: int = 300,
+                       pathway_col: str = None) -> None:
+    """
+    Draws the volcano plot of the 'data' and 'top_genes' tables of a volcano stage as the 'figure'
+    output, and as an interactive page if there is an 'html' output (see export_volcano_html).
+    """
+    from ..visualizations import export_volcano_html
+    from ..visualizations.rendering import draw_volcano
+    processed, top_genes = read_table(inputs['data']), read_table(inputs['top_genes'])
+    if 'figure' in outputs:
+        fig = draw_volcano(processed, top_genes, threshold_p, threshold_FC, non_significant=non_significant)
+        outputs['figure'].parent.mkdir(parents=True, exist_ok=True)
+        fig.savefig(outputs['figure'], dpi=dpi)
+    if 'html' in outputs:
+        pathway_col = pathway_col if pathway_col in processed.columns else None
+        export_volcano_html(processed, outputs['html'], pathway_col=pathway_col)
+
+
+def export_stage(inputs: dict, outputs: dict, index: bool = True) -> None:
+    """Writes the 'data' table in the format of the 'data' output, e.g. the final csv."""
+    write_table(read_table(inputs['data']), outputs['data'], index=index)
+
+
+# The stage kinds of a pipeline config, every kind takes its input and output paths and its params
+stage_kinds = {
+    'clean': clean_stage,
+    'bar_plot': bar_plot_stage,
+    'annotate': annotate_stage,
+    'volcano': volcano_stage,
+    'volcano_plot': volcano_plot_stage,
+    'export': export_stage,
+}
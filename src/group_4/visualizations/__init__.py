@@ -1,2 +1,4 @@
 from .bar_plot import RNABarPlotter
 from .scatter_plot import ScatterPlotToolkit
+from .rendering import render_result_files
+from .html_export import export_volcano_html
@@ -6,6 +6,41 @@ import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 
 
+def top_k_positions(expression_changes: np.ndarray, k: int) -> np.ndarray:
+    """
+    Finds the positions of the k most up-regulated and the k most down-regulated genes in O(n)
+    with np.argpartition, instead of sorting the whole column.
+
+    Returns:
+        np.ndarray: The positions, ordered by increasing fold change (the way barh stacks them
+        from the bottom, so the most up-regulated gene is drawn on top).
+    """
+    magnitudes = np.abs(expression_changes)
+    selected = []
+    for candidates in (np.flatnonzero(expression_changes < 0), np.flatnonzero(expression_changes > 0)):
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-magnitudes[candidates], k - 1)[:k]]
+        selected.append(candidates)
+    selected = np.concatenate(selected)
+    return selected[np.argsort(expression_changes[selected], kind='stable')]
+
+
+def summary_bars(expression_changes: np.ndarray, n_bins: int) -> tuple:
+    """
+    Collapses genes into n_bins equal-width bins of log2 fold change, in one histogram pass.
+
+    Returns:
+        tuple: The label ('<n> genes, <from> to <to>') and the mean log2 fold change of every
+        non-empty bin, ordered by increasing fold change.
+    """
+    counts, edges = np.histogram(expression_changes, bins=n_bins)
+    sums, _ = np.histogram(expression_changes, bins=edges, weights=expression_changes)
+    filled = counts > 0
+    labels = [f'{count} genes, {low:.2f} to {high:.2f}'
+              for count, low, high in zip(counts[filled], edges[:-1][filled], edges[1:][filled])]
+    return labels, sums[filled] / counts[filled]
+
+
 class RNABarPlotter:
 
     """
@@ -24,6 +59,10 @@ class RNABarPlotter:
         Extracts RNA names and log2 fold change values from the DataFrame.
         generate_bar_plot(self, RNA_names: pd.Series, expression_changes: pd.Series):
         Creates a horizontal bar plot to visualize RNA expression changes.
+        select_genes(self, padj_value: float = None, top_k: int = None) -> Tuple[pd.DataFrame, np.ndarray]:
+        Applies the padj threshold and selects the top K up and down regulated genes.
+        plot(self, padj_value: float = None, top_k: int = None, n_summary_bins: int = 0):
+        Selects the genes and plots them, with the other genes optionally binned into summary bars.
     """      
     
     def __init__(self, df):
@@ -48,13 +87,28 @@ class RNABarPlotter:
         return RNA_names, expression_changes
 
 
-    def generate_bar_plot(self, RNA_names, expression_changes):
+    def generate_bar_plot(self, RNA_names, expression_changes, ax=None, filename='barplot.png',
+                          figsize: tuple = (12, 10), summary=None):
         """Creates a horizontal bar plot for changes in expression levels.
 
         Args:
             RNA_names (pd.Series): RNA sequences names
             expression_changes (pd.Series): log2 Fold Change in expression
+            ax (matplotlib.axes.Axes, optional): The axes to draw on, e.g. of a matplotlib.figure.Figure
+                built without pyplot. Defaults to a new pyplot figure.
+            filename (str, optional): Where the figure is saved, None to leave it unsaved. Defaults to 'barplot.png'.
+            figsize (tuple, optional): The size of the new figure when no axes is given. Defaults to (12, 10).
+            summary (array-like of bool, optional): The bars that summarize several genes, drawn hatched
+                in gray instead of colored by their fold change. Defaults to None.
+
+        Returns:
+            matplotlib.figure.Figure: The figure of the plot.
         """
+        if ax is None:
+            fig, ax = plt.subplots(figsize=figsize)
+        else:
+            fig = ax.figure
+
         # Color map
         cmap = plt.colormaps['RdYlBu']
 
@@ -62,33 +116,103 @@ class RNABarPlotter:
         norm = plt.Normalize(pd.Series(expression_changes).min(), pd.Series(expression_changes).max())
 
         # Create a horizontal bar plot with a color scale
-        plt.figure(figsize=(12, 10))
-        bars = plt.barh(RNA_names, expression_changes, color=cmap(norm(expression_changes)))
+        bars = ax.barh(RNA_names, expression_changes, color=cmap(norm(expression_changes)))
+        if summary is not None:
+            for position in np.flatnonzero(summary):
+                bars[position].set_facecolor('lightgray')
+                bars[position].set_hatch('//')
 
         # Add a color bar to show the scale
         sm = cm.ScalarMappable(cmap=cmap, norm=norm)
         sm.set_array([])
 
         # Positioning the color bar next to the plot
-        cbar = plt.colorbar(sm, ax=plt.gca(), orientation='vertical')
+        cbar = fig.colorbar(sm, ax=ax, orientation='vertical')
         cbar.set_label('log2 Fold Change')
 
         # Add a vertical line at x=0 for reference
-        plt.axvline(0, color='black', linewidth=1)
+        ax.axvline(0, color='black', linewidth=1)
 
         # Adding labels and title
-        plt.xlabel('Expression Change')
-        plt.ylabel('RNA sequence')
-        plt.yticks(fontsize=8)
-        plt.title('log2 Fold Change - RNAs Expression')
-        plt.grid()
-        plt.savefig('barplot.png')
+        ax.set_xlabel('Expression Change')
+        ax.set_ylabel('RNA sequence')
+        ax.tick_params(axis='y', labelsize=8)
+        ax.set_title('log2 Fold Change - RNAs Expression')
+        ax.grid()
+        if filename is not None:
+            fig.savefig(filename)
+        return fig
+
+    def select_genes(self, padj_value: float = None, top_k: int = None) -> tuple:
+        """Keeps the genes below the padj threshold and selects the top K up and down regulated ones.
+
+        Args:
+            padj_value (float, optional): Only the genes with a padj below it are kept. Defaults to all the genes.
+            top_k (int, optional): Number of up and of down regulated genes selected by |log2 Fold Change|.
+                Defaults to all the kept genes.
+
+        Returns:
+            Tuple[pd.DataFrame, np.ndarray]: The selected genes ordered by log2 Fold Change, and the
+            log2 Fold Change of the kept genes that were not selected.
 
-    def plot(self, padj_value):
-        """Main method to load data, clean it, and plot it.
+        Raises:
+            KeyError: If the padj column does not exist in the DataFrame.
+            ValueError: If top_k is not a positive integer.
+        """
+        data = self.df
+        if padj_value is not None:
+            if 'padj' not in data.columns:
+                raise KeyError("The column 'padj' does not exist in the DataFrame.")
+            data = data[data['padj'].to_numpy(dtype=np.float64, na_value=np.nan) < padj_value]
+        if top_k is None:
+            return data, np.empty(0)
+        if not isinstance(top_k, (int, np.integer)) or top_k < 1:
+            raise ValueError('top_k must be a positive integer')
+        expression_changes = data['log2FoldChange'].to_numpy(dtype=np.float64, na_value=np.nan)
+        positions = top_k_positions(expression_changes, top_k)
+        rest = np.ones(len(data), dtype=bool)
+        rest[positions] = False
+        rest &= np.isfinite(expression_changes)
+        return data.take(positions), expression_changes[rest]
+
+    def plot(self, padj_value: float = None, top_k: int = None, n_summary_bins: int = 0, figure=None,
+             filename='barplot.png'):
+        """Main method to select the genes and plot them.
+
+        With top_k the genes are selected with a partial sort and the figure is sized to the number
+        of bars, so the cost of the plot depends on top_k rather than on the size of the table.
+        With n_summary_bins the genes that were not selected are binned by log2 Fold Change into
+        that many hatched bars, each at the mean of its genes and labelled with their number and range.
 
         Args:
-            padj_value: Adjusted p-value threshold of RNAs to plot
+            padj_value (float, optional): Adjusted p-value threshold of RNAs to plot. Defaults to all the RNAs.
+            top_k (int, optional): Number of up and of down regulated RNAs drawn. Defaults to all the RNAs.
+            n_summary_bins (int, optional): Number of summary bars of the other RNAs. Defaults to 0, none.
+            figure (matplotlib.figure.Figure, optional): The figure to draw on, e.g. one built without pyplot,
+                with top_k it is resized to the bars. Defaults to a new pyplot figure.
+            filename (str, optional): Where the figure is saved, None to leave it unsaved. Defaults to 'barplot.png'.
+
+        Returns:
+            matplotlib.figure.Figure: The figure of the plot.
         """
-        RNA_names, expression_changes = self.get_data()
-        self.generate_bar_plot(RNA_names, expression_changes)
+        selected, rest = self.select_genes(padj_value, top_k)
+        ax = figure.subplots() if figure is not None else None
+        if top_k is None:
+            return self.generate_bar_plot(selected['row'], selected['log2FoldChange'], ax=ax, filename=filename)
+        names = selected['row'].astype(str).tolist()
+        values = selected['log2FoldChange'].to_numpy(dtype=np.float64, na_value=np.nan)
+        summary = np.zeros(len(names), dtype=bool)
+        if n_summary_bins and len(rest):
+            labels, means = summary_bars(rest, n_summary_bins)
+            # the other genes lie between the selected down and up regulated ones
+            split = np.searchsorted(values, 0.0)
+            names = names[:split] + labels + names[split:]
+            values = np.concatenate([values[:split], means, values[split:]])
+            summary = np.concatenate([summary[:split], np.ones(len(labels), dtype=bool), summary[split:]])
+        figsize = (12, max(4.0, 0.25 * len(names) + 2))
+        if figure is not None:
+            figure.set_size_inches(figsize)
+        if ax is None:
+            figure, ax = plt.subplots(figsize=figsize)
+        figure.set_layout_engine('constrained')  # makes room for the long labels of the summary bars
+        return self.generate_bar_plot(names, values, ax=ax, filename=filename, summary=summary)
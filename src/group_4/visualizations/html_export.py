@@ -0,0 +1,358 @@
+import base64
+import json
+import html
+import pathlib as path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# matplotlib's tab10, the colors of the categories in their order
+PALETTE = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22',
+           '#17becf']
+NO_PATHWAY = ''
+
+
+def _base64(array: np.ndarray, dtype) -> str:
+    """The little-endian bytes of an array as base64, decoded in the page as a JavaScript typed array."""
+    return base64.b64encode(np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<')).tobytes()).decode()
+
+
+def _encode_codes(codes: np.ndarray) -> dict:
+    """Codes as base64 in the smallest signed integer type holding them (-1 marks a missing value)."""
+    dtype = next(t for t in (np.int8, np.int16, np.int32) if codes.max(initial=0) <= np.iinfo(t).max)
+    return {'codes': _base64(codes, dtype), 'type': f'Int{np.dtype(dtype).itemsize * 8}Array'}
+
+
+def _as_text(value) -> str:
+    """A cell as text, the terms of a list (e.g. of enrich_genes) joined with '; ', missing values as ''."""
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return '; '.join(map(str, value))
+    return NO_PATHWAY if pd.isna(value) else str(value)
+
+
+def _codes(values: pd.Series) -> tuple:
+    """The unique values of a column as text (see _as_text) and the code of every row."""
+    codes, uniques = pd.factorize(np.array([_as_text(value) for value in values], dtype=object), sort=False)
+    return list(uniques), codes
+
+
+def volcano_payload(df: pd.DataFrame, x_col: str = 'log2FoldChange', y_col: str = '-log10(p-value)',
+                    gene_col: str = 'row', padj_col: str = 'padj', label_col: Optional[str] = 'significance',
+                    pathway_col: Optional[str] = None) -> dict:
+    """
+    Packs the columns of a volcano plot into compact typed arrays.
+
+    The numbers are base64 encoded float32 arrays, the labels and pathways are stored once each
+    with a base64 array of codes in the smallest integer type, and the gene names are one newline separated string, so
+    a gene costs about 20 bytes instead of a JSON object with its keys repeated.
+    Genes without a finite x or y value are left out.
+
+    Returns:
+        dict: The JSON serializable payload embedded by export_volcano_html.
+
+    Raises:
+        KeyError: If a column does not exist in the DataFrame.
+    """
+    columns = [col for col in (x_col, y_col, gene_col, padj_col, label_col, pathway_col) if col is not None]
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise KeyError(f"The columns {missing} do not exist in the DataFrame.")
+    x = df[x_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    y = df[y_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    finite = np.isfinite(x) & np.isfinite(y)
+    df = df[finite]
+    genes = df[gene_col].astype(str).str.replace('\n', ' ', regex=False)
+    payload = {
+        'n': int(finite.sum()),
+        'x': _base64(x[finite], np.float32),
+        'y': _base64(y[finite], np.float32),
+        'padj': _base64(df[padj_col].to_numpy(dtype=np.float64, na_value=np.nan), np.float32),
+        'genes': '\n'.join(genes),
+        'labels': {'xlabel': x_col, 'ylabel': y_col},
+    }
+    if label_col is not None:
+        column = df[label_col]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            categories, codes = [str(c) for c in column.cat.categories], column.cat.codes.to_numpy()
+        else:
+            categories, codes = _codes(column)
+        payload['categories'] = {'values': categories, **_encode_codes(codes)}
+    if pathway_col is not None:
+        pathways, codes = _codes(df[pathway_col])
+        payload['pathways'] = {'values': pathways, **_encode_codes(codes)}
+    return payload
+
+
+def export_volcano_html(df: pd.DataFrame, filename: Union[path.Path, str], x_col: str = 'log2FoldChange',
+                        y_col: str = '-log10(p-value)', gene_col: str = 'row', padj_col: str = 'padj',
+                        label_col: Optional[str] = 'significance', pathway_col: Optional[str] = None,
+                        title: str = 'Volcano Plot', point_size: float = 3.0) -> path.Path:
+    """
+    Writes an interactive volcano plot as one self-contained HTML file, e.g. from the processed
+    DataFrame of process_data_for_volcanoplot.
+
+    The points are drawn with WebGL in a single draw call, so 100,000 genes pan and zoom smoothly,
+    and the data is embedded as typed arrays (see volcano_payload) so the file stays small.
+    Hovering a point shows its gene, padj and pathways; the mouse wheel zooms and dragging pans.
+    The page has no external scripts, styles or fonts and opens offline.
+
+    Args:
+        df (pd.DataFrame): The genes.
+        filename (Union[pathlib.Path, str]): The HTML file written.
+        x_col (str): Column of the x axis. Defaults to 'log2FoldChange'.
+        y_col (str): Column of the y axis. Defaults to '-log10(p-value)'.
+        gene_col (str): Column of the gene names. Defaults to 'row'.
+        padj_col (str): Column of the adjusted p-values shown on hover. Defaults to 'padj'.
+        label_col (str, optional): Column the points are colored by. Defaults to 'significance'.
+        pathway_col (str, optional): Column of the pathways shown on hover, e.g. 'related pathway'
+            as added by an AnnotationPipeline. Defaults to None.
+        title (str): The title of the page. Defaults to 'Volcano Plot'.
+        point_size (float): The diameter of the points in CSS pixels. Defaults to 3.
+
+    Returns:
+        pathlib.Path: The written file.
+    """
+    payload = volcano_payload(df, x_col, y_col, gene_col, padj_col, label_col, pathway_col)
+    payload['palette'] = PALETTE
+    payload['pointSize'] = point_size
+    # '</' would end the script element early, it is escaped inside the JSON strings
+    data = json.dumps(payload, separators=(',', ':')).replace('</', '<\\/')
+    filename = path.Path(filename)
+    filename.write_text(_TEMPLATE.replace('{title}', html.escape(title)).replace('{data}', data), encoding='utf-8')
+    return filename
+
+
+_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body { margin: 0; font: 13px sans-serif; }
+#plot { position: relative; width: 100vw; height: calc(100vh - 40px); }
+#plot canvas { position: absolute; left: 0; top: 0; width: 100%; height: 100%; }
+#header { height: 40px; display: flex; align-items: center; gap: 16px; padding: 0 12px; }
+#legend span { margin-right: 12px; }
+#legend i { display: inline-block; width: 10px; height: 10px; border-radius: 5px; margin-right: 4px; }
+#tooltip { position: absolute; display: none; pointer-events: none; background: rgba(255,255,255,0.95);
+           border: 1px solid #999; padding: 4px 6px; max-width: 360px; white-space: pre-wrap; }
+</style>
+</head>
+<body>
+<div id="header"><b>{title}</b><div id="legend"></div></div>
+<div id="plot"><canvas id="gl"></canvas><canvas id="axes"></canvas><div id="tooltip"></div></div>
+<script type="application/json" id="volcano-data">{data}</script>
+<script>
+(function () {
+  const data = JSON.parse(document.getElementById('volcano-data').textContent);
+  function decode(text, Type) {
+    const bytes = Uint8Array.from(atob(text), c => c.charCodeAt(0));
+    return new Type(bytes.buffer);
+  }
+  const n = data.n, x = decode(data.x, Float32Array), y = decode(data.y, Float32Array);
+  const padj = decode(data.padj, Float32Array), genes = n ? data.genes.split('\\n') : [];
+  const types = {Int8Array, Int16Array, Int32Array};
+  const category = data.categories ? decode(data.categories.codes, types[data.categories.type]) : new Int8Array(n);
+  const pathway = data.pathways ? decode(data.pathways.codes, types[data.pathways.type]) : null;
+  const margin = {left: 60, right: 20, top: 10, bottom: 45};
+  const glCanvas = document.getElementById('gl'), axesCanvas = document.getElementById('axes');
+  const tooltip = document.getElementById('tooltip');
+
+  let xMin = Infinity, xMax = -Infinity, yMin = Infinity, yMax = -Infinity;
+  for (let i = 0; i < n; i++) {
+    xMin = Math.min(xMin, x[i]); xMax = Math.max(xMax, x[i]);
+    yMin = Math.min(yMin, y[i]); yMax = Math.max(yMax, y[i]);
+  }
+  if (!n) { xMin = yMin = 0; xMax = yMax = 1; }
+  const padX = (xMax - xMin || 1) * 0.05, padY = (yMax - yMin || 1) * 0.05;
+  const home = [xMin - padX, xMax + padX, yMin - padY, yMax + padY];
+  let view = home.slice();
+
+  const legend = document.getElementById('legend');
+  (data.categories ? data.categories.values : []).forEach((label, i) => {
+    const item = document.createElement('span');
+    item.innerHTML = '<i></i>';
+    item.firstChild.style.background = data.palette[i % data.palette.length];
+    item.appendChild(document.createTextNode(label));
+    legend.appendChild(item);
+  });
+
+  const gl = glCanvas.getContext('webgl', {antialias: true});
+  if (!gl) {
+    document.getElementById('plot').textContent = 'This browser does not support WebGL.';
+    return;
+  }
+  function shader(type, source) {
+    const s = gl.createShader(type);
+    gl.shaderSource(s, source);
+    gl.compileShader(s);
+    return s;
+  }
+  const program = gl.createProgram();
+  gl.attachShader(program, shader(gl.VERTEX_SHADER, `
+    attribute vec2 position; attribute float category;
+    uniform vec4 view; uniform float pointSize; uniform vec3 palette[10];
+    varying vec3 color;
+    void main() {
+      vec2 clip = (position - view.xz) / (view.yw - view.xz) * 2.0 - 1.0;
+      gl_Position = vec4(clip, 0.0, 1.0);
+      gl_PointSize = pointSize;
+      color = palette[int(mod(category, 10.0))];
+    }`));
+  gl.attachShader(program, shader(gl.FRAGMENT_SHADER, `
+    precision mediump float; varying vec3 color;
+    void main() {
+      if (length(gl_PointCoord - 0.5) > 0.5) discard;
+      gl_FragColor = vec4(color, 0.8);
+    }`));
+  gl.linkProgram(program);
+  gl.useProgram(program);
+  const positions = new Float32Array(2 * n), categories = new Float32Array(n);
+  for (let i = 0; i < n; i++) { positions[2 * i] = x[i]; positions[2 * i + 1] = y[i]; categories[i] = category[i]; }
+  function attribute(name, values, size) {
+    gl.bindBuffer(gl.ARRAY_BUFFER, gl.createBuffer());
+    gl.bufferData(gl.ARRAY_BUFFER, values, gl.STATIC_DRAW);
+    const location = gl.getAttribLocation(program, name);
+    gl.enableVertexAttribArray(location);
+    gl.vertexAttribPointer(location, size, gl.FLOAT, false, 0, 0);
+  }
+  attribute('position', positions, 2);
+  attribute('category', categories, 1);
+  const rgb = [];
+  data.palette.forEach(hex => { for (let k = 1; k < 7; k += 2) rgb.push(parseInt(hex.substr(k, 2), 16) / 255); });
+  gl.uniform3fv(gl.getUniformLocation(program, 'palette'), rgb);
+  gl.enable(gl.BLEND);
+  gl.blendFunc(gl.SRC_ALPHA, gl.ONE_MINUS_SRC_ALPHA);
+
+  // a uniform grid of the points in data coordinates, so the hovered point is found without a full scan
+  const gridSize = Math.max(1, Math.ceil(Math.sqrt(n / 4)));
+  const cells = new Map();
+  function cellOf(px, py) {
+    const cx = Math.min(gridSize - 1, Math.floor((px - home[0]) / (home[1] - home[0]) * gridSize));
+    const cy = Math.min(gridSize - 1, Math.floor((py - home[2]) / (home[3] - home[2]) * gridSize));
+    return [cx, cy];
+  }
+  for (let i = 0; i < n; i++) {
+    const [cx, cy] = cellOf(x[i], y[i]), key = cx * gridSize + cy;
+    if (!cells.has(key)) cells.set(key, []);
+    cells.get(key).push(i);
+  }
+
+  let width = 0, height = 0;
+  function toScreen(px, py) {
+    const plotW = width - margin.left - margin.right, plotH = height - margin.top - margin.bottom;
+    return [margin.left + (px - view[0]) / (view[1] - view[0]) * plotW,
+            margin.top + (1 - (py - view[2]) / (view[3] - view[2])) * plotH];
+  }
+  function toData(sx, sy) {
+    const plotW = width - margin.left - margin.right, plotH = height - margin.top - margin.bottom;
+    return [view[0] + (sx - margin.left) / plotW * (view[1] - view[0]),
+            view[2] + (1 - (sy - margin.top) / plotH) * (view[3] - view[2])];
+  }
+  function ticks(low, high, count) {
+    const step0 = (high - low) / count, power = Math.pow(10, Math.floor(Math.log10(step0)));
+    const step = [1, 2, 5, 10].map(m => m * power).find(s => s >= step0);
+    const values = [];
+    for (let v = Math.ceil(low / step) * step; v <= high; v += step) values.push(+v.toPrecision(12));
+    return values;
+  }
+  function drawAxes() {
+    const ctx = axesCanvas.getContext('2d'), ratio = window.devicePixelRatio || 1;
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    ctx.clearRect(0, 0, width, height);
+    ctx.fillStyle = '#fff';
+    ctx.fillRect(0, 0, width, margin.top); ctx.fillRect(0, height - margin.bottom, width, margin.bottom);
+    ctx.fillRect(0, 0, margin.left, height); ctx.fillRect(width - margin.right, 0, margin.right, height);
+    ctx.strokeStyle = '#000'; ctx.fillStyle = '#000'; ctx.font = '12px sans-serif';
+    ctx.strokeRect(margin.left, margin.top, width - margin.left - margin.right, height - margin.top - margin.bottom);
+    ctx.textAlign = 'center'; ctx.textBaseline = 'top';
+    ticks(view[0], view[1], 8).forEach(v => {
+      const [sx] = toScreen(v, 0), bottom = height - margin.bottom;
+      ctx.beginPath(); ctx.moveTo(sx, bottom); ctx.lineTo(sx, bottom + 5); ctx.stroke();
+      ctx.fillText(v, sx, bottom + 7);
+    });
+    ctx.fillText(data.labels.xlabel, margin.left + (width - margin.left - margin.right) / 2, height - 18);
+    ctx.textAlign = 'right'; ctx.textBaseline = 'middle';
+    ticks(view[2], view[3], 6).forEach(v => {
+      const [, sy] = toScreen(0, v);
+      ctx.beginPath(); ctx.moveTo(margin.left - 5, sy); ctx.lineTo(margin.left, sy); ctx.stroke();
+      ctx.fillText(v, margin.left - 7, sy);
+    });
+    ctx.save();
+    ctx.translate(14, margin.top + (height - margin.top - margin.bottom) / 2);
+    ctx.rotate(-Math.PI / 2); ctx.textAlign = 'center';
+    ctx.fillText(data.labels.ylabel, 0, 0);
+    ctx.restore();
+  }
+  function draw() {
+    const ratio = window.devicePixelRatio || 1;
+    gl.viewport(margin.left * ratio, margin.bottom * ratio, (width - margin.left - margin.right) * ratio,
+                (height - margin.top - margin.bottom) * ratio);
+    gl.clearColor(1, 1, 1, 1);
+    gl.clear(gl.COLOR_BUFFER_BIT);
+    gl.uniform4f(gl.getUniformLocation(program, 'view'), view[0], view[1], view[2], view[3]);
+    gl.uniform1f(gl.getUniformLocation(program, 'pointSize'), data.pointSize * ratio);
+    gl.drawArrays(gl.POINTS, 0, n);
+    drawAxes();
+  }
+  function resize() {
+    const ratio = window.devicePixelRatio || 1, box = glCanvas.getBoundingClientRect();
+    width = box.width; height = box.height;
+    [glCanvas, axesCanvas].forEach(c => { c.width = width * ratio; c.height = height * ratio; });
+    draw();
+  }
+
+  function nearest(sx, sy) {
+    const radius = Math.max(4, data.pointSize);
+    const [lowX, highY] = toData(sx - radius, sy - radius), [highX, lowY] = toData(sx + radius, sy + radius);
+    const [cx0, cy0] = cellOf(lowX, lowY), [cx1, cy1] = cellOf(highX, highY);
+    let best = -1, bestDistance = radius * radius;
+    for (let cx = Math.max(0, cx0); cx <= Math.min(gridSize - 1, cx1); cx++) {
+      for (let cy = Math.max(0, cy0); cy <= Math.min(gridSize - 1, cy1); cy++) {
+        for (const i of cells.get(cx * gridSize + cy) || []) {
+          const [px, py] = toScreen(x[i], y[i]), d = (px - sx) ** 2 + (py - sy) ** 2;
+          if (d <= bestDistance) { best = i; bestDistance = d; }
+        }
+      }
+    }
+    return best;
+  }
+  let drag = null;
+  axesCanvas.addEventListener('mousedown', e => { drag = [e.offsetX, e.offsetY]; });
+  window.addEventListener('mouseup', () => { drag = null; });
+  axesCanvas.addEventListener('mousemove', e => {
+    if (drag) {
+      const [x0, y0] = toData(drag[0], drag[1]), [x1, y1] = toData(e.offsetX, e.offsetY);
+      view = [view[0] - (x1 - x0), view[1] - (x1 - x0), view[2] - (y1 - y0), view[3] - (y1 - y0)];
+      drag = [e.offsetX, e.offsetY];
+      tooltip.style.display = 'none';
+      draw();
+      return;
+    }
+    const i = nearest(e.offsetX, e.offsetY);
+    if (i < 0) { tooltip.style.display = 'none'; return; }
+    let text = genes[i] + '\\npadj: ' + padj[i].toPrecision(3);
+    if (data.categories && category[i] >= 0) text += '\\n' + data.categories.values[category[i]];
+    if (pathway && data.pathways.values[pathway[i]]) text += '\\npathways: ' + data.pathways.values[pathway[i]];
+    tooltip.textContent = text;
+    tooltip.style.left = (e.offsetX + 12) + 'px';
+    tooltip.style.top = (e.offsetY + 12) + 'px';
+    tooltip.style.display = 'block';
+  });
+  axesCanvas.addEventListener('mouseleave', () => { tooltip.style.display = 'none'; });
+  axesCanvas.addEventListener('wheel', e => {
+    e.preventDefault();
+    const [px, py] = toData(e.offsetX, e.offsetY), scale = Math.exp(e.deltaY * 0.001);
+    view = [px + (view[0] - px) * scale, px + (view[1] - px) * scale,
+            py + (view[2] - py) * scale, py + (view[3] - py) * scale];
+    draw();
+  }, {passive: false});
+  axesCanvas.addEventListener('dblclick', () => { view = home.slice(); draw(); });
+  window.addEventListener('resize', resize);
+  resize();
+})();
+</script>
+</body>
+</html>
+"""
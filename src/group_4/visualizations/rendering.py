@@ -0,0 +1,195 @@
+import time
+import importlib
+import pathlib as path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Union
+
+import matplotlib
+import pandas as pd
+from matplotlib.figure import Figure
+
+from .bar_plot import RNABarPlotter
+from .scatter_plot import ScatterPlotToolkit
+
+RENDER_KINDS = ('volcano', 'bar')
+DEFAULT_OUTPUT_TEMPLATE = '{stem}_{kind}.png'
+VOLCANO_THRESHOLDS = [0.01, 0.05, 0.1]
+VOLCANO_LABELS = ['very significant', 'significant', 'trend', 'non-significant']
+
+
+def _sibling(name: str):
+    """
+    Imports a sibling package (e.g. data_cleaning), both when visualizations is a subpackage of
+    group_4 and when it is imported as a top-level package, like in group_4.py.
+    """
+    parent = __package__.rpartition('.')[0]
+    return importlib.import_module(f'{parent}.{name}' if parent else name)
+
+
+def _use_agg() -> None:
+    """Initializer of the worker processes, the figures are only ever written to files."""
+    matplotlib.use('Agg', force=True)
+
+
+def output_paths(stems: list, output_template: str, kinds=RENDER_KINDS) -> dict:
+    """
+    Fills the output template of every result file and figure kind.
+
+    Args:
+        stems (list): The names of the result files without the suffix.
+        output_template (str): A path with the {stem} and {kind} fields, e.g. 'figures/{stem}/{kind}.svg'.
+            The suffix selects the image format.
+        kinds (tuple): The figure kinds, of RENDER_KINDS. Defaults to all of them.
+
+    Returns:
+        dict: stem -> {kind -> pathlib.Path}.
+
+    Raises:
+        ValueError: If a kind is unknown, or the template gives two figures the same path.
+    """
+    unknown = sorted(set(kinds) - set(RENDER_KINDS))
+    if unknown:
+        raise ValueError(f'unknown figure kinds {unknown}, choose from {RENDER_KINDS}')
+    paths = {stem: {kind: path.Path(output_template.format(stem=stem, kind=kind)) for kind in kinds}
+             for stem in stems}
+    flat = [output for outputs in paths.values() for output in outputs.values()]
+    if len(set(flat)) != len(flat):
+        raise ValueError('the output template must give every figure its own path, use {stem} and {kind}')
+    return paths
+
+
+def load_result_table(filename: Union[path.Path, str], column_name_to_remove: str = 'Unnamed: 0',
+                      **cleaner_kwargs) -> pd.DataFrame:
+    """
+    Reads the genes of a DESeq2 result file that have a name, a fold change and an adjusted p-value.
+
+    Returns:
+        pd.DataFrame: The genes, with a fresh index.
+    """
+    cleaner = _sibling('data_cleaning').DataCleaning(filename, lazy=True, **cleaner_kwargs)
+    if column_name_to_remove in cleaner.columns:
+        cleaner.remove_columns(column_name_to_remove)
+    return cleaner.remove_na(['row', 'log2FoldChange', 'padj']).collect().reset_index(drop=True)
+
+
+def draw_volcano(processed: pd.DataFrame, top_genes: pd.DataFrame, threshold_p: float = 0.05,
+                 threshold_FC: tuple = (-2, 2), figsize: tuple = (10, 6),
+                 non_significant: str = VOLCANO_LABELS[-1]) -> Figure:
+    """
+    Draws a volcano plot processed by process_data_for_volcanoplot on a new Figure that pyplot does
+    not manage. The genes labelled non_significant are drawn as a density image (see
+    ScatterPlotToolkit.plot_density) and the top genes are highlighted and labelled.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    q = ScatterPlotToolkit(figure=Figure(figsize=figsize))
+    significant = processed['significance'] != non_significant
+    q.plot_density(processed, 'log2FoldChange', '-log10(p-value)', significant, color_by='significance',
+                   highlight=top_genes)
+    q.set_significance_lines(threshold_p=threshold_p, threshold_FC=tuple(threshold_FC))
+    q.label_genes(top_genes, 'log2FoldChange', '-log10(p-value)', 'row')
+    return q.fig
+
+
+def volcano_figure(df: pd.DataFrame, n_top: int = 10, threshold_p: float = 0.05,
+                   threshold_FC: tuple = (-2, 2), figsize: tuple = (10, 6)) -> Figure:
+    """
+    Processes a result table with process_data_for_volcanoplot and draws it with draw_volcano,
+    labelling the n_top most significant genes.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    process_data_for_volcanoplot = _sibling('data_processing').process_data_for_volcanoplot
+    processed, top_genes = process_data_for_volcanoplot(df, 'padj', '-log10(p-value)', 'padj', 'significance',
+                                                        VOLCANO_THRESHOLDS, VOLCANO_LABELS, n_top, False)
+    return draw_volcano(processed, top_genes, threshold_p, threshold_FC, figsize)
+
+
+def bar_figure(df: pd.DataFrame, padj_threshold: float = 0.1, top_k: int = 25, n_summary_bins: int = 10) -> Figure:
+    """
+    Draws the bar plot of the top genes below the padj threshold (see RNABarPlotter.plot) on a new
+    Figure that pyplot does not manage.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    fig = Figure()
+    RNABarPlotter(df).plot(padj_threshold, top_k, n_summary_bins, figure=fig, filename=None)
+    return fig
+
+
+def render_result_file(filename: path.Path, outputs: dict, n_top: int = 10, padj_threshold: float = 0.1,
+                       dpi: int = 150, column_name_to_remove: str = 'Unnamed: 0', **cleaner_kwargs) -> tuple:
+    """
+    Renders the figures of one result file, in a worker process of render_result_files.
+
+    Every figure is a matplotlib.figure.Figure drawn on its own Agg canvas, it is never registered
+    with pyplot, and it is cleared once saved, so nothing of it is kept alive between renders.
+
+    Args:
+        filename (pathlib.Path): The result file.
+        outputs (dict): kind -> output path, as given by output_paths.
+
+    Returns:
+        tuple: The file stem, the dict kind -> written path, and the dict kind -> seconds spent drawing
+        and saving the figure.
+    """
+    df = load_result_table(filename, column_name_to_remove, **cleaner_kwargs)
+    written, timings = {}, {}
+    for kind, output in outputs.items():
+        start = time.perf_counter()
+        if kind == 'volcano':
+            fig = volcano_figure(df, n_top=n_top)
+        else:
+            fig = bar_figure(df, padj_threshold=padj_threshold)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        fig.savefig(output, dpi=dpi)
+        fig.clear()
+        written[kind] = output
+        timings[kind] = time.perf_counter() - start
+    return path.Path(filename).stem, written, timings
+
+
+def render_result_files(source, output_template: str = DEFAULT_OUTPUT_TEMPLATE, kinds=RENDER_KINDS,
+                        n_top: int = 10, padj_threshold: float = 0.1, dpi: int = 150,
+                        column_name_to_remove: str = 'Unnamed: 0', max_workers: Optional[int] = None,
+                        **cleaner_kwargs) -> tuple:
+    """
+    Renders the volcano and bar plots of many DESeq2 result files (e.g. one per contrast) in parallel.
+
+    Every file is loaded and drawn in a process of a ProcessPoolExecutor whose workers use the
+    non-interactive Agg backend, and the figures are built with the object-oriented Figure API,
+    so no window is opened and no global pyplot state is shared or grows between renders.
+
+    Args:
+        source: A directory, a glob pattern or a list of result files (see find_result_files).
+        output_template (str): The path of every figure, with the {stem} (file name without the suffix)
+            and {kind} fields. Defaults to '{stem}_{kind}.png'.
+        kinds (tuple): The figures to draw, of 'volcano' and 'bar'. Defaults to both.
+        n_top (int): Number of genes labelled on the volcano plots. Defaults to 10.
+        padj_threshold (float): The genes below it are drawn on the bar plots, the 25 most up and down
+            regulated as bars and the others in 10 summary bars. Defaults to 0.1.
+        dpi (int): Resolution of the raster formats. Defaults to 150.
+        column_name_to_remove (str): Column dropped from the result files. Defaults to 'Unnamed: 0'.
+        max_workers (int, optional): Number of processes. Defaults to the number of CPUs.
+        **cleaner_kwargs: Passed to DataCleaning (e.g. memory_map=True or compact=True).
+
+    Returns:
+        tuple: A dict file stem -> {kind -> written path}, and a dict file stem -> {kind -> seconds
+        spent drawing and saving the figure}, both in the order of the files.
+
+    Raises:
+        ValueError: If no file is found, a kind is unknown, or two figures would get the same path.
+    """
+    files = _sibling('data_cleaning.batch_cleaning').find_result_files(source)
+    paths = output_paths([f.stem for f in files], output_template, kinds)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_use_agg) as executor:
+        futures = [executor.submit(render_result_file, filename, paths[filename.stem], n_top, padj_threshold, dpi,
+                                   column_name_to_remove, **cleaner_kwargs)
+                   for filename in files]
+        results = [future.result() for future in futures]
+    written = {stem: outputs for stem, outputs, _ in results}
+    timings = {stem: seconds for stem, _, seconds in results}
+    return written, timings
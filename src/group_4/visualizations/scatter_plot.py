@@ -2,19 +2,57 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm
+from matplotlib.font_manager import FontProperties
+
+def _value_range(values: np.ndarray) -> tuple:
+    """The (min, max) of the values, widened when they are all equal, for np.histogram2d."""
+    low, high = values.min(), values.max()
+    return (low, high) if low < high else (low - 0.5, high + 0.5)
+
+
+class _LabelGrid:
+    """A uniform grid of boxes in display coordinates, to find the boxes near a new one quickly."""
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cells(self, x0, y0, x1, y1):
+        for ix in range(int(x0 // self.cell_size), int(x1 // self.cell_size) + 1):
+            for iy in range(int(y0 // self.cell_size), int(y1 // self.cell_size) + 1):
+                yield ix, iy
+
+    def add(self, x0, y0, x1, y1):
+        for cell in self._cells(x0, y0, x1, y1):
+            self.cells.setdefault(cell, []).append((x0, y0, x1, y1))
+
+    def collides(self, x0, y0, x1, y1) -> bool:
+        for cell in self._cells(x0, y0, x1, y1):
+            for bx0, by0, bx1, by1 in self.cells.get(cell, ()):
+                if x0 <= bx1 and bx0 <= x1 and y0 <= by1 and by0 <= y1:
+                    return True
+        return False
+
 
 class ScatterPlotToolkit:
     """_summary_
     """
-    def __init__(self, title='Scatter Plot', xlabel='log2(Fold Change)', ylabel='-log10(p-value)'):
+    def __init__(self, title='Scatter Plot', xlabel='log2(Fold Change)', ylabel='-log10(p-value)', figure=None):
         """_summary_
 
         Args:
             title (str, optional): _description_. Defaults to 'Volcano Plot'.
             xlabel (str, optional): _description_. Defaults to 'log2(Fold Change)'.
             ylabel (str, optional): _description_. Defaults to '-log10(p-value)'.
+            figure (matplotlib.figure.Figure, optional): The figure to draw on, e.g. one built without
+                pyplot so it is not kept by pyplot after use. Defaults to a new pyplot figure.
         """
-        self.fig, self.axs = plt.subplots()  # Create figure and axes
+        if figure is None:
+            self.fig, self.axs = plt.subplots()  # Create figure and axes
+        else:
+            self.fig, self.axs = figure, figure.subplots()
         self.title = title
         self.xlabel = xlabel
         self.ylabel = ylabel
@@ -60,23 +98,133 @@ class ScatterPlotToolkit:
     def color_by(self, data: pd.DataFrame, x_col, y_col, color_by: str = 'None'):
         sns.scatterplot(data = data, x = x_col, y = y_col, hue = color_by, ax = self.axs)
 
-    def label_genes(self, genes_df, x_col, y_col, label_col, **kwargs):
+    def plot_density(self, data: pd.DataFrame, x_col, y_col, significant, color_by: str = None,
+                     highlight: pd.DataFrame = None, bins: tuple = (300, 200), cmap: str = 'Greys'):
+        """
+        Draws a volcano plot whose cost does not grow with the number of genes, in place of plot + color_by.
+
+        The genes that are not significant are binned into a 2D histogram drawn as one raster image
+        (log scaled counts), so they cost the same for 1,000 or 1,000,000 genes, also in SVG and PDF
+        output. Only the significant genes, and the highlighted ones, are drawn as vector points.
+
+        Args:
+            data (pd.DataFrame): The genes.
+            x_col: Column name for the x-axis data.
+            y_col: Column name for the y-axis data.
+            significant (str or array-like of bool): A boolean column name or mask of the genes drawn as points.
+            color_by (str, optional): Column the points are colored by, as in color_by. Defaults to None.
+            highlight (pd.DataFrame, optional): Extra genes drawn as points (e.g. the top genes). Defaults to None.
+            bins (tuple, optional): Number of (x, y) bins of the density layer. Defaults to (300, 200).
+            cmap (str, optional): Colormap of the density layer. Defaults to 'Greys'.
+        """
+        mask = data[significant] if isinstance(significant, str) else significant
+        mask = np.asarray(mask, dtype=bool)
+        x = data[x_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        y = data[y_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        finite = np.isfinite(x) & np.isfinite(y)
+        background = finite & ~mask
+        if background.any():
+            # the bins span all the genes, so the density layer and the points share the axes
+            counts, x_edges, y_edges = np.histogram2d(x[background], y[background], bins=bins,
+                                                      range=[_value_range(x[finite]), _value_range(y[finite])])
+            image = self.axs.imshow(np.ma.masked_equal(counts.T, 0), origin='lower', aspect='auto', cmap=cmap,
+                                    norm=LogNorm(), extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]),
+                                    interpolation='nearest', rasterized=True, zorder=0)
+            # keep the usual margins around the data, as with scatter points only
+            image.sticky_edges.x[:] = []
+            image.sticky_edges.y[:] = []
+        points = data[mask & finite]
+        if color_by is not None and isinstance(points[color_by].dtype, pd.CategoricalDtype):
+            points = points.assign(**{color_by: points[color_by].cat.remove_unused_categories()})
+        if len(points):
+            sns.scatterplot(data=points, x=x_col, y=y_col, hue=color_by, ax=self.axs, zorder=1)
+        if highlight is not None and len(highlight):
+            self.axs.scatter(highlight[x_col], highlight[y_col], facecolors='none', edgecolors='black', zorder=2)
+        self.axs.autoscale_view()
+
+    def label_genes(self, genes_df, x_col, y_col, label_col, max_labels: int = None, priority_col: str = None,
+                    avoid_overlap: bool = True, max_distance: int = 4, crowded: str = 'leader', **kwargs):
         """
         Labels specific genes on the plot.
 
+        The columns are read as NumPy arrays once. With avoid_overlap, every label is placed next to
+        its gene at the first free spot among positions at growing distances, in the order of the
+        priority. The labels already placed are kept in a spatial grid of about one label per cell,
+        so a collision test only looks at the neighbouring cells and the whole pass stays linear in
+        the number of labels. Labels that end up away from their gene get a leader line. A label
+        without a free spot is drawn just beyond max_distance with a leader line, where it may overlap
+        other labels, or left out with crowded='skip'. Call it after the data is drawn and the axes
+        limits are set, the placement is computed in display coordinates.
+
         Parameters:
         - genes_df: DataFrame containing the gene data with columns for x, y, and labels.
         - x_col: Column name for the x-axis data.
         - y_col: Column name for the y-axis data.
         - label_col: Column name for the gene labels.
+        - max_labels: The largest number of labels drawn, by priority. Defaults to all of them.
+        - priority_col: Column ranking the genes, the highest values are labelled first.
+          Defaults to the order of genes_df.
+        - avoid_overlap: Move labels so they do not overlap each other or the labelled genes. Defaults to True.
+        - max_distance: How many label sizes away from its gene a label may be moved. Defaults to 4.
+        - crowded: What happens to a label without a free spot, 'leader' draws it anyway and 'skip'
+          leaves it out, so no label overlaps. Defaults to 'leader'.
         - **kwargs: Additional keyword arguments passed to plt.text.
+
+        Returns:
+        - The list of the drawn text artists.
         """
-        for i in range(genes_df.shape[0]):
-            self.axs.text(
-                genes_df[x_col].iloc[i], 
-                genes_df[y_col].iloc[i], 
-                genes_df[label_col].iloc[i],
-                **kwargs)  # Allows for customization of text appearance, such as fontsize, color, etc.
+        if crowded not in ('leader', 'skip'):
+            raise ValueError("crowded must be 'leader' or 'skip'.")
+        x = genes_df[x_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        y = genes_df[y_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        labels = genes_df[label_col].astype(str).to_numpy(dtype=str)
+        order = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        if priority_col is not None:
+            priority = genes_df[priority_col].to_numpy(dtype=np.float64, na_value=-np.inf)[order]
+            order = order[np.argsort(-priority, kind='stable')]
+        if max_labels is not None:
+            order = order[:max_labels]
+        if not avoid_overlap:
+            return [self.axs.text(x[i], y[i], labels[i], **kwargs) for i in order]
+
+        points = self.axs.transData.transform(np.column_stack([x[order], y[order]]))
+        size = FontProperties(size=kwargs.get('fontsize', kwargs.get('size'))).get_size_in_points()
+        pixels = size * self.fig.dpi / 72
+        # an estimate of the text extent, measuring every text with the renderer would be far slower
+        widths = np.char.str_len(labels[order]) * 0.6 * pixels + 4
+        height = 1.2 * pixels + 4
+        grid = _LabelGrid(max(widths.max(initial=1), height))
+        for point in points:
+            grid.add(point[0], point[1], point[0], point[1])
+        directions = [(1, 1), (-1, 1), (1, -1), (-1, -1), (1, 0), (-1, 0), (0, 1), (0, -1)]
+        texts, leaders = [], []
+        to_data = self.axs.transData.inverted()
+        for (px, py), width, i in zip(points, widths, order):
+            for distance in range(1, max_distance + 1):
+                for ux, uy in directions:
+                    cx = px + ux * distance * (width / 2 + 2)
+                    cy = py + uy * distance * (height / 2 + 2)
+                    box = (cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2)
+                    if not grid.collides(*box):
+                        break
+                else:
+                    continue
+                break
+            else:
+                if crowded == 'skip':
+                    continue
+                # no free spot, the label goes just beyond the searched positions, above right of its gene
+                distance = max_distance + 1
+                cx, cy = px + distance * (width / 2 + 2), py + distance * (height / 2 + 2)
+                box = (cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2)
+            grid.add(*box)
+            tx, ty = to_data.transform((cx, cy))
+            texts.append(self.axs.text(tx, ty, labels[i], **{'ha': 'center', 'va': 'center', **kwargs}))
+            if distance > 1:
+                leaders.append([(x[i], y[i]), (tx, ty)])
+        if leaders:
+            self.axs.add_collection(LineCollection(leaders, colors='gray', linewidths=0.5, zorder=1.5), autolim=False)
+        return texts
     
     def set_size(self, figsize: tuple = (10, 6)):
         """
@@ -1,10 +1,43 @@
 """Main module."""
 from group_4.data_cleaning import DataCleaning, create_test_df, filter_protein_coding_genes
-from group_4.data_processing import enrich_gene, scrape_for_pathway, process_data_for_volcanoplot
-from group_4.visualizations import RNABarPlotter, ScatterPlotToolkit
+from group_4.data_cleaning import cache_xlsx_as_parquet, read_columnar, compact_dtypes, clean_files, GeneReferenceStore
+from group_4.data_cleaning import GeneAliasIndex
+from group_4.data_cleaning.batch_cleaning import find_result_files
+from group_4.data_processing import enrich_gene, scrape_for_pathway, process_data_for_volcanoplot, scrape_for_pathways
+from group_4.visualizations import RNABarPlotter, ScatterPlotToolkit, render_result_files, export_volcano_html
+from group_4.visualizations.rendering import output_paths, render_result_file
+from group_4.visualizations.html_export import volcano_payload
+from group_4.pipeline import Pipeline, Stage, stage_kinds, load_config
+from group_4.pipeline import main as pipeline_main
+from group_4.data_processing import EnrichmentCache, LibraryCatalog, LocalGeneSetLibrary
+from group_4.data_processing import (PathwaySource, ReactomeHTMLSource, ReactomeContentServiceSource,
+                                     FallbackPathwaySource, ResponseCache, get_pathway_source)
+from group_4.data_processing import AnnotationPipeline, AnnotationCheckpoint, Annotator, FunctionAnnotator, EnrichrAnnotator
+from group_4.data_processing import PathwaySourceAnnotator
+from group_4.data_processing import HttpClient, CircuitBreaker, RequestFailed, AnnotationFailure
+from group_4.data_processing.http_client import parse_retry_after
+from group_4.data_processing.visualization_pre_processing import identify_top_n_values, minus_log10, minus_log10_col, validate_p_vals
+import group_4.data_processing.gseapy_processing as gseapy_processing
 
 import pathlib as path
+import pandas as pd
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import pytest
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import http.server
+import urllib.parse
+import json
+import os
+import subprocess
+import sys
+import requests
+from requests.exceptions import RequestException
+from scipy.stats import hypergeom
 
 #test for file validity - that it can accept the file
 # check that it removes the nan completly
@@ -224,8 +257,1285 @@ def test_get_mouse_gene_sets():
 test_get_mouse_gene_sets()
 
 
+################ test for the enrichment cache ################
 
+class StubEnrichr:
+    """Stands in for gp.enrichr so the enrichment tests do not need the network"""
+    def __init__(self):
+        self.calls = 0
 
+    def __call__(self, gene_list, gene_sets, organism, outdir):
+        self.calls += 1
+        class Result:
+            results = pd.DataFrame({'Term': [f'{gene_list[0]} pathway']})
+        return Result()
 
+@pytest.fixture
+def stub_enrichr(monkeypatch):
+    stub = StubEnrichr()
+    monkeypatch.setattr(gseapy_processing.gp, 'enrichr', stub)
+    monkeypatch.setattr(gseapy_processing, 'get_mouse_gene_sets', lambda: ['KEGG_2019_Mouse'])
+    return stub
 
+def test_enrich_gene_warm_cache_skips_network(stub_enrichr, tmp_path):
+    """check that a second run over the same genes is answered from the cache"""
+    with EnrichmentCache(tmp_path / 'cache.sqlite') as cache:
+        first = [gseapy_processing.enrich_gene(gene, cache=cache) for gene in ['Cdk8', 'Actb']]
+    with EnrichmentCache(tmp_path / 'cache.sqlite') as cache:
+        second = [gseapy_processing.enrich_gene(gene, cache=cache) for gene in ['Cdk8', 'Actb']]
+        assert cache.stats() == {'hits': 2, 'misses': 0, 'size': 2}
+    assert first == second == [['Cdk8 pathway'], ['Actb pathway']]
+    assert stub_enrichr.calls == 2
 
+def test_warm_cache_does_not_resolve_the_library_list(stub_enrichr, monkeypatch, tmp_path):
+    """check that cached genes are answered without fetching the default library list"""
+    with EnrichmentCache(tmp_path / 'cache.sqlite') as cache:
+        for gene in ['Cdk8', 'Actb']:
+            gseapy_processing.enrich_gene(gene, cache=cache)
+        monkeypatch.setattr(gseapy_processing, 'get_mouse_gene_sets', lambda: pytest.fail('library list fetched'))
+        assert gseapy_processing.enrich_gene('Cdk8', cache=cache) == ['Cdk8 pathway']
+        assert gseapy_processing.enrich_genes(['Actb', 'Cdk8'], cache=cache) == [['Actb pathway'], ['Cdk8 pathway']]
+
+def test_enrichment_cache_key_depends_on_libraries(tmp_path):
+    """check that the same gene against other libraries is a different entry"""
+    with EnrichmentCache(tmp_path / 'cache.sqlite') as cache:
+        cache.set('Cdk8', ['a', 'b'], 'Mouse', ['pathway'])
+        assert cache.get('Cdk8', ['b', 'a'], 'Mouse') == ['pathway']
+        assert cache.get('Cdk8', ['a'], 'Mouse') is None
+        assert cache.get('Cdk8', ['a', 'b'], 'Human') is None
+
+def test_enrichment_cache_ttl(tmp_path, monkeypatch):
+    """check that expired entries are misses"""
+    with EnrichmentCache(tmp_path / 'cache.sqlite', ttl=10) as cache:
+        cache.set('Cdk8', ['a'], 'Mouse', ['pathway'])
+        later = time.time() + 11
+        monkeypatch.setattr(time, 'time', lambda: later)
+        assert cache.get('Cdk8', ['a'], 'Mouse') is None
+        assert cache.misses == 1
+
+def test_enrichment_cache_lru_eviction(tmp_path):
+    """check that the least recently used entry is evicted once the cache is full"""
+    with EnrichmentCache(tmp_path / 'cache.sqlite', max_entries=2) as cache:
+        cache.set('a', [], 'Mouse', [1])
+        cache.set('b', [], 'Mouse', [2])
+        cache.get('a', [], 'Mouse')
+        cache.set('c', [], 'Mouse', [3])
+        assert len(cache) == 2
+        assert cache.get('b', [], 'Mouse') is None
+        assert cache.get('a', [], 'Mouse') == [1]
+
+
+################ test for the library catalog ################
+
+def test_library_catalog_fetches_once(monkeypatch, tmp_path):
+    """check that the library list is fetched once and then reused from memory and from disk"""
+    calls = []
+    def stub_get_library_name():
+        calls.append(1)
+        return ['KEGG_2019_Mouse', 'KEGG_2019_Human', 'WikiPathways_2019_Mouse']
+    monkeypatch.setattr(gseapy_processing.gp, 'get_library_name', stub_get_library_name)
+    catalog = LibraryCatalog('Mouse', cache_file=tmp_path / 'libraries.json')
+    assert catalog.libraries() == ['KEGG_2019_Mouse', 'WikiPathways_2019_Mouse']
+    assert catalog.libraries() == ['KEGG_2019_Mouse', 'WikiPathways_2019_Mouse']
+    assert LibraryCatalog('Mouse', cache_file=tmp_path / 'libraries.json').libraries() == ['KEGG_2019_Mouse', 'WikiPathways_2019_Mouse']
+    assert len(calls) == 1
+
+def test_library_catalog_pinned(monkeypatch):
+    """check that a pinned subset is used without the network"""
+    monkeypatch.setattr(gseapy_processing.gp, 'get_library_name', lambda: pytest.fail('network used'))
+    assert LibraryCatalog(pinned=['KEGG_2019_Mouse']).libraries() == ['KEGG_2019_Mouse']
+    with pytest.raises(ValueError):
+        LibraryCatalog(pinned=[])
+
+def test_enrich_gene_uses_given_gene_sets(stub_enrichr, monkeypatch):
+    """check that enrich_gene does not resolve the libraries when they are passed in"""
+    monkeypatch.setattr(gseapy_processing, 'get_mouse_gene_sets', lambda: pytest.fail('libraries resolved per gene'))
+    assert gseapy_processing.enrich_gene('Cdk8', gene_sets=['KEGG_2019_Mouse']) == ['Cdk8 pathway']
+
+
+################ test for batched enrichment ################
+
+class StubBatchEnrichr:
+    """Stands in for gp.enrichr, every gene belongs to its own pathway and to a shared one"""
+    def __init__(self):
+        self.submissions = []
+
+    def __call__(self, gene_list, gene_sets, organism, outdir):
+        self.submissions.append(list(gene_list))
+        known = [gene for gene in gene_list if gene != 'Unknown']
+        class Result:
+            results = pd.DataFrame({
+                'Term': [f'{gene} pathway' for gene in known] + ['shared pathway'],
+                'Genes': [gene.upper() for gene in known] + [';'.join(gene.upper() for gene in known)]})
+        return Result()
+
+def test_enrich_genes_batches(monkeypatch):
+    """check that genes are submitted in batches and each gets its own terms back"""
+    stub = StubBatchEnrichr()
+    monkeypatch.setattr(gseapy_processing.gp, 'enrichr', stub)
+    genes = ['Cdk8', 'Actb', 'Unknown', 'Cdk8', 'Gapdh']
+    result = gseapy_processing.enrich_genes(genes, batch_size=2, gene_sets=['KEGG_2019_Mouse'])
+    assert sorted(map(len, stub.submissions)) == [2, 2]
+    assert result[0] == result[3] == ['Cdk8 pathway', 'shared pathway']
+    assert result[2] == 'No related pathways found'
+    assert result[4] == ['Gapdh pathway', 'shared pathway']
+
+def test_enrich_genes_skips_cached_genes(monkeypatch, tmp_path):
+    """check that only genes missing from the cache are submitted"""
+    stub = StubBatchEnrichr()
+    monkeypatch.setattr(gseapy_processing.gp, 'enrichr', stub)
+    with EnrichmentCache(tmp_path / 'cache.sqlite') as cache:
+        cache.set('Cdk8', ['KEGG_2019_Mouse'], 'Mouse', ['cached pathway'])
+        result = gseapy_processing.enrich_genes(['Cdk8', 'Actb'], gene_sets=['KEGG_2019_Mouse'], cache=cache)
+    assert stub.submissions == [['Actb']]
+    assert result == [['cached pathway'], ['Actb pathway', 'shared pathway']]
+
+def test_enrich_genes_invalid_batch_size():
+    with pytest.raises(ValueError, match="batch_size must be a positive integer"):
+        gseapy_processing.enrich_genes(['Cdk8'], batch_size=0, gene_sets=['KEGG_2019_Mouse'])
+
+
+################ test for the local GMT enrichment ################
+
+@pytest.fixture
+def gmt_directory(tmp_path):
+    (tmp_path / 'KEGG_Mouse.gmt').write_text(
+        'Cell cycle\t\tCdk1\tCdk2\tCcnb1\n'
+        'Apoptosis\t\tCasp3\tBax\tCdk1\n')
+    (tmp_path / 'Reactome_Mouse.gmt').write_text(
+        'Mitotic G1 phase\tdescription\tCDK2\tCCND1\n')
+    return tmp_path
+
+def test_local_library_gene_lookup(gmt_directory):
+    """check the gene to pathway lookups of the inverted index"""
+    library = LocalGeneSetLibrary.from_directory(gmt_directory)
+    assert len(library) == 3
+    assert library.pathways_for_gene('Cdk1') == ['Cell cycle', 'Apoptosis']
+    assert library.pathways_for_gene('cdk2') == ['Cell cycle', 'Mitotic G1 phase']
+    assert library.pathways_for_genes(['Ccnd1', 'Actb']) == [['Mitotic G1 phase'], 'No related pathways found']
+
+def test_local_library_enrich(gmt_directory):
+    """check the hypergeometric test against scipy, one set at a time"""
+    library = LocalGeneSetLibrary.from_directory(gmt_directory)
+    results = library.enrich(['Cdk1', 'Cdk2', 'Actb'])
+    cell_cycle = results.set_index('Term').loc['Cell cycle']
+    # 6 genes in the libraries, 3 in the set, 2 known query genes, both in the set
+    assert cell_cycle['Overlap'] == '2/3'
+    assert cell_cycle['P-value'] == pytest.approx(hypergeom.sf(1, 6, 3, 2))
+    assert sorted(cell_cycle['Genes'].split(';')) == ['CDK1', 'CDK2']
+    assert list(results['Term']) == ['Cell cycle', 'Mitotic G1 phase', 'Apoptosis']
+    assert (results['Adjusted P-value'] >= results['P-value']).all()
+
+def test_local_library_missing_directory(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        LocalGeneSetLibrary.from_directory(tmp_path)
+
+
+################ test for the concurrent scraper ################
+
+class StubReactomeHandler(http.server.BaseHTTPRequestHandler):
+    """Serves minimal reactome.org search and pathway pages"""
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        gene = urllib.parse.parse_qs(url.query).get('q', [''])[0]
+        if url.path == '/content/query' and gene == 'Missing':
+            page = f'<p>No results found for {gene}</p>'
+        elif url.path == '/content/query' and gene == 'Forbidden':
+            self.send_response(403)
+            self.end_headers()
+            return
+        elif url.path == '/content/query':
+            page = f'<div class="result-title"><a href="detail/{gene}">{gene}</a></div>'
+        elif url.path.startswith('/content/detail/'):
+            gene = url.path.rsplit('/', 1)[-1]
+            page = (f'<fieldset class="fieldset-details"><div><span>{gene} signalling</span>'
+                    f'<div><span>{gene} metabolism</span></div></div></fieldset>')
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(page.encode())
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_reactome():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubReactomeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+def test_scrape_for_pathways_keeps_input_order(stub_reactome):
+    genes = ['Cdk8', 'Missing', 'Actb', 'Gapdh']
+    result = scrape_for_pathways(genes, concurrency=2, base_url=stub_reactome)
+    assert result == [scrape_for_pathway(gene, base_url=stub_reactome) for gene in genes]
+    assert result[0] == ['Cdk8 signalling', 'Cdk8 metabolism']
+    assert result[1] == []
+
+def test_scrape_for_pathways_rate_limit(stub_reactome):
+    start = time.monotonic()
+    scrape_for_pathways(['Cdk8', 'Actb'], requests_per_second=20, base_url=stub_reactome)
+    # 4 requests to the same host at 20 per second take at least 3 intervals
+    assert time.monotonic() - start >= 3 / 20
+
+def test_html_source_rate_limits_single_gene_lookups(stub_reactome):
+    """check that the rate limit also holds for the per-gene lookups of the annotation pipeline threads"""
+    source = ReactomeHTMLSource(base_url=stub_reactome, requests_per_second=20)
+    start = time.monotonic()
+    assert PathwaySource.pathways_for_genes(source, ['Cdk8', 'Actb'], max_workers=2)[0] == ['Cdk8 signalling', 'Cdk8 metabolism']
+    assert time.monotonic() - start >= 3 / 20
+
+def test_scrape_for_pathways_reports_failed_genes(stub_reactome):
+    """check that a gene whose requests keep failing does not abort the other genes"""
+    class UnavailableFor:
+        def __init__(self, gene):
+            self.gene, self.client = gene, HttpClient()
+        def get(self, url, **kwargs):
+            if self.gene in url:
+                raise RequestFailed(url, 503, 5, 'HTTP 503')
+            return self.client.get(url, **kwargs)
+    result = scrape_for_pathways(['Cdk8', 'Actb'], base_url=stub_reactome, client=UnavailableFor('Actb'))
+    assert result[0] == ['Cdk8 signalling', 'Cdk8 metabolism']
+    assert isinstance(result[1], AnnotationFailure) and result[1].gene == 'Actb' and '503' in result[1].reason
+
+def test_scrape_for_pathways_invalid_input():
+    with pytest.raises(TypeError):
+        scrape_for_pathways(['Cdk8', 2])
+    with pytest.raises(ValueError):
+        scrape_for_pathways(['Cdk8'], concurrency=0)
+
+
+################ test for the pathway sources ################
+
+class StubContentServiceHandler(http.server.BaseHTTPRequestHandler):
+    """Serves minimal Reactome ContentService search and pathway responses, with an ETag"""
+    requests = []
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        StubContentServiceHandler.requests.append((url.path, self.headers.get('If-None-Match')))
+        if url.path == '/ContentService/search/query':
+            gene = urllib.parse.parse_qs(url.query)['query'][0]
+            if gene in ('Missing', 'Forbidden'):
+                self.send_response(404 if gene == 'Missing' else 403)
+                self.end_headers()
+                return
+            body = {'results': [{'entries': [{'stId': f'R-MMU-{gene}'}]}]}
+        elif url.path.startswith('/ContentService/data/pathways/low/entity/'):
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            st_id = url.path.rsplit('/', 1)[-1]
+            body = [{'displayName': f'{st_id} signalling'}, {'displayName': f'{st_id} metabolism'}]
+        else:
+            self.send_response(500)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_content_service():
+    StubContentServiceHandler.requests = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubContentServiceHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+def test_content_service_source(stub_content_service):
+    source = ReactomeContentServiceSource(base_url=stub_content_service)
+    assert source.pathways('Cdk8') == ['R-MMU-Cdk8 signalling', 'R-MMU-Cdk8 metabolism']
+    assert source.pathways('Missing') == []
+    assert source.pathways_for_genes(['Missing', 'Actb']) == [[], ['R-MMU-Actb signalling', 'R-MMU-Actb metabolism']]
+
+def test_unexpected_status_is_a_failure(stub_content_service, stub_reactome):
+    """check that a 4xx answer that is not retried is a failure, not a gene without pathways"""
+    failure = ReactomeContentServiceSource(base_url=stub_content_service).pathways('Forbidden')
+    assert isinstance(failure, AnnotationFailure) and failure.reason.startswith('HTTP 403')
+    assert isinstance(scrape_for_pathway('Forbidden', base_url=stub_reactome), AnnotationFailure)
+    assert isinstance(scrape_for_pathways(['Forbidden', 'Cdk8'], base_url=stub_reactome)[0], AnnotationFailure)
+    fallback = FallbackPathwaySource([ReactomeContentServiceSource(base_url=stub_content_service),
+                                      ReactomeHTMLSource(base_url=stub_reactome)])
+    pipeline = AnnotationPipeline([PathwaySourceAnnotator(fallback)])
+    df = pipeline.run(pd.DataFrame({'row': ['Forbidden', 'Missing']}))
+    assert df['related pathway'].iloc[0] is None and df['related pathway'].iloc[1] == []
+    assert [(failure.gene, failure.source) for failure in pipeline.failures] == [('Forbidden', 'reactome_html')]
+
+def test_response_cache_concurrent_stores(tmp_path):
+    """check that threads storing the same url do not share a temporary file"""
+    cache = ResponseCache(tmp_path)
+    url = 'https://reactome.org/ContentService/data/pathways/low/entity/R-MMU-1'
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda i: cache._store(url, {'ETag': f'"v{i}"'}, b'x' * 100000), range(32)))
+    meta, body = cache._load(url)
+    assert body == b'x' * 100000 and meta['url'] == url
+    assert not list(tmp_path.glob('*.tmp'))
+
+def test_response_cache_revalidates(stub_content_service, tmp_path):
+    """check that a cached response is revalidated with its ETag and reused on 304"""
+    source = ReactomeContentServiceSource(base_url=stub_content_service, cache=ResponseCache(tmp_path))
+    first = source.pathways('Cdk8')
+    assert source.pathways('Cdk8') == first
+    pathway_requests = [etag for url, etag in StubContentServiceHandler.requests if 'pathways' in url]
+    assert pathway_requests == [None, '"v1"']
+
+def test_fallback_source(stub_content_service):
+    """check that the next backend is used only when the first one fails"""
+    class BrokenSource(PathwaySource):
+        def pathways(self, gene_name):
+            raise RequestException('upstream down')
+    working = ReactomeContentServiceSource(base_url=stub_content_service)
+    assert FallbackPathwaySource([BrokenSource(), working]).pathways('Cdk8') == working.pathways('Cdk8')
+    with pytest.raises(ValueError):
+        get_pathway_source('kegg')
+    assert isinstance(get_pathway_source('reactome_html'), ReactomeHTMLSource)
+
+
+################ test for the annotation pipeline ################
+
+class RecordingAnnotator(Annotator):
+    """Annotates a gene with its lower case name and records the batches it was given"""
+    def __init__(self, column, batch_size=1):
+        self.column = column
+        self.batch_size = batch_size
+        self.batches = []
+
+    def annotate_batch(self, genes):
+        self.batches.append(list(genes))
+        return [gene.lower() for gene in genes]
+
+def test_annotation_pipeline_dedups_and_joins():
+    """check that duplicate genes are annotated once and every backend fills its own column"""
+    df = pd.DataFrame({'row': ['Cdk8', 'Actb', 'Cdk8', 'Gapdh']})
+    per_gene = RecordingAnnotator('related pathway')
+    batched = RecordingAnnotator('complex related pathway', batch_size=2)
+    result = AnnotationPipeline([per_gene, batched], max_workers=4).run(df)
+    assert sorted(sum(per_gene.batches, [])) == ['Actb', 'Cdk8', 'Gapdh']
+    assert sorted(map(len, batched.batches)) == [1, 2]
+    assert list(result['related pathway']) == ['cdk8', 'actb', 'cdk8', 'gapdh']
+    assert list(result['complex related pathway']) == list(result['related pathway'])
+
+def test_annotation_pipeline_function_annotator():
+    df = pd.DataFrame({'row': ['Cdk8', 'Actb']})
+    pipeline = AnnotationPipeline([FunctionAnnotator('length', len)])
+    assert list(pipeline.run(df)['length']) == [4, 4]
+
+def test_annotation_pipeline_invalid_input():
+    with pytest.raises(ValueError):
+        AnnotationPipeline([])
+    with pytest.raises(ValueError):
+        AnnotationPipeline([RecordingAnnotator('a'), RecordingAnnotator('a')])
+    with pytest.raises(KeyError):
+        AnnotationPipeline([RecordingAnnotator('a')]).run(pd.DataFrame({'gene': ['Cdk8']}))
+
+
+################ test for checkpointed annotation ################
+
+def test_annotation_pipeline_resumes_from_checkpoint(tmp_path):
+    """check that a restarted run only annotates the genes missing from the checkpoint"""
+    checkpoint = AnnotationCheckpoint(tmp_path / 'checkpoint.jsonl')
+    second = RecordingAnnotator('related pathway')
+    pipeline = AnnotationPipeline([second], checkpoint=checkpoint)
+    # an interrupted run finished two genes, and crashed in the middle of writing a batch
+    checkpoint.open(pipeline.fingerprint())
+    checkpoint.append('related pathway', ['Cdk8', 'Actb'], ['cdk8', 'actb'])
+    with open(checkpoint.path, 'a') as f:
+        f.write('{"column": "related pathway", "genes": ["Gap')
+    result = pipeline.run(pd.DataFrame({'row': ['Cdk8', 'Actb', 'Gapdh']}))
+    assert second.batches == [['Gapdh']]
+    assert list(result['related pathway']) == ['cdk8', 'actb', 'gapdh']
+    # a complete run removes its checkpoint, the next run starts over
+    assert not checkpoint.path.exists()
+
+def test_annotation_checkpoint_is_per_column(tmp_path):
+    """check that genes done by one backend are still annotated by the others"""
+    checkpoint = AnnotationCheckpoint(tmp_path / 'checkpoint.jsonl')
+    other = RecordingAnnotator('complex related pathway')
+    pipeline = AnnotationPipeline([RecordingAnnotator('related pathway'), other], checkpoint=checkpoint)
+    checkpoint.open(pipeline.fingerprint())
+    checkpoint.append('related pathway', ['Cdk8'], [['from checkpoint']])
+    result = pipeline.run(pd.DataFrame({'row': ['Cdk8']}))
+    assert other.batches == [['Cdk8']]
+    assert result['related pathway'].tolist() == [['from checkpoint']]
+
+def test_annotation_checkpoint_of_another_configuration_is_discarded(tmp_path):
+    """check that a checkpoint is not resumed with other gene sets or another pathway source"""
+    checkpoint = AnnotationCheckpoint(tmp_path / 'checkpoint.jsonl')
+    old = AnnotationPipeline([EnrichrAnnotator(gene_sets=['KEGG_2019_Mouse'])], checkpoint=checkpoint)
+    checkpoint.open(old.fingerprint())
+    checkpoint.append('complex related pathway', ['Cdk8'], [['old term']])
+    new = AnnotationPipeline([EnrichrAnnotator(gene_sets=['KEGG_2019_Mouse', 'WikiPathways_2019_Mouse'])])
+    assert new.fingerprint() != old.fingerprint()
+    assert checkpoint.open(new.fingerprint()) == {} and checkpoint.fingerprint() == new.fingerprint()
+    html = PathwaySourceAnnotator(ReactomeHTMLSource())
+    content_service = PathwaySourceAnnotator(ReactomeContentServiceSource())
+    assert html.fingerprint() != content_service.fingerprint()
+
+def test_annotation_pipeline_keeps_batches_when_a_backend_raises(tmp_path):
+    """check that an error other than a RequestException only fails its own batch"""
+    class ParsingAnnotator(RecordingAnnotator):
+        def annotate_batch(self, genes):
+            if 'Actb' in genes:
+                raise ValueError('unexpected response')
+            return super().annotate_batch(genes)
+    checkpoint = tmp_path / 'checkpoint.jsonl'
+    pipeline = AnnotationPipeline([ParsingAnnotator('related pathway')], checkpoint=checkpoint)
+    result = pipeline.run(pd.DataFrame({'row': ['Cdk8', 'Actb', 'Gapdh']}))
+    assert list(result['related pathway']) == ['cdk8', None, 'gapdh']
+    assert [(failure.gene, failure.reason) for failure in pipeline.failures] == [('Actb', 'unexpected response')]
+    assert AnnotationCheckpoint(checkpoint).load()['related pathway'] == {'Cdk8': 'cdk8', 'Gapdh': 'gapdh'}
+
+
+################ test for the http client ################
+
+class FlakyHandler(http.server.BaseHTTPRequestHandler):
+    """Answers 503 (with Retry-After) to the first `failures` requests, then 200"""
+    failures = 0
+    calls = 0
+
+    def do_GET(self):
+        FlakyHandler.calls += 1
+        if FlakyHandler.calls <= FlakyHandler.failures:
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+        else:
+            self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def flaky_server():
+    FlakyHandler.calls = 0
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+def test_http_client_retries_transient_errors(flaky_server):
+    FlakyHandler.failures = 2
+    response = HttpClient(max_retries=3, backoff_factor=0.01).get(flaky_server)
+    assert response.status_code == 200
+    assert FlakyHandler.calls == 3
+
+def test_http_client_retries_truncated_bodies(flaky_server):
+    """check that a connection dropped in the middle of a chunked body is retried"""
+    FlakyHandler.failures = 0
+    session = requests.Session()
+    send = session.request
+    attempts = []
+    def truncated_once(method, url, **kwargs):
+        attempts.append(kwargs['timeout'])
+        if len(attempts) == 1:
+            raise requests.exceptions.ChunkedEncodingError('Connection broken: IncompleteRead')
+        return send(method, url, **kwargs)
+    session.request = truncated_once
+    response = HttpClient(max_retries=1, backoff_factor=0.01, timeout=5, session=session).get(flaky_server)
+    assert response.status_code == 200 and attempts == [5, 5]
+
+def test_http_client_gives_up_with_structured_failure(flaky_server):
+    FlakyHandler.failures = 10
+    with pytest.raises(RequestFailed) as failure:
+        HttpClient(max_retries=2, backoff_factor=0.01).get(flaky_server)
+    assert failure.value.status_code == 503
+    assert failure.value.attempts == 3
+
+def test_http_client_backoff_honors_retry_after():
+    client = HttpClient(backoff_factor=1, max_backoff=8)
+    assert client.backoff(0, retry_after=5) == 5
+    assert 0 <= client.backoff(10) <= 8
+    assert parse_retry_after('3') == 3
+
+def test_circuit_breaker_pauses_after_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    breaker.record_failure()
+    assert not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open
+    start = time.monotonic()
+    breaker.wait()
+    assert time.monotonic() - start >= 0.15
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+def test_circuit_breaker_sends_one_trial_when_half_open():
+    """check that after the pause one caller sends a trial while the others wait for its outcome"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    released = []
+    def caller():
+        breaker.wait()
+        released.append(threading.get_ident())
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.4)
+    assert len(released) == 1
+    # a failed trial opens the circuit again, the next trial succeeds and releases everyone
+    breaker.record_failure()
+    assert breaker.is_open
+    time.sleep(0.4)
+    assert len(released) == 2
+    breaker.record_success()
+    for thread in threads:
+        thread.join(timeout=1)
+    assert len(released) == 3
+
+def test_circuit_breaker_trial_ended_by_an_error_is_handed_over():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.1)
+    client = HttpClient(max_retries=0)
+    client._breakers['broken'] = breaker
+    def broken():
+        raise KeyError('not retried')
+    with pytest.raises(KeyError):
+        client.call(broken, name='broken')
+    done = threading.Event()
+    threading.Thread(target=lambda: (breaker.wait(), done.set()), daemon=True).start()
+    assert done.wait(1)
+
+def test_enrich_gene_reports_failures(monkeypatch, tmp_path):
+    """check that a failing Enrichr gives an AnnotationFailure that is neither cached nor checkpointed"""
+    def failing_enrichr(**kwargs):
+        raise RequestException('503 Service Unavailable')
+    monkeypatch.setattr(gseapy_processing.gp, 'enrichr', failing_enrichr)
+    client = HttpClient(max_retries=1, backoff_factor=0.01)
+    with EnrichmentCache(tmp_path / 'cache.sqlite') as cache:
+        result = gseapy_processing.enrich_gene('Cdk8', cache=cache, gene_sets=['KEGG_2019_Mouse'], client=client)
+        assert isinstance(result, AnnotationFailure)
+        assert len(cache) == 0
+        annotator = EnrichrAnnotator(gene_sets=['KEGG_2019_Mouse'], cache=cache)
+        annotator.annotate_batch = lambda genes: gseapy_processing.enrich_genes(genes, gene_sets=['KEGG_2019_Mouse'], client=client)
+        pipeline = AnnotationPipeline([annotator], checkpoint=tmp_path / 'checkpoint.jsonl')
+        df = pipeline.run(pd.DataFrame({'row': ['Cdk8']}))
+    assert df['complex related pathway'].isna().all()
+    assert [failure.gene for failure in pipeline.failures] == ['Cdk8']
+    assert AnnotationCheckpoint(tmp_path / 'checkpoint.jsonl').load() == {}
+
+TOP_LEVEL_IMPORT = """
+import requests
+from data_cleaning import GeneReferenceStore
+from data_cleaning.filter_protein_coding_genes import download_protein_coding_genes
+response = requests.models.Response()
+response.status_code, response._content = 200, b'Trp53\\nActb\\n'
+requests.get = lambda url, **kwargs: print(kwargs['timeout']) or response
+print(sorted(download_protein_coding_genes({output!r})))
+print(GeneReferenceStore({output!r}).client is requests)
+"""
+
+def test_data_cleaning_imports_as_top_level_package(tmp_path):
+    """check that data_cleaning works with the `from data_cleaning import ...` style of group_4.py"""
+    package_dir = path.Path(gseapy_processing.__file__).parents[1]
+    script = TOP_LEVEL_IMPORT.format(output=str(tmp_path / 'genes.tsv'))
+    result = subprocess.run([sys.executable, '-c', script], cwd=package_dir, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['120', "['Actb',", "'Trp53']", 'True']
+
+
+################ test for the streaming data cleaning ################
+
+@pytest.fixture
+def deseq2_csv(tmp_path):
+    """a DESeq2-like csv with NaN values"""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'Unnamed: 0': range(1000),
+        'row': [f'Gene{i}' for i in range(1000)],
+        'baseMean': rng.random(1000) * 1000,
+        'log2FoldChange': rng.standard_normal(1000),
+        'padj': rng.random(1000)})
+    df.loc[rng.choice(1000, 50, replace=False), 'padj'] = np.nan
+    df.loc[rng.choice(1000, 50, replace=False), 'log2FoldChange'] = np.nan
+    csv_file = tmp_path / 'results.csv'
+    df.to_csv(csv_file, index=False)
+    return csv_file
+
+def test_streaming_clean_data_matches_eager(deseq2_csv):
+    """check that cleaning chunk by chunk gives the same frame as the eager cleaning"""
+    eager = DataCleaning(deseq2_csv).clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+    q = DataCleaning(deseq2_csv, chunksize=64)
+    assert q.data is None
+    streamed = q.clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+    pd.testing.assert_frame_equal(streamed, eager)
+
+def test_streaming_methods_chain(deseq2_csv):
+    """check that chained cleaning methods are recorded and applied per chunk by collect"""
+    eager = DataCleaning(deseq2_csv).remove_columns('baseMean').remove_na(['padj']).filter_columns('log2FoldChange', 0, 'larger').data
+    streamed = DataCleaning(deseq2_csv, chunksize=100).remove_columns('baseMean').remove_na(['padj']).filter_columns('log2FoldChange', 0, 'larger').collect()
+    pd.testing.assert_frame_equal(streamed, eager)
+
+def test_streaming_invalid_input(deseq2_csv):
+    with pytest.raises(ValueError):
+        DataCleaning('original_test_data.xlsx', chunksize=10)
+    with pytest.raises(ValueError):
+        DataCleaning(deseq2_csv, chunksize=0)
+    with pytest.raises(ValueError, match='column name provided does not exist'):
+        DataCleaning(deseq2_csv, chunksize=10).filter_columns('pvalue', 0.1, 'smaller')
+
+################ test for the lazy data cleaning ################
+
+def test_lazy_clean_data_matches_eager(deseq2_csv):
+    """check that the fused lazy plan gives the same frame as the eager cleaning"""
+    eager = DataCleaning(deseq2_csv).clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+    q = DataCleaning(deseq2_csv, lazy=True)
+    assert q.data is None and q.lazy
+    lazy = q.clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+    pd.testing.assert_frame_equal(lazy, eager)
+    assert not q.lazy
+
+def test_lazy_plan_reads_only_needed_columns(deseq2_csv):
+    """check that dropped columns are not read unless a step needs them"""
+    q = DataCleaning(deseq2_csv, lazy=True).remove_na(['baseMean']).remove_columns('baseMean').remove_columns('Unnamed: 0')
+    assert q.plan.needed_columns(q._file_columns) == ['row', 'baseMean', 'log2FoldChange', 'padj']
+    assert q.columns == ['row', 'log2FoldChange', 'padj']
+    eager = DataCleaning(deseq2_csv).remove_na(['baseMean']).remove_columns('baseMean').remove_columns('Unnamed: 0').data
+    pd.testing.assert_frame_equal(q.collect(), eager)
+    with pytest.raises(ValueError):
+        q.collect()
+
+def test_lazy_remove_na_all_columns(deseq2_csv):
+    """check that remove_na without columns only checks the columns left after the recorded drops"""
+    eager = DataCleaning(deseq2_csv).remove_columns('padj').remove_na().data
+    lazy = DataCleaning(deseq2_csv, lazy=True).remove_columns('padj').remove_na().collect()
+    pd.testing.assert_frame_equal(lazy, eager)
+    assert len(lazy) == 950
+
+################ test for the columnar input formats ################
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.feather', '.arrow'])
+def test_columnar_input_matches_csv(deseq2_csv, suffix):
+    """check that cleaning a parquet / feather / arrow file gives the same frame as the csv"""
+    columnar_file = deseq2_csv.with_suffix(suffix)
+    df = pd.read_csv(deseq2_csv)
+    df.to_parquet(columnar_file) if suffix == '.parquet' else df.to_feather(columnar_file)
+    expected = DataCleaning(deseq2_csv).clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+    for lazy in (False, True):
+        cleaned = DataCleaning(columnar_file, lazy=lazy, memory_map=True).clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+        pd.testing.assert_frame_equal(cleaned, expected)
+
+def test_read_columnar_projection(deseq2_csv):
+    parquet_file = deseq2_csv.with_suffix('.parquet')
+    pd.read_csv(deseq2_csv).to_parquet(parquet_file)
+    df = read_columnar(parquet_file, columns=['row', 'padj'])
+    assert list(df.columns) == ['row', 'padj'] and len(df) == 1000
+    header = read_columnar(parquet_file, nrows=0)
+    assert len(header) == 0 and list(header.columns) == ['Unnamed: 0', 'row', 'baseMean', 'log2FoldChange', 'padj']
+
+def test_cache_xlsx_as_parquet(tmp_path, monkeypatch):
+    """check that the xlsx file is only parsed again once it is modified"""
+    xlsx_file = tmp_path / 'results.xlsx'
+    pd.DataFrame({'row': ['Gene1', 'Gene2'], 'padj': [0.01, 0.5]}).to_excel(xlsx_file, index=False)
+    parquet_file = cache_xlsx_as_parquet(xlsx_file)
+    assert parquet_file == tmp_path / 'results.parquet'
+    pd.testing.assert_frame_equal(pd.read_parquet(parquet_file), pd.read_excel(xlsx_file))
+    calls = []
+    read_excel = pd.read_excel
+    monkeypatch.setattr(pd, 'read_excel', lambda *args, **kwargs: calls.append(args) or read_excel(*args, **kwargs))
+    assert cache_xlsx_as_parquet(xlsx_file) == parquet_file
+    assert calls == []
+    pd.DataFrame({'row': ['Gene3'], 'padj': [0.2]}).to_excel(xlsx_file, index=False)
+    os.utime(xlsx_file, ns=(0, xlsx_file.stat().st_mtime_ns + 10 ** 9))
+    cache_xlsx_as_parquet(xlsx_file)
+    assert len(calls) == 1
+    assert pd.read_parquet(parquet_file)['row'].tolist() == ['Gene3']
+    with pytest.raises(ValueError):
+        cache_xlsx_as_parquet(tmp_path / 'results.csv')
+
+def test_cache_xlsx_with_dates_in_the_gene_column(tmp_path):
+    """check that gene names Excel stored as dates (e.g. March1) do not break the cache"""
+    import datetime
+    xlsx_file = tmp_path / 'results.xlsx'
+    genes = ['Gene1', datetime.datetime(2023, 3, 1), np.nan]
+    pd.DataFrame({'row': genes, 'padj': [0.01, 0.5, 0.2]}).to_excel(xlsx_file, index=False)
+    cached = pd.read_parquet(cache_xlsx_as_parquet(xlsx_file))
+    assert cached['row'].tolist()[:2] == ['Gene1', '2023-03-01 00:00:00'] and pd.isna(cached['row'].iloc[2])
+    assert cached['padj'].tolist() == [0.01, 0.5, 0.2]
+
+################ test for the compact dtypes ################
+
+def test_compact_dtypes():
+    df = pd.DataFrame({'row': pd.Series(['Gene1', 'Gene2', None], dtype=object),
+                       'baseMean': [10.5, 2000.25, np.nan], 'lfcSE': [0.1, 0.2, 0.3],
+                       'stat': [1e300, 0.0, 1.0], 'pvalue': [1e-300, 0.5, 1.0], 'padj': [1e-300, 0.5, 1.0]})
+    compact = compact_dtypes(df)
+    assert compact['baseMean'].dtype == np.float32 and compact['lfcSE'].dtype == np.float32
+    assert compact['stat'].dtype == np.float64  # 1e300 does not fit in float32
+    assert compact['pvalue'].dtype == np.float64 and compact['padj'].dtype == np.float64
+    assert compact['row'].dtype != object and compact['row'].iloc[:2].tolist() == ['Gene1', 'Gene2']
+    assert compact['row'].isna().iloc[2]
+    np.testing.assert_allclose(compact['lfcSE'], df['lfcSE'], rtol=1e-6)
+    assert df['baseMean'].dtype == np.float64  # the input is not modified
+
+def test_compact_data_cleaning(deseq2_csv):
+    """check that compact mode cleans to the same rows with less memory, in every mode"""
+    expected = DataCleaning(deseq2_csv).clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+    for kwargs in ({}, {'lazy': True}, {'chunksize': 100}):
+        q = DataCleaning(deseq2_csv, compact=True, **kwargs)
+        cleaned = q.clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+        assert cleaned['baseMean'].dtype == np.float32 and cleaned['padj'].dtype == np.float64
+        pd.testing.assert_frame_equal(cleaned, expected, check_dtype=False, rtol=1e-6)
+        assert q.memory_report['after'] < q.memory_report['before']
+
+################ test for the batch data cleaning ################
+
+@pytest.fixture
+def contrast_files(deseq2_csv):
+    """three result files of different formats in one directory"""
+    df = pd.read_csv(deseq2_csv)
+    directory = deseq2_csv.parent / 'contrasts'
+    directory.mkdir()
+    df.to_csv(directory / 'wt_vs_ko.csv', index=False)
+    df.iloc[:400].to_parquet(directory / 'wt_vs_het.parquet')
+    df.iloc[400:].to_csv(directory / 'het_vs_ko.csv', index=False)
+    (directory / 'notes.txt').write_text('not a result file')
+    return directory
+
+def test_clean_files_returns_frames(contrast_files):
+    cleaned, timings = clean_files(contrast_files, max_workers=2)
+    assert list(cleaned) == ['het_vs_ko', 'wt_vs_het', 'wt_vs_ko'] and list(timings) == list(cleaned)
+    assert all(seconds > 0 for seconds in timings.values())
+    for name in ('wt_vs_ko.csv', 'het_vs_ko.csv'):
+        expected = DataCleaning(contrast_files / name).clean_data('padj', 0.1, 'smaller', 'Unnamed: 0')
+        pd.testing.assert_frame_equal(cleaned[name[:-4]], expected)
+
+def test_clean_files_glob_and_output_dir(contrast_files, tmp_path):
+    cleaned, timings = clean_files(str(contrast_files / '*.csv'), 'log2FoldChange', 0, 'larger',
+                                   output_dir=tmp_path / 'cleaned', output_format='parquet', max_workers=2, lazy=True)
+    assert cleaned == {'het_vs_ko': tmp_path / 'cleaned' / 'het_vs_ko.parquet',
+                       'wt_vs_ko': tmp_path / 'cleaned' / 'wt_vs_ko.parquet'}
+    expected = DataCleaning(contrast_files / 'wt_vs_ko.csv').clean_data('log2FoldChange', 0, 'larger', 'Unnamed: 0')
+    pd.testing.assert_frame_equal(pd.read_parquet(cleaned['wt_vs_ko']), expected)
+    with pytest.raises(ValueError):
+        clean_files(str(contrast_files / '*.xlsx'))
+    with pytest.raises(ValueError):
+        clean_files(contrast_files, output_format='xlsx')
+
+def test_find_result_files_picks_xlsx_or_its_cache(deseq2_csv, tmp_path):
+    """check that an xlsx file and its parquet cache count as one result file"""
+    directory = tmp_path / 'xlsx_contrasts'
+    directory.mkdir()
+    pd.read_csv(deseq2_csv).iloc[:50].to_excel(directory / 'wt_vs_ko.xlsx', index=False)
+    cache = cache_xlsx_as_parquet(directory / 'wt_vs_ko.xlsx')
+    assert find_result_files(directory) == [cache]
+    assert list(clean_files(directory, max_workers=1)[0]) == ['wt_vs_ko']
+    # a modified xlsx file is used instead of its stale cache
+    os.utime(directory / 'wt_vs_ko.xlsx', ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert find_result_files(directory) == [directory / 'wt_vs_ko.xlsx']
+    # a parquet file that is not a cache is still a second result file
+    pd.read_csv(deseq2_csv).to_parquet(cache)
+    with pytest.raises(ValueError, match='different names'):
+        find_result_files(directory)
+
+################ test for the filter expressions ################
+
+def test_filter_query_matches_chained_filters(deseq2_csv):
+    """check that one expression gives the same rows as the equivalent chain of filters, in every mode"""
+    expected = DataCleaning(deseq2_csv).filter_columns('padj', 0.5, 'smaller').filter_columns('log2FoldChange', 0.5, 'larger') \
+        .filter_columns('baseMean', 10, 'larger').data
+    for kwargs in ({}, {'lazy': True}, {'chunksize': 64}):
+        q = DataCleaning(deseq2_csv, **kwargs).filter_query('padj < 0.5 & log2FoldChange > 0.5 & baseMean > 10')
+        pd.testing.assert_frame_equal(q.collect() if q.lazy else q.data, expected)
+
+def test_filter_query_expressions(deseq2_csv):
+    df = pd.read_csv(deseq2_csv)
+    q = DataCleaning(deseq2_csv).filter_query('0.01 <= padj <= @alpha & abs(log2FoldChange) >= 1', {'alpha': 0.05})
+    pd.testing.assert_frame_equal(q.data, df[df['padj'].between(0.01, 0.05) & (df['log2FoldChange'].abs() >= 1)])
+    q = DataCleaning(deseq2_csv, lazy=True).filter_query("row in ['Gene1', 'Gene7', 'Gene999'] and `Unnamed: 0` > 1")
+    assert q.collect()['row'].tolist() == ['Gene7', 'Gene999']
+
+def test_filter_query_projection_and_errors(deseq2_csv):
+    q = DataCleaning(deseq2_csv, lazy=True).filter_query('baseMean > 10').remove_columns('baseMean')
+    assert q.plan.needed_columns(q._file_columns) == ['Unnamed: 0', 'row', 'baseMean', 'log2FoldChange', 'padj']
+    assert 'baseMean' not in q.collect().columns
+    with pytest.raises(ValueError, match='column name provided does not exist'):
+        DataCleaning(deseq2_csv, lazy=True).remove_columns('padj').filter_query('padj < 0.05')
+    with pytest.raises(ValueError, match='column name provided does not exist'):
+        DataCleaning(deseq2_csv).filter_query('pvalue < 0.05')
+
+################ test for the gene reference store ################
+
+FIXTURES = path.Path(__file__).parent / 'fixtures'
+
+class OfflineClient:
+    """a client that serves one BioMart answer and the current release, and counts the requests"""
+    def __init__(self, text='', current_release=113):
+        self.text = text
+        self.current_release = current_release
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append(url)
+        response = requests.models.Response()
+        response.status_code = 200
+        if url.endswith('/info/data/'):
+            response._content = json.dumps({'releases': [self.current_release]}).encode()
+        else:
+            response._content = self.text.encode()
+        return response
+
+def test_gene_reference_store_from_fixture(tmp_path):
+    client = OfflineClient()
+    store = GeneReferenceStore(tmp_path / 'reference', client=client)
+    genes = store.import_tsv(FIXTURES / 'biomart_protein_coding_mouse.tsv', 'mouse', 112)
+    assert len(genes) == 15 and 'Trp53' in genes and 'Gm12345' not in genes
+    assert store.cache_path('mouse', 112).exists()
+    # a new store loads the cached release without any request
+    other = GeneReferenceStore(tmp_path / 'reference', client=client)
+    loaded = other.protein_coding_genes('mouse')
+    assert loaded.release == 112 and list(loaded.index) == list(genes.index)
+    assert other.protein_coding_genes('mouse', 112) is loaded
+    assert client.requests == []
+    df = pd.DataFrame({'row': ['Trp53', 'Gm12345', np.nan, 'Actb'], 'padj': [0.01, 0.02, 0.03, 0.04]})
+    np.testing.assert_array_equal(loaded.contains(df['row']), [True, False, False, True])
+    pd.testing.assert_frame_equal(filter_protein_coding_genes(df, loaded), filter_protein_coding_genes(df, {'Trp53', 'Actb'}))
+
+def test_gene_reference_store_fetch(tmp_path):
+    client = OfflineClient((FIXTURES / 'biomart_protein_coding_mouse.tsv').read_text())
+    store = GeneReferenceStore(tmp_path, client=client)
+    genes = store.protein_coding_genes('mouse')
+    assert len(client.requests) == 2 and 'Gnai3' in genes and store.cached_releases('mouse') == [113]
+    store.protein_coding_genes('mouse', 113)
+    assert len(client.requests) == 2
+    with pytest.raises(ValueError):
+        store.fetch('yeti', 113)
+
+def test_gene_reference_store_refuses_other_releases(tmp_path):
+    """check that the current BioMart answer is never cached under an older release"""
+    text = (FIXTURES / 'biomart_protein_coding_mouse.tsv').read_text()
+    store = GeneReferenceStore(tmp_path, client=OfflineClient(text))
+    with pytest.raises(ValueError, match='serves Ensembl release 113, not 110'):
+        store.protein_coding_genes('mouse', 110)
+    assert store.cached_releases('mouse') == []
+    archive = GeneReferenceStore(tmp_path, client=OfflineClient(text), mart_url='https://archive.example/biomart/martservice',
+                                 mart_release=110)
+    assert archive.protein_coding_genes('mouse', 110).release == 110
+
+################ test for the gene alias index ################
+
+@pytest.fixture
+def alias_index():
+    return GeneAliasIndex.from_file(FIXTURES / 'mouse_gene_aliases.tsv')
+
+def test_normalize_genes(alias_index):
+    genes = pd.Series(['TRP53', 'p53', 'ENSMUSG00000029580.7', 'gapd', 'Arf', 'myc', 'Myc2', 'Unknown1', np.nan],
+                      index=range(10, 19), name='row')
+    normalized = alias_index.normalize_genes(genes)
+    # myc is a synonym of Mycn but the official symbol of Myc, Myc2 is a synonym of both
+    assert normalized.tolist()[:8] == ['Trp53', 'Trp53', 'Actb', 'Gapdh', 'Cdkn2a', 'Myc', 'Myc2', 'Unknown1']
+    assert pd.isna(normalized.iloc[8])
+    assert normalized.name == 'row' and list(normalized.index) == list(range(10, 19))
+
+def test_normalize_categorical_genes(alias_index):
+    """check that the aliases of a compact (categorical) gene column are resolved, not turned into NaN"""
+    genes = pd.Series(['p53', 'TRP53', 'gapd', 'Unknown1', np.nan, 'p53'], name='row', dtype='category')
+    normalized = alias_index.normalize_genes(genes)
+    assert isinstance(normalized.dtype, pd.CategoricalDtype)
+    assert normalized.tolist()[:4] == ['Trp53', 'Trp53', 'Gapdh', 'Unknown1'] and normalized.iloc[5] == 'Trp53'
+    assert pd.isna(normalized.iloc[4])
+    assert sorted(normalized.cat.categories) == ['Gapdh', 'Trp53', 'Unknown1']
+    df = pd.DataFrame({'row': genes.iloc[:4], 'padj': [0.01, 0.02, 0.03, 0.04]})
+    assert filter_protein_coding_genes(df, {'Trp53', 'Gapdh'}, alias_index=alias_index)['row'].tolist() == ['p53', 'TRP53', 'gapd']
+
+def test_alias_index_ahead_of_filtering_and_annotation(alias_index):
+    df = pd.DataFrame({'row': ['p53', 'Trp53', 'ACTB', 'Gm1'], 'padj': [0.01, 0.02, 0.03, 0.04]})
+    assert filter_protein_coding_genes(df, {'Trp53', 'Actb'}, alias_index=alias_index)['row'].tolist() == ['p53', 'Trp53', 'ACTB']
+    seen = []
+    annotator = FunctionAnnotator('pathways', lambda gene: seen.append(gene) or [f'{gene} pathway'])
+    AnnotationPipeline([annotator], max_workers=1, alias_index=alias_index).run(df)
+    assert sorted(seen) == ['Actb', 'Gm1', 'Trp53']  # p53 and Trp53 share one lookup
+    assert df['pathways'].tolist() == [['Trp53 pathway'], ['Trp53 pathway'], ['Actb pathway'], ['Gm1 pathway']]
+    assert df['row'].tolist() == ['p53', 'Trp53', 'ACTB', 'Gm1']
+
+################ test for the fused volcano preprocessing ################
+
+@pytest.fixture
+def volcano_df():
+    rng = np.random.default_rng(3)
+    padj = np.round(rng.random(500) * 0.98, 2) + 0.01  # many ties
+    return pd.DataFrame({'row': [f'Gene{i}' for i in range(500)], 'log2FoldChange': rng.standard_normal(500), 'padj': padj})
+
+def test_process_data_for_volcanoplot_matches_sort_based(volcano_df):
+    thresholds, labels = [0.01, 0.05, 0.1], ['very significant', 'significant', 'trend', 'non-significant']
+    original = volcano_df.copy()
+    processed, top = process_data_for_volcanoplot(volcano_df, 'padj', '-log10(p-value)', 'padj', 'significance',
+                                                  thresholds, labels, 10, False)
+    pd.testing.assert_frame_equal(volcano_df, original)  # the input is not modified by default
+    expected_labels = pd.cut(original['padj'], bins=[-np.inf] + thresholds + [np.inf], labels=labels, right=True)
+    pd.testing.assert_series_equal(processed['significance'],
+                                   pd.Series(pd.Categorical(expected_labels, categories=labels, ordered=True), name='significance'))
+    np.testing.assert_array_equal(processed['-log10(p-value)'], -np.log10(original['padj']))
+    ordered = processed.sort_values('padj', kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(top, ordered[ordered['padj'] <= ordered.loc[9, 'padj']])
+    assert len(top) > 10  # the values tied with the 10th are kept
+
+def test_process_data_for_volcanoplot_in_place(volcano_df):
+    processed, top = process_data_for_volcanoplot(volcano_df, 'padj', '-log10(p-value)', '-log10(p-value)', 'significance',
+                                                  [1, 2], ['low', 'medium', 'high'], 5, True, copy=False)
+    assert processed is volcano_df and 'significance' in volcano_df.columns
+    assert top['-log10(p-value)'].tolist() == sorted(top['-log10(p-value)'], reverse=True)
+    assert (top['-log10(p-value)'] >= volcano_df['-log10(p-value)'].nlargest(5).iloc[-1]).all()
+
+def test_identify_top_n_values_with_nan_and_ties():
+    df = pd.DataFrame({'value': [3.0, np.nan, 1.0, 3.0, 2.0, 3.0], 'name': list('abcdef')})
+    top, threshold = identify_top_n_values(df, 'value', 2)
+    assert threshold == 3.0 and top['name'].tolist() == ['a', 'd', 'f']
+    top, threshold = identify_top_n_values(df, 'value', 2, False)
+    assert threshold == 2.0 and top['name'].tolist() == ['c', 'e']
+    top, threshold = identify_top_n_values(df, 'value', 6)  # only 5 values are not NaN
+    assert np.isnan(threshold) and top.empty
+
+################ test for the safe -log10 ################
+
+def test_minus_log10_clamps_underflow():
+    p_vals = pd.Series([0.0, 1e-300, 5e-324, 0.05, 1.0])
+    values, n_clamped = minus_log10(p_vals)
+    assert n_clamped == 1 and np.isfinite(values).all()
+    np.testing.assert_allclose(values, [-np.log10(5e-324), 300, -np.log10(5e-324), -np.log10(0.05), 0])
+    values, n_clamped = minus_log10(p_vals, floor=1e-100, dtype=np.float32)
+    assert values.dtype == np.float32 and n_clamped == 3
+    np.testing.assert_allclose(values, [100, 100, 100, -np.log10(0.05), 0], rtol=1e-6)
+    with pytest.raises(ValueError):
+        minus_log10(p_vals, floor=0)
+
+def test_minus_log10_keeps_validation_messages():
+    with pytest.raises(ValueError, match="The p-values column must contain float values."):
+        minus_log10(pd.Series([0, 1]))
+    with pytest.raises(ValueError, match=r"The p-values column contains values outside the range \[0, 1\]."):
+        minus_log10(pd.Series([0.5, 1.5]))
+    with pytest.raises(ValueError, match=r"The p-values column contains values outside the range \[0, 1\]."):
+        validate_p_vals(pd.Series([0.5, np.nan]))
+    assert validate_p_vals(np.array([0.0, 1.0]))
+
+def test_volcano_preprocessing_reports_clamped_values(volcano_df):
+    volcano_df.loc[[3, 7], 'padj'] = 0.0
+    processed, top = process_data_for_volcanoplot(volcano_df, 'padj', '-log10(p-value)', '-log10(p-value)', 'significance',
+                                                  [1, 2], ['low', 'medium', 'high'], 2, True, dtype=np.float32)
+    assert processed.attrs['clamped_p_values'] == 2
+    assert processed['-log10(p-value)'].dtype == np.float32 and np.isfinite(processed['-log10(p-value)']).all()
+    assert sorted(top['row']) == ['Gene3', 'Gene7']
+    df = minus_log10_col(volcano_df, 'padj', copy=True)
+    assert df.attrs['clamped_p_values'] == 2 and '-log10(p-value)' not in volcano_df.columns
+
+################ test for the density volcano rendering ################
+
+def test_plot_density_draws_only_significant_points(volcano_df):
+    matplotlib.use('Agg')
+    volcano_df['-log10(p-value)'] = -np.log10(volcano_df['padj'])
+    significant = volcano_df['padj'] < 0.05
+    q = ScatterPlotToolkit()
+    q.plot_density(volcano_df, 'log2FoldChange', '-log10(p-value)', significant, highlight=volcano_df.head(3))
+    assert len(q.axs.images) == 1  # the non-significant genes are one raster image
+    assert q.axs.images[0].get_array().sum() == (~significant).sum()
+    points = sum(len(collection.get_offsets()) for collection in q.axs.collections)
+    assert points == significant.sum() + 3
+    x_low, x_high = q.axs.get_xlim()
+    assert x_low < volcano_df['log2FoldChange'].min() and x_high > volcano_df['log2FoldChange'].max()
+    plt.close(q.fig)
+
+def test_plot_density_without_background(volcano_df):
+    matplotlib.use('Agg')
+    volcano_df['significant'] = True
+    volcano_df['label'] = pd.Categorical(['a'] * 500, categories=['a', 'unused'])
+    q = ScatterPlotToolkit()
+    q.plot_density(volcano_df, 'log2FoldChange', 'padj', 'significant', color_by='label')
+    assert len(q.axs.images) == 0
+    assert [text.get_text() for text in q.axs.get_legend().get_texts()] == ['a']
+    plt.close(q.fig)
+
+################ test for the gene labelling ################
+
+def _text_boxes(q, texts):
+    renderer = q.fig.canvas.get_renderer()
+    return [text.get_window_extent(renderer) for text in texts]
+
+def test_label_genes_avoids_overlap(volcano_df):
+    matplotlib.use('Agg')
+    volcano_df['-log10(p-value)'] = -np.log10(volcano_df['padj'])
+    q = ScatterPlotToolkit()
+    q.plot(volcano_df, 'log2FoldChange', '-log10(p-value)')
+    texts = q.label_genes(volcano_df, 'log2FoldChange', '-log10(p-value)', 'row', max_labels=60, fontsize=7,
+                          crowded='skip')
+    assert 0 < len(texts) <= 60
+    boxes = _text_boxes(q, texts)
+    overlapping = [(a, b) for n, a in enumerate(boxes) for b in boxes[n + 1:] if a.overlaps(b)]
+    assert not overlapping
+    plt.close(q.fig)
+
+def test_label_genes_draws_leader_lines_for_crowded_genes():
+    matplotlib.use('Agg')
+    crowded = pd.DataFrame({'x': [0.0] * 6 + [5.0], 'y': [1.0] * 6 + [5.0], 'row': [f'Gene{i}' for i in range(7)]})
+    q = ScatterPlotToolkit()
+    q.plot(crowded, 'x', 'y')
+    texts = q.label_genes(crowded, 'x', 'y', 'row')
+    leaders = [c for c in q.axs.collections if isinstance(c, matplotlib.collections.LineCollection)]
+    assert len(texts) == 7 and len(leaders) == 1
+    assert all((segment[0] == [0.0, 1.0]).all() for segment in leaders[0].get_segments())
+    plt.close(q.fig)
+
+def test_label_genes_keeps_genes_without_a_free_spot():
+    """check that the top genes are still labelled when the labels nearby are all taken"""
+    matplotlib.use('Agg')
+    crowded = pd.DataFrame({'x': [0.0] * 20, 'y': [1.0] * 20, 'row': [f'Gene{i}' for i in range(20)]})
+    q = ScatterPlotToolkit()
+    q.plot(crowded, 'x', 'y')
+    texts = q.label_genes(crowded, 'x', 'y', 'row', max_distance=1)
+    assert [text.get_text() for text in texts] == crowded['row'].tolist()
+    leaders = [c for c in q.axs.collections if isinstance(c, matplotlib.collections.LineCollection)]
+    # only the labels that found no free spot are moved away from their gene, with a leader line
+    placed = q.label_genes(crowded, 'x', 'y', 'row', max_distance=1, crowded='skip')
+    assert 0 < len(placed) < 20 and len(leaders[0].get_segments()) == 20 - len(placed)
+    with pytest.raises(ValueError):
+        q.label_genes(crowded, 'x', 'y', 'row', crowded='hide')
+    plt.close(q.fig)
+
+def test_label_genes_priority_and_cap(volcano_df):
+    matplotlib.use('Agg')
+    q = ScatterPlotToolkit()
+    q.plot(volcano_df, 'log2FoldChange', 'padj')
+    texts = q.label_genes(volcano_df, 'log2FoldChange', 'padj', 'row', max_labels=5, priority_col='log2FoldChange',
+                          avoid_overlap=False)
+    expected = volcano_df.sort_values('log2FoldChange', ascending=False, kind='stable')['row'].head(5)
+    assert [text.get_text() for text in texts] == expected.tolist()
+    assert len(q.label_genes(volcano_df, 'log2FoldChange', 'padj', 'row', avoid_overlap=False)) == 500
+    plt.close(q.fig)
+
+################ test for the batch figure rendering ################
+
+@pytest.fixture
+def rendered_contrast_files(tmp_path, volcano_df):
+    for name in ('treated_vs_control', 'knockout_vs_control'):
+        volcano_df.to_csv(tmp_path / f'{name}.csv')
+    return tmp_path
+
+def test_output_paths_are_templated():
+    paths = output_paths(['a', 'b'], 'figures/{stem}/{kind}.svg')
+    assert paths['b']['volcano'] == path.Path('figures/b/volcano.svg')
+    with pytest.raises(ValueError, match='its own path'):
+        output_paths(['a', 'b'], 'figures/{kind}.png')
+    with pytest.raises(ValueError, match='unknown figure kinds'):
+        output_paths(['a'], '{stem}_{kind}.png', kinds=('heatmap',))
+
+def test_render_result_file_leaves_no_pyplot_figures(rendered_contrast_files):
+    figures_before = plt.get_fignums()
+    outputs = output_paths(['treated_vs_control'], str(rendered_contrast_files / 'out' / '{stem}_{kind}.png'))
+    stem, written, timings = render_result_file(rendered_contrast_files / 'treated_vs_control.csv', outputs['treated_vs_control'])
+    assert stem == 'treated_vs_control' and set(timings) == {'volcano', 'bar'}
+    assert all(output.stat().st_size > 0 for output in written.values())
+    assert plt.get_fignums() == figures_before
+
+def test_render_result_files_in_parallel(rendered_contrast_files):
+    written, timings = render_result_files(rendered_contrast_files, str(rendered_contrast_files / 'figures' / '{stem}' / '{kind}.svg'),
+                                           kinds=('volcano',), max_workers=2)
+    assert list(written) == ['knockout_vs_control', 'treated_vs_control']
+    assert written['knockout_vs_control']['volcano'].read_text().startswith('<?xml')
+    assert all(seconds['volcano'] > 0 for seconds in timings.values())
+
+TOP_LEVEL_RENDER = """
+from visualizations import render_result_files
+written, _ = render_result_files({source!r}, {template!r}, kinds=('volcano',), max_workers=1)
+print(sorted(written))
+"""
+
+def test_rendering_imports_as_top_level_package(rendered_contrast_files):
+    """check that render_result_files works with the `from visualizations import ...` style of group_4.py"""
+    package_dir = path.Path(gseapy_processing.__file__).parents[1]
+    script = TOP_LEVEL_RENDER.format(source=str(rendered_contrast_files),
+                                     template=str(rendered_contrast_files / '{stem}_{kind}.png'))
+    result = subprocess.run([sys.executable, '-c', script], cwd=package_dir, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["['knockout_vs_control',", "'treated_vs_control']"]
+    assert (rendered_contrast_files / 'treated_vs_control_volcano.png').exists()
+
+################ test for the top genes bar plot ################
+
+@pytest.fixture
+def bar_df():
+    return pd.DataFrame({'row': [f'Gene{i}' for i in range(8)],
+                         'log2FoldChange': [3.0, -1.0, 0.5, -4.0, 2.0, np.nan, -0.2, 1.0],
+                         'padj': [0.01, 0.02, 0.5, 0.01, 0.03, 0.01, 0.04, 0.2]})
+
+def test_select_genes_applies_padj_and_top_k(bar_df):
+    selected, rest = RNABarPlotter(bar_df).select_genes(padj_value=0.05, top_k=1)
+    assert selected['row'].tolist() == ['Gene3', 'Gene0']
+    assert sorted(rest) == [-1.0, -0.2, 2.0]
+    selected, rest = RNABarPlotter(bar_df).select_genes(padj_value=0.05)
+    assert len(selected) == 6 and len(rest) == 0
+    with pytest.raises(ValueError, match='top_k must be a positive integer'):
+        RNABarPlotter(bar_df).select_genes(top_k=0)
+    with pytest.raises(KeyError):
+        RNABarPlotter(bar_df.drop(columns='padj')).select_genes(padj_value=0.05)
+
+def test_bar_plot_top_k_with_summary_bars(bar_df):
+    fig = Figure()
+    RNABarPlotter(bar_df).plot(padj_value=0.05, top_k=1, n_summary_bins=2, figure=fig, filename=None)
+    ax = fig.axes[0]
+    labels = [label.get_text() for label in ax.get_yticklabels()]
+    assert labels[0] == 'Gene3' and labels[-1] == 'Gene0'
+    assert labels[1:-1] == ['2 genes, -1.00 to 0.50', '1 genes, 0.50 to 2.00']
+    assert [patch.get_width() for patch in ax.patches][:3] == [-4.0, -0.6, 2.0]
+    assert tuple(fig.get_size_inches()) == (12, 4)
+
+def test_bar_plot_size_depends_on_top_k():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'row': [f'Gene{i}' for i in range(20000)], 'log2FoldChange': rng.standard_normal(20000),
+                       'padj': rng.random(20000)})
+    fig = Figure()
+    RNABarPlotter(df).plot(padj_value=0.5, top_k=10, n_summary_bins=5, figure=fig, filename=None)
+    assert len(fig.axes[0].patches) == 25
+
+################ test for the interactive volcano export ################
+
+def test_volcano_payload_round_trip(volcano_df):
+    import base64
+    volcano_df['-log10(p-value)'] = -np.log10(volcano_df['padj'])
+    volcano_df.loc[4, 'log2FoldChange'] = np.nan
+    volcano_df['significance'] = pd.Categorical(np.where(volcano_df['padj'] < 0.05, 'significant', 'other'))
+    volcano_df['related pathway'] = [['R-MMU-1', 'R-MMU-2'] if i % 2 else None for i in range(len(volcano_df))]
+    payload = volcano_payload(volcano_df, pathway_col='related pathway')
+    kept = volcano_df.drop(index=4)
+    assert payload['n'] == len(kept) and payload['genes'].split('\n') == kept['row'].tolist()
+    x = np.frombuffer(base64.b64decode(payload['x']), dtype='<f4')
+    assert np.allclose(x, kept['log2FoldChange'])
+    codes = np.frombuffer(base64.b64decode(payload['pathways']['codes']), dtype='<i1')
+    assert payload['pathways']['type'] == 'Int8Array'
+    assert [payload['pathways']['values'][code] for code in codes[:2]] == ['', 'R-MMU-1; R-MMU-2']
+    with pytest.raises(KeyError):
+        volcano_payload(volcano_df, pathway_col='missing')
+
+def test_export_volcano_html_is_offline_and_compact(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 100_000
+    df = pd.DataFrame({'row': [f'Gene{i}' for i in range(n)], 'log2FoldChange': rng.standard_normal(n),
+                       'padj': rng.random(n) * 0.99 + 0.01})
+    df.loc[0, 'row'] = '</script><script>alert(1)'
+    df, _ = process_data_for_volcanoplot(df, 'padj', '-log10(p-value)', 'padj', 'significance', [0.05],
+                                         ['significant', 'other'], 10, False)
+    html = export_volcano_html(df, tmp_path / 'volcano.html', title='a <b> title').read_text()
+    assert html.count('</script>') == 2 and 'a &lt;b&gt; title' in html
+    assert 'http://' not in html and 'https://' not in html and 'src=' not in html
+    assert len(html.encode()) < 35 * n
+
+################ test for the pipeline runner ################
+
+@pytest.fixture
+def counted_stages(monkeypatch):
+    calls = []
+    def upper(inputs, outputs, suffix=''):
+        calls.append('upper')
+        outputs['text'].write_text(inputs['text'].read_text().upper() + suffix)
+    def count(inputs, outputs):
+        calls.append('count')
+        outputs['count'].write_text(str(len(inputs['text'].read_text())))
+    monkeypatch.setitem(stage_kinds, 'upper', upper)
+    monkeypatch.setitem(stage_kinds, 'count', count)
+    return calls
+
+def _write_config(directory, suffix=''):
+    config = directory / 'pipeline.toml'
+    config.write_text(f'''
+[stages.count]
+inputs = {{ text = "upper.txt" }}
+outputs = {{ count = "count.txt" }}
+
+[stages.upper]
+inputs = {{ text = "input.txt" }}
+outputs = {{ text = "upper.txt" }}
+params = {{ suffix = "{suffix}" }}
+''')
+    return config
+
+def test_pipeline_skips_unchanged_stages(tmp_path, counted_stages):
+    (tmp_path / 'input.txt').write_text('abc')
+    config = _write_config(tmp_path)
+    assert [stage.name for stage in Pipeline.from_config(config).stages] == ['upper', 'count']
+    Pipeline.from_config(config).run(log=lambda line: None)
+    assert counted_stages == ['upper', 'count'] and (tmp_path / 'count.txt').read_text() == '3'
+    timings = Pipeline.from_config(config).run(log=lambda line: None)
+    assert counted_stages == ['upper', 'count'] and timings == {'upper': None, 'count': None}
+    # a param change reruns its stage, the downstream stage only if the output content changed
+    _write_config(tmp_path, suffix='')
+    (tmp_path / 'input.txt').write_text('ABC')
+    Pipeline.from_config(config).run(log=lambda line: None)
+    assert counted_stages == ['upper', 'count', 'upper']
+    _write_config(tmp_path, suffix='!')
+    assert Pipeline.from_config(config).status() == {'upper': 'run', 'count': 'run'}
+    Pipeline.from_config(config).run(['count'], log=lambda line: None)
+    assert counted_stages[3:] == ['upper', 'count'] and (tmp_path / 'count.txt').read_text() == '4'
+    # an output changed by hand is rebuilt
+    (tmp_path / 'count.txt').write_text('0')
+    assert Pipeline.from_config(config).status(['count']) == {'upper': 'up to date', 'count': 'run'}
+
+def test_pipeline_key_does_not_depend_on_working_directory(tmp_path, counted_stages, monkeypatch):
+    """check that the stages stay up to date when the config path is given from another directory"""
+    (tmp_path / 'input.txt').write_text('abc')
+    config = _write_config(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    Pipeline.from_config('pipeline.toml').run(log=lambda line: None)
+    monkeypatch.chdir(tmp_path.parent)
+    assert Pipeline.from_config(path.Path(tmp_path.name) / 'pipeline.toml').status() == {'upper': 'up to date',
+                                                                                        'count': 'up to date'}
+    Pipeline.from_config(config.resolve()).run(log=lambda line: None)
+    assert counted_stages == ['upper', 'count']
+
+def test_load_config_falls_back_to_tomli(tmp_path, monkeypatch):
+    """check that TOML configs are read with tomli before Python 3.11"""
+    import tomllib
+    config = _write_config(tmp_path)
+    monkeypatch.setitem(sys.modules, 'tomllib', None)
+    monkeypatch.setitem(sys.modules, 'tomli', tomllib)
+    assert list(load_config(config)['stages']) == ['count', 'upper']
+    monkeypatch.setitem(sys.modules, 'tomli', None)
+    with pytest.raises(ImportError, match='requires tomli'):
+        load_config(config)
+
+def test_pipeline_validation(tmp_path, counted_stages):
+    with pytest.raises(ValueError, match='cycle'):
+        Pipeline([Stage('a', 'upper', {'text': tmp_path / 'b'}, {'text': tmp_path / 'a'}),
+                  Stage('b', 'upper', {'text': tmp_path / 'a'}, {'text': tmp_path / 'b'})])
+    with pytest.raises(ValueError, match='both write'):
+        Pipeline([Stage('a', 'upper', {}, {'text': tmp_path / 'a'}), Stage('b', 'count', {}, {'count': tmp_path / 'a'})])
+    with pytest.raises(ValueError, match='Unknown kind'):
+        Stage('a', 'missing', {}, {'text': tmp_path / 'a'})
+    with pytest.raises(FileNotFoundError):
+        Pipeline([Stage('a', 'upper', {'text': tmp_path / 'none'}, {'text': tmp_path / 'a'})],
+                 tmp_path / '.pipeline').run(log=lambda line: None)
+
+def test_pipeline_cli_runs_yaml_config(tmp_path, capsys, volcano_df):
+    volcano_df.to_csv(tmp_path / 'results.csv')
+    (tmp_path / 'pipeline.yaml').write_text('''
+stages:
+  clean:
+    inputs: {data: results.csv}
+    outputs: {data: build/cleaned.pkl}
+    params: {threshold: 0.5}
+  volcano:
+    inputs: {data: build/cleaned.pkl}
+    outputs: {data: build/volcano.pkl, top_genes: build/top.pkl}
+    params: {thresholds: [0.05], labels: [significant, non-significant], n_top: 3}
+  export:
+    inputs: {data: build/volcano.pkl}
+    outputs: {data: output_data.csv}
+''')
+    assert pipeline_main([str(tmp_path / 'pipeline.yaml')]) == 0
+    exported = pd.read_csv(tmp_path / 'output_data.csv', index_col=0)
+    assert len(exported) == (volcano_df['padj'] < 0.5).sum() and 'significance' in exported.columns
+    capsys.readouterr()
+    assert pipeline_main([str(tmp_path / 'pipeline.yaml'), '--status']) == 0
+    assert capsys.readouterr().out.splitlines() == ['clean: up to date', 'volcano: up to date', 'export: up to date']
+    assert pipeline_main([str(tmp_path / 'pipeline.yaml'), 'missing']) == 1